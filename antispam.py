@@ -0,0 +1,236 @@
+"""
+МОДУЛЬ ДЛЯ ПРОВЕРКИ СООБЩЕНИЙ НА СПАМ
+Ключевые слова и черный список имен собираются в одно скомпилированное регулярное выражение
+(в виде префиксного дерева), поэтому проверка сообщения - один проход по тексту,
+даже если правил тысячи.
+
+Дополнительные правила можно положить в файл (SPAM_KEYWORDS_FILE):
+- одна фраза на строку, регистр не важен
+- строка вида "@имя" добавляет имя в черный список пользователей
+- пустые строки и строки, начинающиеся с "#", пропускаются
+Файл перечитывается автоматически, когда меняется (проверка не чаще раза в SPAM_RELOAD_SECONDS).
+
+FloodLimiter - ограничение частоты: сколько сообщений и нажатий кнопок пользователь может
+отправить за скользящее окно. Лишнее отбрасывается до обработчиков и БД, а при сильном
+превышении пользователь блокируется.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SPAM_KEYWORDS_FILE = os.getenv('SPAM_KEYWORDS_FILE', '').strip()
+SPAM_RELOAD_SECONDS = float(os.getenv('SPAM_RELOAD_SECONDS', '30'))
+
+# Эвристики по символам (как и раньше)
+MIN_DISTINCT_CHARS = 3  # меньше разных символов в длинном тексте - спам ("аааааааааааа")
+DISTINCT_CHECK_LENGTH = 10
+UPPERCASE_CHECK_LENGTH = 20
+MAX_UPPERCASE_SHARE = 0.5
+
+# Ограничение частоты (на одного пользователя за FLOOD_WINDOW_SECONDS)
+FLOOD_WINDOW_SECONDS = float(os.getenv('FLOOD_WINDOW_SECONDS', '10'))
+FLOOD_MAX_MESSAGES = int(os.getenv('FLOOD_MAX_MESSAGES', '15'))
+FLOOD_MAX_CALLBACKS = int(os.getenv('FLOOD_MAX_CALLBACKS', '25'))
+# Во сколько раз нужно превысить лимит за окно, чтобы пользователя заблокировали (0 - не блокировать)
+FLOOD_BLOCK_MULTIPLIER = float(os.getenv('FLOOD_BLOCK_MULTIPLIER', '3'))
+# Сколько пользователей держать в памяти, прежде чем выбросить неактивных
+FLOOD_MAX_TRACKED_USERS = 5000
+
+# Решения FloodLimiter.hit()
+FLOOD_OK = 'ok'
+FLOOD_DROP = 'drop'
+FLOOD_BLOCK = 'block'
+
+
+def build_pattern(phrases) -> re.Pattern:
+    """
+    Одно регулярное выражение для поиска любой из фраз (фразы и текст - в нижнем регистре)
+    Фразы складываются в префиксное дерево, чтобы общие начала проверялись один раз:
+    ["fuck", "fucked"] -> "fuck(?:ed)?"
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+    if not trie:
+        return None
+    return re.compile(_trie_to_regex(trie))
+
+
+def _trie_to_regex(node: dict) -> str:
+    # Совпадение по самой короткой фразе уже достаточно, поэтому после конца фразы дальше не идем
+    if '' in node:
+        return ''
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.items())]
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+def _load_file(path: str):
+    """Читает файл правил: (фразы, имена из черного списка)"""
+    keywords, blacklist = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('@'):
+                blacklist.append(line[1:])
+            else:
+                keywords.append(line)
+    return keywords, blacklist
+
+
+class SpamMatcher:
+    """
+    Проверка текста и имени пользователя по ключевым фразам и черному списку
+    Правила из кода (keywords, blacklist) всегда действуют; правила из файла добавляются к ним
+    """
+
+    def __init__(self, keywords, blacklist, keywords_file: str = SPAM_KEYWORDS_FILE):
+        self._base_keywords = list(keywords)
+        self._base_blacklist = list(blacklist)
+        self.keywords_file = keywords_file or None
+        self._file_mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.blacklist = []
+        self._keyword_re = None
+        self._blacklist_re = None
+        self.reload()
+
+    def reload(self):
+        """Пересобирает выражения из правил в коде и файла"""
+        keywords = list(self._base_keywords)
+        blacklist = list(self._base_blacklist)
+        if self.keywords_file:
+            try:
+                self._file_mtime = os.stat(self.keywords_file).st_mtime
+                file_keywords, file_blacklist = _load_file(self.keywords_file)
+                keywords.extend(file_keywords)
+                blacklist.extend(file_blacklist)
+            except FileNotFoundError:
+                self._file_mtime = None
+                logger.warning(f"Файл спам-правил {self.keywords_file} не найден, используются встроенные правила")
+            except Exception as e:
+                logger.error(f"Ошибка чтения файла спам-правил {self.keywords_file}: {e}", exc_info=True)
+
+        self.blacklist = list(dict.fromkeys(blacklist))
+        self._keyword_re = build_pattern({k.lower() for k in keywords if k})
+        self._blacklist_re = build_pattern({b.lower() for b in self.blacklist if b})
+        logger.info(f"Спам-фильтр: {len(keywords)} фраз, {len(self.blacklist)} имен в черном списке")
+
+    def _maybe_reload(self):
+        """Перечитывает файл правил, если он изменился (проверка не чаще SPAM_RELOAD_SECONDS)"""
+        if not self.keywords_file:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._reload_lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + SPAM_RELOAD_SECONDS
+            try:
+                mtime = os.stat(self.keywords_file).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._file_mtime:
+                logger.info(f"Файл спам-правил {self.keywords_file} изменился, перечитываем")
+                self.reload()
+
+    def is_blacklisted(self, username: str) -> bool:
+        """Имя пользователя содержит имя из черного списка"""
+        if not username:
+            return False
+        self._maybe_reload()
+        return bool(self._blacklist_re and self._blacklist_re.search(username.lower()))
+
+    def is_spam(self, text: str, username: str = None) -> bool:
+        """Проверяет, является ли сообщение спамом"""
+        if not text:
+            return False
+        self._maybe_reload()
+
+        # Черный список и ключевые слова - по одному поиску
+        if username and self._blacklist_re and self._blacklist_re.search(username.lower()):
+            return True
+        if self._keyword_re and self._keyword_re.search(text.lower()):
+            return True
+
+        # Длинный текст из 1-2 повторяющихся символов
+        length = len(text)
+        if length > DISTINCT_CHECK_LENGTH and len(set(text)) < MIN_DISTINCT_CHARS:
+            return True
+
+        # Слишком много заглавных букв (подсчет идет внутри map, без цикла на Python)
+        if length > UPPERCASE_CHECK_LENGTH:
+            if sum(map(str.isupper, text)) / length > MAX_UPPERCASE_SHARE:
+                return True
+
+        return False
+
+
+class FloodLimiter:
+    """
+    Скользящее окно по каждому пользователю, отдельно для сообщений и нажатий кнопок
+    Хранит времена последних событий (не больше limit * FLOOD_BLOCK_MULTIPLIER на пользователя)
+    Работает внутри цикла событий, поэтому блокировки не нужны
+    """
+
+    def __init__(self, window: float = FLOOD_WINDOW_SECONDS, max_messages: int = FLOOD_MAX_MESSAGES,
+                 max_callbacks: int = FLOOD_MAX_CALLBACKS, block_multiplier: float = FLOOD_BLOCK_MULTIPLIER):
+        self.window = window
+        self.limits = {'message': max_messages, 'callback': max_callbacks}
+        self.block_multiplier = block_multiplier
+        # (user_id, вид) -> deque времен событий
+        self._events = {}
+
+    def _prune(self, now: float):
+        """Выбрасывает пользователей, от которых ничего не было дольше окна"""
+        border = now - self.window
+        self._events = {key: events for key, events in self._events.items() if events and events[-1] > border}
+
+    def hit(self, user_id: int, kind: str, now: float = None) -> str:
+        """
+        Учитывает событие kind ('message' или 'callback') и решает, что с ним делать:
+        FLOOD_OK - пропустить, FLOOD_DROP - отбросить, FLOOD_BLOCK - отбросить и заблокировать
+        """
+        limit = self.limits.get(kind)
+        if not limit:
+            return FLOOD_OK
+        now = time.monotonic() if now is None else now
+        key = (user_id, kind)
+        events = self._events.get(key)
+        if events is None:
+            if len(self._events) >= FLOOD_MAX_TRACKED_USERS:
+                self._prune(now)
+            block_at = int(limit * self.block_multiplier) if self.block_multiplier > 0 else 0
+            events = self._events[key] = deque(maxlen=max(limit, block_at) + 1)
+
+        border = now - self.window
+        while events and events[0] <= border:
+            events.popleft()
+        events.append(now)
+
+        count = len(events)
+        if count <= limit:
+            return FLOOD_OK
+        if self.block_multiplier > 0 and count > limit * self.block_multiplier:
+            events.clear()
+            return FLOOD_BLOCK
+        return FLOOD_DROP
+
+    def forget(self, user_id: int):
+        """Сбрасывает историю пользователя (например, после разблокировки)"""
+        for kind in self.limits:
+            self._events.pop((user_id, kind), None)
@@ -4,8 +4,8 @@
 """
 
 import os
+import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
 import time as time_module
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -16,6 +16,8 @@ from telegram.ext import (
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    TypeHandler,
+    ApplicationHandlerStop,
     filters
 )
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -23,9 +25,16 @@ from apscheduler.triggers.cron import CronTrigger
 import pytz
 
 # Импортируем наши модули
-from database import Database
+from database import Database, AsyncDatabase
 from tasks import Tasks
-from reminders import send_custom_task_reminders
+from reminders import ReminderEngine
+from outbox import MessageDispatcher, EditCoalescer, send_message, BULK
+from update_processor import OrderedUpdateProcessor
+from router import CallbackRouter
+from callback_codec import decode_callback_data
+from antispam import SpamMatcher, FloodLimiter, FLOOD_DROP, FLOOD_BLOCK
+import metrics
+from logging_setup import setup_logging
 from menu import (
     get_main_menu, get_testing_menu, get_tasks_menu, get_task_actions_menu,
     get_confirm_menu, get_assignee_menu, get_presence_menu,
@@ -34,20 +43,13 @@ from menu import (
 from handlers import (
     handle_menu_callback, handle_presence_callback, handle_delay_callback,
     handle_new_task_callback, handle_old_task_callback, handle_confirm_callback,
-    handle_assignee_callback, handle_work_task_take, handle_work_task_done
+    handle_assignee_callback, handle_work_task_take, handle_work_task_done,
+    build_checklist_keyboard
 )
 
-# Настройка логирования (записи о работе бота)
+# Настройка логирования (записи о работе бота): очередь + фоновый поток записи в консоль и bot.log
+setup_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-_sh = logging.StreamHandler()
-_sh.setFormatter(logging.Formatter(_fmt))
-_fh = RotatingFileHandler('bot.log', maxBytes=1_000_000, backupCount=5, encoding='utf-8')
-_fh.setFormatter(logging.Formatter(_fmt))
-logger.handlers = []
-logger.addHandler(_sh)
-logger.addHandler(_fh)
 
 # Получаем данные из переменных окружения (секретные данные)
 # ВАЖНО: В production НЕ используйте дефолтные значения!
@@ -66,6 +68,8 @@ if not ADMIN_USERNAME:
 
 # Инициализация базы данных и задач
 db = Database()
+# Асинхронная обертка - используется во всех обработчиках, чтобы не блокировать цикл событий
+adb = AsyncDatabase(db)
 tasks_manager = Tasks(db)
 
 # Часовой пояс (Москва)
@@ -73,6 +77,22 @@ MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
 MORNING_TIME = os.getenv('MORNING_TIME', '08:00')
 SUMMARY_TIME = os.getenv('SUMMARY_TIME', '16:50')
+# Сколько личных напоминаний отправлять одновременно
+REMINDER_SEND_CONCURRENCY = int(os.getenv('REMINDER_SEND_CONCURRENCY', '10'))
+
+# Режим вебхука: если задан WEBHOOK_URL (публичный https-адрес, например за reverse proxy),
+# бот принимает обновления на локальном HTTP-сервере вместо long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').strip()
+# Локальная проверка вебхука: сервер поднимается, но адрес в Telegram не регистрируется
+# (обновления присылаются вручную, например через curl)
+WEBHOOK_LOCAL = os.getenv('WEBHOOK_LOCAL', '').strip().lower() in ('1', 'true', 'yes')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8443')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+# Telegram присылает его в заголовке X-Telegram-Bot-Api-Secret-Token; запросы без него отклоняются
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '').strip()
+if (WEBHOOK_URL or WEBHOOK_LOCAL) and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is empty! It is required in webhook mode (WEBHOOK_URL / WEBHOOK_LOCAL).")
 
 def _parse_time_str(t: str):
     try:
@@ -102,35 +122,66 @@ SPAM_KEYWORDS = [
 ]
 
 
+# Скомпилированный спам-фильтр: встроенные правила + файл SPAM_KEYWORDS_FILE (перечитывается при изменении)
+spam_matcher = SpamMatcher(SPAM_KEYWORDS, SPAM_BLACKLIST)
+
+
 def is_spam_message(text: str, username: str = None) -> bool:
     """Проверяет, является ли сообщение спамом"""
-    if not text:
-        return False
-    
-    text_lower = text.lower()
-    username_lower = username.lower() if username else ""
-    
-    # Проверка черного списка
-    for spam_user in SPAM_BLACKLIST:
-        if spam_user.lower() in username_lower:
-            return True
-    
-    # Проверка ключевых слов
-    for keyword in SPAM_KEYWORDS:
-        if keyword.lower() in text_lower:
-            return True
-    
-    # Проверка на повторяющиеся сообщения (более 3 одинаковых символов подряд)
-    if len(set(text)) < 3 and len(text) > 10:
-        return True
-    
-    # Проверка на слишком много заглавных букв (более 50%)
-    if len(text) > 20:
-        uppercase_count = sum(1 for c in text if c.isupper())
-        if uppercase_count / len(text) > 0.5:
-            return True
-    
-    return False
+    return spam_matcher.is_spam(text, username)
+
+
+# Ограничение частоты сообщений и нажатий кнопок (в памяти, по каждому пользователю)
+flood_limiter = FloodLimiter()
+
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Срабатывает раньше всех обработчиков (группа -1)
+    Обновления от заблокированных и слишком частые обновления дальше не передаются
+    (ApplicationHandlerStop), поэтому не доходят ни до БД, ни до Telegram
+    """
+    user = update.effective_user
+    if not user:
+        return
+    if update.callback_query:
+        kind = 'callback'
+    elif update.message or update.edited_message:
+        kind = 'message'
+    else:
+        return
+    # admin_id появляется в bot_data только после /start, поэтому сверяем и username
+    admin_username = context.bot_data.get('ADMIN_USERNAME', ADMIN_USERNAME)
+    if user.id == context.bot_data.get('admin_id') or (user.username and user.username == admin_username):
+        return
+
+    # Заблокированные - проверка по множеству в памяти
+    if await adb.is_user_blocked(user.id):
+        metrics.increment('flood.blocked_user_dropped')
+        raise ApplicationHandlerStop
+
+    decision = flood_limiter.hit(user.id, kind)
+    if decision == FLOOD_DROP:
+        metrics.increment(f'flood.dropped.{kind}')
+        raise ApplicationHandlerStop
+    if decision == FLOOD_BLOCK:
+        metrics.increment('flood.blocked')
+        username = user.username if user.username else f"user_{user.id}"
+        logger.warning(f"🚫 ФЛУД от @{username} (ID: {user.id}): пользователь заблокирован")
+        try:
+            await adb.block_user(user.id, username, "Flood")
+            admin_id = context.bot_data.get('admin_id')
+            if not admin_id:
+                admin_id = await adb.get_user_id_by_username(admin_username)
+            if admin_id:
+                await send_message(
+                    context,
+                    chat_id=admin_id,
+                    text=f"🚫 Пользователь @{username} (ID: {user.id}) заблокирован за флуд.\nРазблокировать: /unblock {user.id}"
+                )
+        except Exception as e:
+            logger.error(f"Ошибка блокировки флудера {user.id}: {e}", exc_info=True)
+        raise ApplicationHandlerStop
 
 
 async def spam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -144,7 +195,7 @@ async def spam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> boo
         username = user.username if user.username else f"user_{user_id}"
         
         # Проверяем, не заблокирован ли пользователь
-        if db.is_user_blocked(user_id):
+        if await adb.is_user_blocked(user_id):
             logger.warning(f"Заблокированный пользователь {username} (ID: {user_id}) попытался отправить сообщение")
             return True  # Блокируем
         
@@ -154,17 +205,17 @@ async def spam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> boo
             
             if is_spam_message(message_text, username):
                 # Логируем попытку спама
-                db.log_spam_attempt(user_id, username, message_text)
+                await adb.log_spam_attempt(user_id, username, message_text)
                 
                 # Автоматически блокируем спамера
-                db.block_user(user_id, username, "Spam detected")
+                await adb.block_user(user_id, username, "Spam detected")
                 
                 # Уведомляем администратора
                 try:
                     admin_id = context.bot_data.get('admin_id')
                     if not admin_id:
                         admin_username = context.bot_data.get('ADMIN_USERNAME', ADMIN_USERNAME)
-                        admin_id = db.get_user_id_by_username(admin_username)
+                        admin_id = await adb.get_user_id_by_username(admin_username)
                     
                     if admin_id:
                         spam_notification = (
@@ -174,7 +225,8 @@ async def spam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> boo
                             f"📝 Сообщение: {message_text[:200]}\n\n"
                             f"Пользователь автоматически заблокирован."
                         )
-                        await context.bot.send_message(
+                        await send_message(
+                            context,
                             chat_id=admin_id,
                             text=spam_notification,
                             parse_mode='Markdown'
@@ -209,11 +261,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Korudirp": {"name": "Cherenkov, Ruslan"}
             }
             if user.username in user_mapping:
-                db.save_user_id(user.username, user.id, user_mapping[user.username]["name"])
+                await adb.save_user_id(user.username, user.id, user_mapping[user.username]["name"])
             
             # Если это администратор, сохраняем его ID
             if user.username == ADMIN_USERNAME:
-                db.save_user_id(ADMIN_USERNAME, user.id, "Admin")
+                await adb.save_user_id(ADMIN_USERNAME, user.id, "Admin")
                 context.bot_data['admin_id'] = user.id
                 logger.info(f"Admin ID сохранен: {user.id}")
         
@@ -348,7 +400,8 @@ async def add_urgent_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             raise
         
         try:
-            msg = await context.bot.send_message(
+            msg = await send_message(
+                context,
                 chat_id=chat_id,
                 text=f"🔥 **ВНЕПЛАНОВАЯ ЗАДАЧА**\n\n{urgent_task}",
                 reply_markup=keyboard,
@@ -398,10 +451,11 @@ async def force_morning_command(update: Update, context: ContextTypes.DEFAULT_TY
         
         # Создаем объект приложения для функции
         class AppWrapper:
-            def __init__(self, bot):
+            def __init__(self, bot, bot_data):
                 self.bot = bot
+                self.bot_data = bot_data
         
-        app_wrapper = AppWrapper(context.bot)
+        app_wrapper = AppWrapper(context.bot, context.bot_data)
         # force_weekend=True позволяет отправлять задачи даже в выходные
         await send_morning_tasks(app_wrapper, force_weekend=True)
         await update.message.reply_text("✅ Задачи отправлены в группу!")
@@ -425,7 +479,7 @@ async def team_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         username = context.args[0].lstrip('@')
         initials = context.args[1].upper()
-        db.save_user(username, initials)
+        await adb.save_user(username, initials)
         await update.message.reply_text(f"✅ Добавлен: @{username} ({initials})")
     except Exception as e:
         logger.error(f"Ошибка team_add_command: {e}", exc_info=True)
@@ -444,18 +498,55 @@ async def team_remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text("❌ Использование: /team_remove @username")
             return
         username = context.args[0].lstrip('@')
-        db.remove_user(username)
+        await adb.remove_user(username)
         await update.message.reply_text(f"✅ Удален: @{username}")
     except Exception as e:
         logger.error(f"Ошибка team_remove_command: {e}", exc_info=True)
         await update.message.reply_text("❌ Ошибка")
 
 
+async def unblock_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        if await spam_filter(update, context):
+            return
+        user = update.effective_user
+        if not user or user.username != ADMIN_USERNAME:
+            await update.message.reply_text("❌ Недостаточно прав")
+            return
+        if len(context.args) < 1 or not context.args[0].lstrip('-').isdigit():
+            await update.message.reply_text("❌ Использование: /unblock USER_ID")
+            return
+        user_id = int(context.args[0])
+        if await adb.unblock_user(user_id):
+            flood_limiter.forget(user_id)
+            await update.message.reply_text(f"✅ Разблокирован: {user_id}")
+        else:
+            await update.message.reply_text(f"ℹ️ Пользователь {user_id} не был заблокирован")
+    except Exception as e:
+        logger.error(f"Ошибка unblock_command: {e}", exc_info=True)
+        await update.message.reply_text("❌ Ошибка")
+
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        if await spam_filter(update, context):
+            return
+        user = update.effective_user
+        if not user or user.username != ADMIN_USERNAME:
+            await update.message.reply_text("❌ Недостаточно прав")
+            return
+        text = metrics.format_snapshot()
+        await update.message.reply_text("📊 Метрики:\n" + (text if text else "пока пусто"))
+    except Exception as e:
+        logger.error(f"Ошибка metrics_command: {e}", exc_info=True)
+        await update.message.reply_text("❌ Ошибка")
+
+
 async def team_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if await spam_filter(update, context):
             return
-        team = db.get_team()
+        team = await adb.get_team()
         if not team:
             await update.message.reply_text("👥 Список пуст")
             return
@@ -540,12 +631,11 @@ async def handle_delay_reason(update: Update, context: ContextTypes.DEFAULT_TYPE
         if 'db' in context.bot_data:
             db = context.bot_data['db']
         else:
-            from database import Database
-            db = Database()
+            db = adb
         
         from datetime import datetime
         time_str = datetime.now(MOSCOW_TZ).strftime("%H:%M")
-        db.save_presence(username, user_id, "late", time=time_str, delay_minutes=delay_minutes, reason=reason)
+        await db.save_presence(username, user_id, "late", time=time_str, delay_minutes=delay_minutes, reason=reason)
         
         # Отправляем уведомление администратору
         try:
@@ -556,7 +646,7 @@ async def handle_delay_reason(update: Update, context: ContextTypes.DEFAULT_TYPE
             else:
                 # Пытаемся получить из БД
                 admin_username = context.bot_data.get('ADMIN_USERNAME', ADMIN_USERNAME)
-                admin_id = db.get_user_id_by_username(admin_username)
+                admin_id = await db.get_user_id_by_username(admin_username)
                 if admin_id:
                     context.bot_data['admin_id'] = admin_id
             
@@ -568,7 +658,8 @@ async def handle_delay_reason(update: Update, context: ContextTypes.DEFAULT_TYPE
                     f"📝 Причина: {reason}\n"
                     f"🕐 Время отметки: {time_str}"
                 )
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=admin_id,
                     text=text,
                     parse_mode='Markdown'
@@ -613,7 +704,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Проверка на спам перед обработкой (для callback_query проверяем пользователя)
         user = update.effective_user if update.effective_user else None
-        if user and db.is_user_blocked(user.id):
+        if user and await db.is_user_blocked(user.id):
             logger.warning(f"Заблокированный пользователь {user.username} (ID: {user.id}) попытался нажать кнопку")
             if update.callback_query:
                 await update.callback_query.answer("❌ Доступ запрещен", show_alert=True)
@@ -633,72 +724,16 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer()
             return
         
-        # Обработка меню (кроме menu_create_task, menu_add_employee, team_add, weekly_add - их обрабатывает ConversationHandler)
-        # Если это menu_create_task, menu_add_employee, team_add или weekly_add, просто возвращаемся - ConversationHandler должен перехватить
-        if data == "menu_create_task" or data == "menu_add_employee" or data == "team_add" or data == "weekly_add":
-            return  # Не обрабатываем здесь, пусть ConversationHandler перехватит
-        
-        if data.startswith("menu_"):
-            await handle_menu_callback(query, data, context, db)
-            return
-        
-        # Обработка кнопок команды (team_list_btn, team_remove, team_earned и т.д.)
-        if data.startswith("team_"):
-            await handle_menu_callback(query, data, context, db)
-            return
-        
-        # Обработка еженедельных задач (weekly_view, weekly_edit, weekly_delete и т.д.)
-        if data.startswith("weekly_"):
-            await handle_menu_callback(query, data, context, db)
-            return
-        
-        # Обработка тестирования (test_daily_tasks, test_employees)
-        if data.startswith("test_"):
-            await handle_menu_callback(query, data, context, db)
-            return
-        
-        # Обработка присутствия
-        if data.startswith("presence_"):
-            await handle_presence_callback(query, data, context, db)
-            return
-        
-        # Обработка задержки
-        if data.startswith("delay_"):
-            await handle_delay_callback(query, data, context, db, get_delay_time_menu, get_delay_minutes_menu)
-            return
-        
-        # Обработка задач из меню
-        if data.startswith("task_"):
-            # Проверяем, это старая система задач или новая
-            if "_" in data and data.split("_")[1].isdigit():
-                # Старая система (task_0_1)
-                await handle_old_task_callback(query, data, context, db)
-            else:
-                # Новая система (task_view_1, task_edit_1 и т.д.)
-                await handle_new_task_callback(query, data, context, db, get_task_actions_menu, get_confirm_menu)
-            return
-        
-        # Обработка подтверждений
-        if data.startswith("confirm_") or data.startswith("cancel_"):
-            await handle_confirm_callback(query, data, context, db, get_task_actions_menu, get_tasks_menu)
-            return
-        
-        # Обработка назначения исполнителя
-        if data.startswith("assignee_"):
-            await handle_assignee_callback(query, data, context, db)
+        # Компактные кнопки (см. callback_codec) раскодируются в CallbackAction("work_take", (5, "AG"))
+        data = decode_callback_data(data)
+        if data is None:
+            metrics.increment('callbacks.expired')
+            await query.answer("⌛ Кнопка устарела, откройте меню заново", show_alert=True)
             return
         
-        # Обработка "Взять в работу" и "Готово"
-        if data.startswith("work_take_"):
-            await handle_work_task_take(query, data, context, db)
-            return
-        
-        if data.startswith("work_done_"):
-            await handle_work_task_done(query, data, context, db)
-            return
-        
-        logger.warning(f"Неизвестный формат данных кнопки: {data}")
-        await query.answer("❌ Неизвестная команда")
+        # Обработчик выбирается по таблице маршрутов (см. callback_router ниже)
+        if not await callback_router.dispatch(data, query, data, context, db):
+            await query.answer("❌ Неизвестная команда")
         
     except Exception as e:
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА в button_callback: {type(e).__name__}: {e}", exc_info=True)
@@ -711,6 +746,43 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # НЕ ПОДНИМАЕМ ИСКЛЮЧЕНИЕ - бот должен продолжать работать
 
 
+# Маршруты кнопок: callback_data -> обработчик (обработчики вызываются как handler(query, data, context, db, ...))
+callback_router = CallbackRouter('buttons')
+# Точки входа ConversationHandler - их перехватывает сам ConversationHandler
+callback_router.ignore("menu_create_task", "menu_add_employee", "team_add", "weekly_add")
+# Меню, команда, еженедельные задачи и тестирование - дальше разбирает menu_router в handlers.py
+for _prefix in ("menu_", "weekly_", "test_"):
+    callback_router.prefix(_prefix, handle_menu_callback)
+callback_router.prefix("team_", handle_menu_callback, actions=("team_remove", "team_remove_confirm", "team_earned"))
+callback_router.prefix("presence_", handle_presence_callback)
+callback_router.prefix(
+    "delay_",
+    lambda query, data, context, db: handle_delay_callback(query, data, context, db, get_delay_time_menu, get_delay_minutes_menu)
+)
+# Старая система задач (task_0_1) и новая (task_view_1, task_edit_1 и т.д.)
+callback_router.add("task_{day:int}_{task_index:int}", handle_old_task_callback)
+callback_router.prefix(
+    "task_",
+    lambda query, data, context, db: handle_new_task_callback(query, data, context, db, get_task_actions_menu, get_confirm_menu)
+)
+callback_router.action(
+    "task_view",
+    lambda query, data, context, db, task_id: handle_new_task_callback(
+        query, data, context, db, get_task_actions_menu, get_confirm_menu, action="view", task_id=task_id
+    ),
+    ("task_id",)
+)
+for _prefix in ("confirm_", "cancel_"):
+    callback_router.prefix(
+        _prefix,
+        lambda query, data, context, db: handle_confirm_callback(query, data, context, db, get_task_actions_menu, get_tasks_menu)
+    )
+callback_router.prefix("assignee_", handle_assignee_callback)
+# "Взять в работу" и "Готово"
+callback_router.add("work_take_{task_id:int}_{assignee}", handle_work_task_take, action="work_take")
+callback_router.add("work_done_{task_id:int}_{assignee}", handle_work_task_done, action="work_done")
+
+
 async def send_morning_tasks(app, force_weekend=False):
     """Отправка задач на день в 08:00"""
     try:
@@ -724,15 +796,16 @@ async def send_morning_tasks(app, force_weekend=False):
             logger.info(f"Сегодня выходной (день {today}), используем задачи понедельника для теста")
             today = 0  # Используем задачи понедельника
         
-        # Получаем задачи на сегодня
-        day_tasks = tasks_manager.get_tasks_for_day(today)
+        # Получаем задачи на сегодня (id нужны для модели чек-листа)
+        weekly_tasks = await adb.get_weekly_tasks(today)
         
-        if not day_tasks:
+        if not weekly_tasks:
             logger.warning(f"Нет задач для дня {today}, используем задачи понедельника")
             # Если нет задач, используем задачи понедельника
-            day_tasks = tasks_manager.get_tasks_for_day(0)
+            weekly_tasks = await adb.get_weekly_tasks(0)
             today = 0
-            logger.info(f"Используем задачи понедельника: {len(day_tasks)} задач")
+            logger.info(f"Используем задачи понедельника: {len(weekly_tasks)} задач")
+        day_tasks = [task['task_text'] for task in weekly_tasks]
         
         # Формируем сообщение
         day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
@@ -752,15 +825,14 @@ async def send_morning_tasks(app, force_weekend=False):
         # Создаем текст сообщения со всеми задачами
         message_text = f"📋 ЗАДАЧИ НА {day_name.upper()} ({date_str})\n\n"
         
-        # Создаем кнопки для всех задач (ОДНА кнопка на задачу)
-        all_buttons = []
+        # Задачи, попавшие в сообщение: (weekly_task_id, текст) - по ним строятся кнопки и модель чек-листа
+        checklist_tasks = []
         
         # Проверяем, что сообщение не превысит лимит
         estimated_length = len(message_text)
         
-        for i, task in enumerate(day_tasks, 1):
-            task_id = f"{today}_{i}"
-            task_line = f"{i}. {task}\n"
+        for i, task in enumerate(weekly_tasks, 1):
+            task_line = f"{i}. {task['task_text']}\n"
             
             # Проверяем, не превысит ли сообщение лимит (4096 символов)
             if estimated_length + len(task_line) > 4000:  # Оставляем запас
@@ -769,62 +841,37 @@ async def send_morning_tasks(app, force_weekend=False):
             
             message_text += task_line
             estimated_length += len(task_line)
-            
-            # Валидация callback_data (Telegram ограничивает до 64 байт)
-            callback_data = f"task_{task_id}"
-            if len(callback_data.encode('utf-8')) > 64:
-                logger.error(f"⚠️ callback_data слишком длинный для задачи {i}: {len(callback_data.encode('utf-8'))} байт")
-                # Пропускаем эту задачу
-                continue
-            
-            # ОПТИМИЗАЦИЯ ДЛЯ МОБИЛЬНЫХ: ограничиваем длину текста кнопки до 20 символов
-            # Это обеспечит полную видимость на мобильных устройствах
-            max_mobile_length = 20
-            if len(task) > max_mobile_length:
-                # Укорачиваем текст задачи для мобильных
-                task_short = task[:max_mobile_length-3] + "..."
-                button_text = f"{i}. {task_short} ⚪"
-            else:
-                button_text = f"{i}. {task} ⚪"
-            
-            # Дополнительная проверка на случай, если номер задачи делает текст слишком длинным
-            if len(button_text) > 25:  # Оставляем запас для мобильных
-                max_text_len = 25 - len(f"{i}. ⚪")
-                task_short = task[:max_text_len-3] + "..."
-                button_text = f"{i}. {task_short} ⚪"
-                logger.warning(f"Текст кнопки для задачи {i} укорочен для мобильных: '{button_text}'")
-            
-            # Добавляем ОДНУ кнопку для этой задачи
-            all_buttons.append([
-                InlineKeyboardButton(
-                    button_text,
-                    callback_data=callback_data
-                )
-            ])
+            checklist_tasks.append((task['id'], task['task_text']))
         
         # Проверяем, что есть хотя бы одна задача
-        if not all_buttons:
+        if not checklist_tasks:
             logger.error("❌ Нет задач для отправки (все были отфильтрованы)")
             return
         
-        # Создаем клавиатуру со всеми кнопками
-        keyboard = InlineKeyboardMarkup(all_buttons)
-        
         # Валидация: Telegram ограничивает количество кнопок (до 100)
-        if len(all_buttons) > 100:
-            logger.warning(f"⚠️ Слишком много кнопок ({len(all_buttons)}), ограничиваем до 100")
-            all_buttons = all_buttons[:100]
-            keyboard = InlineKeyboardMarkup(all_buttons)
+        if len(checklist_tasks) > 100:
+            logger.warning(f"⚠️ Слишком много кнопок ({len(checklist_tasks)}), ограничиваем до 100")
+            checklist_tasks = checklist_tasks[:100]
+        
+        # ОДНА кнопка на задачу, все статусы пока ⚪
+        keyboard = build_checklist_keyboard({'day': today, 'tasks': checklist_tasks, 'statuses': {}})
+        all_buttons = keyboard.inline_keyboard
         
         # Отправляем одно сообщение со всеми задачами
         try:
             logger.info(f"Отправка сообщения с {len(all_buttons)} задачами в чат {chat_id}...")
-            msg = await app.bot.send_message(
+            msg = await send_message(
+                app,
+                priority=BULK,
                 chat_id=chat_id,
                 text=message_text,
                 reply_markup=keyboard
             )
             logger.info(f"✅ Все {len(all_buttons)} задач отправлены одним сообщением! Message ID: {msg.message_id}")
+            # Модель чек-листа: нажатия на кнопки обновляют клавиатуру по ней, не разбирая текст
+            await adb.save_checklist_message(
+                chat_id, msg.message_id, datetime.now(MOSCOW_TZ).date().isoformat(), today, checklist_tasks
+            )
         except Exception as e:
             logger.error(f"❌ ОШИБКА отправки сообщения: {type(e).__name__}: {e}")
             raise
@@ -837,13 +884,16 @@ async def send_morning_tasks(app, force_weekend=False):
 async def send_reminders(app: Application):
     """Отправка напоминаний в личные сообщения в 13:00"""
     try:
-        today = datetime.now(MOSCOW_TZ).weekday()
+        now = datetime.now(MOSCOW_TZ)
+        today = now.weekday()
+        today_str = now.date().isoformat()
         
         if today > 4:
             return
         
         # Получаем задачи на сегодня
-        day_tasks = tasks_manager.get_tasks_for_day(today)
+        weekly_tasks = await adb.get_weekly_tasks(today)
+        day_tasks = [task['task_text'] for task in weekly_tasks]
         
         if not day_tasks:
             return
@@ -857,78 +907,94 @@ async def send_reminders(app: Application):
         "KA": {"username": "Korudirp", "initials": "KA"}
     }
     
-    # Собираем невыполненные задачи для каждого пользователя
+    # 1. Данные одним заходом: статусы всех задач дня и ID всех сотрудников (из кэша команды)
+    try:
+        status_matrix = await adb.get_day_status_matrix(today_str, today, list(user_mapping.keys()), weekly_tasks)
+        user_ids = {member['username']: member['user_id'] for member in await adb.get_team()}
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки данных для напоминаний: {e}", exc_info=True)
+        return
+    
+    # 2. Формируем все сообщения
+    stats = {'sent': 0, 'failed': 0, 'no_user_id': 0, 'all_done': 0}
+    outgoing = []
     for initials, user_info in user_mapping.items():
-        incomplete_tasks = []
-        
-        try:
-            for i, task in enumerate(day_tasks, 1):
-                task_id = f"{today}_{i}"
-                status_key = f"{task_id}_{initials}"
-                try:
-                    status = db.get_task_status(status_key)
-                except Exception as e:
-                    logger.error(f"Ошибка получения статуса {status_key}: {e}", exc_info=True)
-                    status = "⚪"
-                
-                if status != "✅":
-                    incomplete_tasks.append(task)
-        except Exception as e:
-            logger.error(f"Ошибка обработки задач для {user_info['username']}: {e}", exc_info=True)
-            continue
-        
+        incomplete_tasks = [
+            task for i, task in enumerate(day_tasks, 1)
+            if status_matrix.get(f"{today}_{i}", {}).get(initials, "⚪") != "✅"
+        ]
         if not incomplete_tasks:
+            stats['all_done'] += 1
             continue
         
-        # Формируем сообщение для пользователя
-        # Валидация: Telegram ограничивает длину сообщения до 4096 символов
-        message = f"⏰ **НАПОМИНАНИЕ**\n\n"
-        message += f"У вас есть невыполненные задачи:\n\n"
-        
-        max_message_length = 4000  # Оставляем запас
-        current_length = len(message)
-        
-        for i, task in enumerate(incomplete_tasks, 1):
-            task_line = f"{i}. {task}\n"
-            if current_length + len(task_line) > max_message_length:
-                message += f"\n... и еще {len(incomplete_tasks) - i + 1} задач"
-                logger.warning(f"Сообщение для {user_info['username']} обрезано из-за лимита длины")
-                break
-            message += task_line
-            current_length += len(task_line)
-        
-        # Получаем ID пользователя из базы данных
-        try:
-            user_id = db.get_user_id_by_username(user_info["username"])
-        except Exception as e:
-            logger.error(f"Ошибка получения ID пользователя {user_info['username']}: {e}", exc_info=True)
-            user_id = None
+        user_id = user_ids.get(user_info["username"])
+        if not user_id:
+            # Если ID еще не сохранен, логируем предупреждение
+            logger.warning(f"⚠️ ID пользователя {user_info['username']} не найден в базе данных")
+            stats['no_user_id'] += 1
+            continue
         
-        if user_id:
+        outgoing.append((user_info["username"], user_id, _render_personal_reminder(user_info["username"], incomplete_tasks)))
+    
+    # 3. Отправляем параллельно (очередь сообщений сама соблюдает лимиты Telegram)
+    semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+    
+    async def deliver(username, user_id, message):
+        async with semaphore:
             try:
-                await app.bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    parse_mode='Markdown'
-                )
-                logger.info(f"✅ Напоминание отправлено пользователю {user_info['username']} (ID: {user_id})")
+                await send_message(app, priority=BULK, chat_id=user_id, text=message, parse_mode='Markdown')
+                return True
             except Exception as e:
-                logger.error(f"❌ Ошибка отправки напоминания пользователю {user_info['username']}: {type(e).__name__}: {e}", exc_info=True)
-        else:
-            # Если ID еще не сохранен, логируем предупреждение
-            logger.warning(f"⚠️ ID пользователя {user_info['username']} не найден в базе данных")
+                logger.error(f"❌ Ошибка отправки напоминания пользователю {username}: {type(e).__name__}: {e}", exc_info=True)
+                return False
+    
+    started = time_module.monotonic()
+    results = await asyncio.gather(*(deliver(*item) for item in outgoing))
+    stats['sent'] = sum(1 for ok in results if ok)
+    stats['failed'] = len(results) - stats['sent']
+    
+    # 4. Один итоговый лог и одна запись метрик на весь запуск
+    metrics.record('reminders', stats)
+    logger.info(
+        f"Напоминания {today_str}: отправлено {stats['sent']}, ошибок {stats['failed']}, "
+        f"без ID {stats['no_user_id']}, все выполнено {stats['all_done']} "
+        f"({time_module.monotonic() - started:.2f} с)"
+    )
+
+
+def _render_personal_reminder(username: str, incomplete_tasks: list) -> str:
+    """Текст личного напоминания о невыполненных задачах"""
+    # Валидация: Telegram ограничивает длину сообщения до 4096 символов
+    message = f"⏰ **НАПОМИНАНИЕ**\n\n"
+    message += f"У вас есть невыполненные задачи:\n\n"
+    
+    max_message_length = 4000  # Оставляем запас
+    current_length = len(message)
+    
+    for i, task in enumerate(incomplete_tasks, 1):
+        task_line = f"{i}. {task}\n"
+        if current_length + len(task_line) > max_message_length:
+            message += f"\n... и еще {len(incomplete_tasks) - i + 1} задач"
+            logger.warning(f"Сообщение для {username} обрезано из-за лимита длины")
+            break
+        message += task_line
+        current_length += len(task_line)
+    return message
 
 
 async def send_evening_summary(app: Application):
     """Отправка итогов дня в 16:50"""
     try:
-        today = datetime.now(MOSCOW_TZ).weekday()
+        now = datetime.now(MOSCOW_TZ)
+        today = now.weekday()
+        today_str = now.date().isoformat()
         
         if today > 4:
             return
         
         # Получаем задачи на сегодня
-        day_tasks = tasks_manager.get_tasks_for_day(today)
+        weekly_tasks = await adb.get_weekly_tasks(today)
+        day_tasks = [task['task_text'] for task in weekly_tasks]
         
         if not day_tasks:
             return
@@ -939,18 +1005,15 @@ async def send_evening_summary(app: Application):
     # Собираем невыполненные задачи
     incomplete = []
     try:
+        # Статусы всех задач дня - одним запросом вместо трех на каждую задачу
+        status_matrix = await adb.get_day_status_matrix(today_str, today, ["AG", "KA", "SA"], weekly_tasks)
+        
         for i, task in enumerate(day_tasks, 1):
             task_id = f"{today}_{i}"
-            try:
-                status_ag = db.get_task_status(f"{task_id}_AG")
-                status_ka = db.get_task_status(f"{task_id}_KA")
-                status_sa = db.get_task_status(f"{task_id}_SA")
-            except Exception as e:
-                logger.error(f"Ошибка получения статусов для задачи {task_id}: {e}", exc_info=True)
-                # Используем дефолтные статусы
-                status_ag = "⚪"
-                status_ka = "⚪"
-                status_sa = "⚪"
+            task_statuses = status_matrix.get(task_id, {})
+            status_ag = task_statuses.get("AG", "⚪")
+            status_ka = task_statuses.get("KA", "⚪")
+            status_sa = task_statuses.get("SA", "⚪")
             
             # Задача невыполнена, если хотя бы один не выполнил
             if status_ag != "✅" or status_ka != "✅" or status_sa != "✅":
@@ -997,7 +1060,9 @@ async def send_evening_summary(app: Application):
     try:
         # Преобразуем CHAT_ID в int если это строка
         chat_id = int(CHAT_ID) if isinstance(CHAT_ID, str) else CHAT_ID
-        await app.bot.send_message(
+        await send_message(
+            app,
+            priority=BULK,
             chat_id=chat_id,
             text=message,
             parse_mode='Markdown'
@@ -1026,7 +1091,9 @@ async def send_presence_buttons(app: Application, force_weekend=False):
             f"Пожалуйста, отметьте своё присутствие:"
         )
         
-        await app.bot.send_message(
+        await send_message(
+            app,
+            priority=BULK,
             chat_id=chat_id,
             text=message,
             reply_markup=get_presence_menu(),
@@ -1058,7 +1125,7 @@ async def send_presence_reminder(app: Application):
         
         # Получаем user_id для каждого пользователя
         for user in all_users:
-            user_id = db.get_user_id_by_username(user["username"])
+            user_id = await db.get_user_id_by_username(user["username"])
             if user_id:
                 user["user_id"] = user_id
         
@@ -1066,23 +1133,7 @@ async def send_presence_reminder(app: Application):
         today_str = datetime.now(MOSCOW_TZ).strftime("%Y-%m-%d")
         
         # Проверяем, кто отметился сегодня
-        marked_users = set()
-        try:
-            from database import db_lock
-            with db_lock:
-                conn = db.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT username FROM presence WHERE date = ?',
-                        (today_str,)
-                    )
-                    results = cursor.fetchall()
-                    marked_users = {row[0] for row in results}
-                finally:
-                    conn.close()
-        except Exception as e:
-            logger.error(f"Ошибка получения списка отметившихся: {e}", exc_info=True)
+        marked_users = await db.get_presence_usernames(today_str)
         
         # Находим тех, кто не отметился
         not_marked = [user for user in all_users if user["username"] not in marked_users and user["user_id"]]
@@ -1108,7 +1159,9 @@ async def send_presence_reminder(app: Application):
                 message = f"⏰ **НАПОМИНАНИЕ О ПРИСУТСТВИИ**\n\n{names_str}, пожалуйста, отметьте своё присутствие на рабочем месте."
             
             try:
-                await app.bot.send_message(
+                await send_message(
+                    app,
+                    priority=BULK,
                     chat_id=chat_id,
                     text=message,
                     parse_mode='Markdown',
@@ -1122,6 +1175,45 @@ async def send_presence_reminder(app: Application):
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА в send_presence_reminder: {e}", exc_info=True)
 
 
+async def rollover_checklists():
+    """Переносит статусы чек-листов прошедших дней в историю и удаляет устаревшую историю"""
+    try:
+        today_str = datetime.now(MOSCOW_TZ).date().isoformat()
+        await adb.rollover_checklists(today_str)
+    except Exception as e:
+        logger.error(f"❌ Ошибка переноса чек-листов в историю: {e}", exc_info=True)
+
+
+async def post_init(application: Application):
+    """Запускается после инициализации приложения, внутри цикла событий"""
+    # Очередь исходящих сообщений - все отправки идут через нее с учетом лимитов Telegram
+    outbox = MessageDispatcher(application.bot)
+    application.bot_data['outbox'] = outbox
+    await outbox.start()
+    # Частые нажатия на кнопки одного сообщения превращаются в одну правку клавиатуры
+    application.bot_data['edit_coalescer'] = EditCoalescer(application)
+    
+    # Движок напоминаний о ручных задачах - спит до ближайшего дедлайнового напоминания
+    engine = ReminderEngine(application)
+    application.bot_data['reminder_engine'] = engine
+    await engine.start()
+
+
+async def post_shutdown(application: Application):
+    """Останавливает фоновые задачи перед выходом"""
+    engine = application.bot_data.get('reminder_engine')
+    if engine:
+        await engine.stop()
+    # Отправляем отложенные правки клавиатур, пока очередь еще работает
+    coalescer = application.bot_data.get('edit_coalescer')
+    if coalescer:
+        await coalescer.stop()
+    # Дожидаемся отправки уже поставленных в очередь сообщений
+    outbox = application.bot_data.get('outbox')
+    if outbox:
+        await outbox.stop()
+
+
 def setup_scheduler(app: Application):
     """Настройка расписания отправки сообщений"""
     scheduler = AsyncIOScheduler(timezone=MOSCOW_TZ)
@@ -1137,10 +1229,20 @@ def setup_scheduler(app: Application):
         trigger=CronTrigger(hour=h2, minute=m2, day_of_week='mon-fri', timezone=MOSCOW_TZ),
         args=[app]
     )
+    # Каждую ночь переносим чек-листы прошедших дней в историю
+    scheduler.add_job(
+        rollover_checklists,
+        trigger=CronTrigger(hour=0, minute=5, timezone=MOSCOW_TZ)
+    )
+    # И чистим журнал отправленных напоминаний от старых записей
+    scheduler.add_job(
+        adb.sweep_reminder_ledger,
+        trigger=CronTrigger(hour=0, minute=10, timezone=MOSCOW_TZ)
+    )
     
     
     scheduler.start()
-    logger.info("Расписание настроено: 08:00 (задачи), 16:50 (итоги дня)")
+    logger.info("Расписание настроено: 08:00 (задачи), 16:50 (итоги дня), 00:05 (архив чек-листов), 00:10 (журнал напоминаний)")
 
 
 def main():
@@ -1154,11 +1256,19 @@ def main():
         logger.info("=" * 50)
         
         # Создаем приложение бота
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            # Разные пользователи обрабатываются параллельно, один пользователь и одно сообщение - по очереди
+            .concurrent_updates(OrderedUpdateProcessor())
+            .build()
+        )
         logger.info("Приложение бота создано")
         
         # Сохраняем глобальный экземпляр db в bot_data для использования в ConversationHandlers
-        application.bot_data['db'] = db
+        application.bot_data['db'] = adb
         logger.info("Глобальный экземпляр db сохранен в bot_data")
         
         # Сохраняем CHAT_ID для использования в ConversationHandlers
@@ -1170,14 +1280,19 @@ def main():
         logger.info("ADMIN_USERNAME сохранен в bot_data")
         
         # Блокируем известных спамеров при старте
-        for spam_username in SPAM_BLACKLIST:
+        for spam_username in spam_matcher.blacklist:
             spam_user_id = db.get_user_id_by_username(spam_username)
+            if spam_user_id and db.is_user_blocked(spam_user_id):
+                continue
             if spam_user_id:
                 db.block_user(spam_user_id, spam_username, "Known spammer")
                 logger.warning(f"Известный спамер {spam_username} (ID: {spam_user_id}) заблокирован при старте")
             else:
                 logger.info(f"Спамер {spam_username} еще не найден в БД, будет заблокирован при первой попытке")
         
+        # Догоняем перенос чек-листов, если бот был выключен в полночь
+        db.rollover_checklists(datetime.now(MOSCOW_TZ).date().isoformat())
+        
         application.bot_data['send_morning_tasks'] = send_morning_tasks
         logger.info("Функции тестирования сохранены в bot_data")
         
@@ -1196,12 +1311,18 @@ def main():
         
         application.add_handler(CommandHandler("force_morning", force_morning_command))
         logger.info("Обработчик /force_morning зарегистрирован")
-
+        
         application.add_handler(CommandHandler("team_add", team_add_command))
         application.add_handler(CommandHandler("team_remove", team_remove_command))
         application.add_handler(CommandHandler("team_list", team_list_command))
+        application.add_handler(CommandHandler("unblock", unblock_command))
+        application.add_handler(CommandHandler("metrics", metrics_command))
         logger.info("Команды управления командой зарегистрированы")
         
+        # Ограничение частоты - до всех остальных обработчиков (группа -1)
+        application.add_handler(TypeHandler(Update, flood_guard), group=-1)
+        logger.info("Ограничение частоты обновлений зарегистрировано")
+        
         # Регистрируем глобальный фильтр спама для всех текстовых сообщений
         async def global_spam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
             """Глобальный фильтр спама для всех сообщений"""
@@ -1435,7 +1556,7 @@ def main():
                     if admin_id:
                         try:
                             msg = f"❌ Ошибка: {type(error).__name__}: {str(error)[:200]}"
-                            await context.bot.send_message(chat_id=admin_id, text=msg)
+                            await send_message(context, chat_id=admin_id, text=msg)
                         except Exception:
                             pass
         
@@ -1446,13 +1567,45 @@ def main():
         logger.info("Бот запущен и готов к работе!")
         logger.info("Ожидание команд...")
         
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        if WEBHOOK_URL or WEBHOOK_LOCAL:
+            run_webhook(application)
+        else:
+            application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
     except Exception as e:
         logger.error(f"КРИТИЧЕСКАЯ ОШИБКА при запуске бота: {e}", exc_info=True)
         raise
+    finally:
+        # Дожидаемся запросов к БД и закрываем пул соединений при остановке
+        adb.close()
+
+
+def run_webhook(application):
+    """
+    Запуск в режиме вебхука: локальный HTTP-сервер принимает POST с обновлениями от Telegram
+    Адрес регистрируется в Telegram автоматически (setWebhook); при остановке (SIGINT/SIGTERM)
+    сервер закрывается, затем отрабатывает post_shutdown (напоминания и очередь сообщений)
+    При WEBHOOK_LOCAL регистрация пропускается: обновления присылаются на сервер вручную
+    """
+    webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}" if WEBHOOK_URL else None
+    if WEBHOOK_LOCAL:
+        # PTB всегда вызывает setWebhook/deleteWebhook перед запуском сервера (Updater._bootstrap),
+        # а отдельного параметра, чтобы это отключить, нет
+        async def skip_bootstrap(*args, **kwargs):
+            logger.warning("WEBHOOK_LOCAL: вебхук в Telegram не регистрируется, обновления принимаются только вручную")
+        application.updater._bootstrap = skip_bootstrap
+    logger.info(f"Режим вебхука: слушаем {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}, адрес для Telegram: {webhook_url or '-'}")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=True
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,189 @@
+"""
+МОДУЛЬ ДЛЯ КОМПАКТНОГО КОДИРОВАНИЯ callback_data
+Telegram ограничивает callback_data 64 байтами, а кнопки вида work_done_{task_id}_{имя}
+или team_remove_confirm_{username} содержат имена и могут не поместиться.
+
+Компактный формат: "~" + код действия (1 символ) + base64url(поля)
+- целое число - varint (1 байт для чисел до 127)
+- строка - длина (varint) + UTF-8; если кнопка не помещается в 64 байта, строка кладется
+  в реестр на сервере (LRU в памяти), а в кнопку записывается номер записи и метка запуска
+
+decode_callback_data() возвращает для компактных данных CallbackAction(действие, значения)
+с уже типизированными значениями: маршрутизатор вызывает обработчик по коду действия и
+передает ему значения как есть, без склейки в строку и повторного разбора (имя "confirm_bob"
+не превратится в другую команду). Обычные строки (старые кнопки в уже отправленных
+сообщениях) возвращаются как есть и разбираются по шаблонам, как раньше.
+Записи реестра живут только в памяти процесса. Метка запуска (случайная при каждом старте)
+отличает номера записей прошлого запуска: после перезапуска такие кнопки считаются
+устаревшими, и пользователь получает сообщение об этом, а не чужие данные.
+"""
+
+import base64
+import logging
+import os
+import secrets
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+MAX_CALLBACK_BYTES = 64
+COMPACT_PREFIX = '~'
+CALLBACK_REGISTRY_SIZE = int(os.getenv('CALLBACK_REGISTRY_SIZE', '10000'))
+
+# Действие -> (код, типы полей). Коды не меняем и не переиспользуем: они уже есть в отправленных кнопках
+ACTIONS = {
+    'work_take': ('a', (int, str)),
+    'work_done': ('b', (int, str)),
+    'work_status': ('c', (int, str)),
+    'team_remove': ('d', (str,)),
+    'team_remove_confirm': ('e', (str,)),
+    'team_earned': ('f', (str,)),
+    'task_view': ('g', (int,)),
+}
+_BY_CODE = {code: (action, fields) for action, (code, fields) in ACTIONS.items()}
+
+# Раскодированная компактная кнопка: CallbackAction('work_take', (5, 'AG'))
+CallbackAction = namedtuple('CallbackAction', ['action', 'values'])
+
+EPOCH_BYTES = 4
+
+
+class PayloadRegistry:
+    """
+    Строки, не поместившиеся в кнопку: номер <-> строка, вытесняются самые давние
+    epoch - метка этого запуска; номера нумеруются заново при каждом старте, поэтому
+    ссылка на запись действительна только вместе с меткой
+    """
+
+    def __init__(self, size: int = CALLBACK_REGISTRY_SIZE):
+        self.size = size
+        self.epoch = secrets.token_bytes(EPOCH_BYTES)
+        self._by_key = OrderedDict()
+        self._by_value = {}
+        self._next_key = 0
+
+    def put(self, value: str) -> int:
+        key = self._by_value.get(value)
+        if key is not None:
+            self._by_key.move_to_end(key)
+            return key
+        key = self._next_key
+        self._next_key += 1
+        self._by_key[key] = value
+        self._by_value[value] = key
+        if len(self._by_key) > self.size:
+            _, old_value = self._by_key.popitem(last=False)
+            del self._by_value[old_value]
+        return key
+
+    def get(self, key: int):
+        value = self._by_key.get(key)
+        if value is not None:
+            self._by_key.move_to_end(key)
+        return value
+
+
+registry = PayloadRegistry()
+
+
+def _put_varint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError(f"Отрицательное число не кодируется: {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(raw: bytes, pos: int):
+    value = shift = 0
+    while True:
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _pack(fields, values, use_registry: bool) -> str:
+    out = bytearray()
+    for kind, value in zip(fields, values):
+        if kind is int:
+            _put_varint(out, int(value))
+        elif use_registry:
+            # Младший бит 1 - номер записи в реестре, за ним метка запуска
+            _put_varint(out, registry.put(str(value)) << 1 | 1)
+            out.extend(registry.epoch)
+        else:
+            raw = str(value).encode('utf-8')
+            _put_varint(out, len(raw) << 1)
+            out.extend(raw)
+    return base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode('ascii')
+
+
+def encode_callback_data(action: str, *values) -> str:
+    """
+    Компактный callback_data для действия из ACTIONS: encode_callback_data('work_take', 5, 'AG')
+    Целые числа должны быть неотрицательными (ValueError)
+    """
+    code, fields = ACTIONS[action]
+    if len(values) != len(fields):
+        raise ValueError(f"{action}: ожидается {len(fields)} полей, передано {len(values)}")
+    data = COMPACT_PREFIX + code + _pack(fields, values, use_registry=False)
+    if len(data.encode('utf-8')) > MAX_CALLBACK_BYTES:
+        data = COMPACT_PREFIX + code + _pack(fields, values, use_registry=True)
+    return data
+
+
+def decode_callback_data(data: str):
+    """
+    Компактные данные -> CallbackAction(действие, значения); обычные данные возвращаются как есть
+    None - если данные повреждены или запись реестра устарела (вытеснена или из прошлого запуска)
+    """
+    if not data or not data.startswith(COMPACT_PREFIX):
+        return data
+    entry = _BY_CODE.get(data[1:2])
+    if entry is None:
+        return None
+    action, fields = entry
+    try:
+        payload = data[2:]
+        raw = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        values = []
+        pos = 0
+        for kind in fields:
+            number, pos = _read_varint(raw, pos)
+            if kind is int:
+                values.append(number)
+            elif number & 1:
+                epoch = raw[pos:pos + EPOCH_BYTES]
+                pos += EPOCH_BYTES
+                value = registry.get(number >> 1) if epoch == registry.epoch else None
+                if value is None:
+                    return None
+                values.append(value)
+            else:
+                length = number >> 1
+                if pos + length > len(raw):
+                    return None
+                values.append(raw[pos:pos + length].decode('utf-8'))
+                pos += length
+        if pos != len(raw):
+            return None
+    except (ValueError, IndexError, UnicodeDecodeError):
+        logger.warning(f"Поврежденные данные кнопки: {data}")
+        return None
+    return CallbackAction(action, tuple(values))
+
+
+def callback_data_matches(data: str, action: str, *values) -> bool:
+    """Кнопка с данными data - это действие action с такими значениями (компактная или старая кнопка)"""
+    decoded = decode_callback_data(data)
+    if isinstance(decoded, CallbackAction):
+        return decoded == (action, values)
+    return decoded == '_'.join([action, *map(str, values)])
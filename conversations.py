@@ -7,6 +7,10 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from menu import get_assignee_menu, get_main_menu
+from reminders import reschedule_task_reminders
+from deadlines import deadline_timestamp
+from outbox import send_message, send_photo
+from callback_codec import encode_callback_data
 
 logger = logging.getLogger(__name__)
 
@@ -91,7 +95,7 @@ async def receive_weekly_task_text(update: Update, context: ContextTypes.DEFAULT
                 await update.message.reply_text("❌ Ошибка: база данных не найдена")
                 return -1
             
-            task_id = db.add_weekly_task(day, task_text)
+            task_id = await db.add_weekly_task(day, task_text)
             if task_id > 0:
                 day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
                 day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
@@ -217,12 +221,8 @@ async def receive_description(update: Update, context: ContextTypes.DEFAULT_TYPE
             "Выберите исполнителя задачи:"
         )
         
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
-        team = db_instance.get_team()
+        db_instance = context.bot_data['db']
+        team = await db_instance.get_team()
         assignee_buttons = []
         row = []
         for member in team:
@@ -257,12 +257,8 @@ async def skip_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             "Выберите исполнителя задачи:"
         )
         
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
-        team = db_instance.get_team()
+        db_instance = context.bot_data['db']
+        team = await db_instance.get_team()
         assignee_buttons = []
         row = []
         for member in team:
@@ -371,13 +367,8 @@ async def receive_assignee(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         
         assignee = parts[1]
         
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
-        valid_initials = db_instance.get_team_initials()
-        if assignee not in valid_initials + ["all"]:
+        db_instance = context.bot_data['db']
+        if assignee != "all" and not await db_instance.is_team_member_name(assignee):
             await update.callback_query.answer("❌ Неверный выбор исполнителя", show_alert=True)
             return ASSIGNEE
         
@@ -461,16 +452,17 @@ async def finish_create_task(update: Update, context: ContextTypes.DEFAULT_TYPE)
         creator = user.username if user.username else f"user_{user.id}"
         
         # Сохраняем задачу в БД
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
+        db_instance = context.bot_data['db']
         
-        task_id = db_instance.save_custom_task(title, description, deadline, assignee, creator)
+        # Срок разбирается один раз - при создании ("сегодня" = день создания)
+        task_id = await db_instance.save_custom_task(
+            title, description, deadline, assignee, creator,
+            deadline_ts=deadline_timestamp(deadline)
+        )
+        await reschedule_task_reminders(context, task_id)
         
         if task_id:
-            team_initials = db_instance.get_team_initials()
+            team_initials = await db_instance.get_team_initials()
             assignee_names = {code: code for code in team_initials}
             assignee_names["all"] = "Все"
             
@@ -522,18 +514,19 @@ async def finish_create_task(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     if assignee == "all":
                         row = []
                         for code in team_initials:
-                            row.append(InlineKeyboardButton(f"👤 {code} - Взять", callback_data=f"work_take_{task_id}_{code}"))
+                            row.append(InlineKeyboardButton(f"👤 {code} - Взять", callback_data=encode_callback_data("work_take", task_id, code)))
                         if row:
                             work_buttons.append(row)
                     else:
                         assignee_full = assignee_names.get(assignee, assignee)
-                        work_buttons = [[InlineKeyboardButton(f"👤 {assignee_full} - Взять в работу", callback_data=f"work_take_{task_id}_{assignee}")]]
+                        work_buttons = [[InlineKeyboardButton(f"👤 {assignee_full} - Взять в работу", callback_data=encode_callback_data("work_take", task_id, assignee))]]
                     
                     work_keyboard = InlineKeyboardMarkup(work_buttons)
                     
                     # Отправляем в группу (без фото)
                     try:
-                        await context.bot.send_message(
+                        await send_message(
+                            context,
                             chat_id=chat_id,
                             text=group_text,
                             reply_markup=work_keyboard,
@@ -608,12 +601,8 @@ async def start_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # Получаем задачу из БД
         # Используем глобальный экземпляр db из context.bot_data
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        task = db.get_custom_task(task_id)
+        db = context.bot_data['db']
+        task = await db.get_custom_task(task_id)
         
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
@@ -624,7 +613,9 @@ async def start_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             'title': task['title'],
             'description': task.get('description', ''),
             'deadline': task.get('deadline', ''),
-            'assignee': task.get('assignee', 'all')
+            'assignee': task.get('assignee', 'all'),
+            'original_deadline': task.get('deadline', ''),
+            'deadline_ts': task.get('deadline_ts')
         }
         
         text = (
@@ -799,12 +790,8 @@ async def receive_edit_deadline(update: Update, context: ContextTypes.DEFAULT_TY
             f"Выберите нового исполнителя задачи:"
         )
         
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
-        team = db_instance.get_team()
+        db_instance = context.bot_data['db']
+        team = await db_instance.get_team()
         assignee_buttons = []
         row = []
         for member in team:
@@ -837,12 +824,8 @@ async def skip_edit_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"Выберите нового исполнителя задачи:"
         )
         
-        if 'db' in context.bot_data:
-            db_instance = context.bot_data['db']
-        else:
-            from database import Database
-            db_instance = Database()
-        team = db_instance.get_team()
+        db_instance = context.bot_data['db']
+        team = await db_instance.get_team()
         assignee_buttons = []
         row = []
         for member in team:
@@ -877,13 +860,8 @@ async def receive_edit_assignee(update: Update, context: ContextTypes.DEFAULT_TY
         
         assignee = parts[1]
         
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        valid_initials = db.get_team_initials()
-        if assignee not in valid_initials + ["all"]:
+        db = context.bot_data['db']
+        if assignee != "all" and not await db.is_team_member_name(assignee):
             await update.callback_query.answer("❌ Неверный выбор исполнителя", show_alert=True)
             return EDIT_ASSIGNEE
         
@@ -895,18 +873,20 @@ async def receive_edit_assignee(update: Update, context: ContextTypes.DEFAULT_TY
         
         # Обновляем задачу в БД
         # Используем глобальный экземпляр db из context.bot_data
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        db.update_custom_task(
+        db = context.bot_data['db']
+        # Срок разбираем заново, только если его изменили - иначе "сегодня до ..." сдвинулся бы на день правки
+        deadline_ts = task_data.get('deadline_ts')
+        if task_data.get('deadline') != task_data.get('original_deadline'):
+            deadline_ts = deadline_timestamp(task_data.get('deadline'))
+        await db.update_custom_task(
             task_id,
             title=task_data.get('title'),
             description=task_data.get('description'),
             deadline=task_data.get('deadline'),
+            deadline_ts=deadline_ts,
             assignee=task_data.get('assignee')
         )
+        await reschedule_task_reminders(context, task_id)
         
         assignee_names = {
             "AG": "Lysenko Alexander",
@@ -993,12 +973,8 @@ async def start_complete_task(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Получаем задачу из БД
         # Используем глобальный экземпляр db из context.bot_data
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        task = db.get_custom_task(task_id)
+        db = context.bot_data['db']
+        task = await db.get_custom_task(task_id)
         
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
@@ -1110,20 +1086,17 @@ async def receive_complete_photo(update: Update, context: ContextTypes.DEFAULT_T
         # Обновляем задачу в БД
         # Используем глобальный экземпляр db из context.bot_data
         from datetime import datetime
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        db.update_custom_task(
+        db = context.bot_data['db']
+        await db.update_custom_task(
             task_id,
             status='completed',
             completed_at=datetime.now().isoformat(),
             result_text=result_text if result_text else None,
             result_photo=photo_file_id if photo_file_id else None
         )
+        await reschedule_task_reminders(context, task_id)
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         
         text = (
             f"✅ **ЗАДАЧА ЗАВЕРШЕНА!**\n\n"
@@ -1173,20 +1146,17 @@ async def skip_complete_photo(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Обновляем задачу в БД
         # Используем глобальный экземпляр db из context.bot_data
         from datetime import datetime
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        db.update_custom_task(
+        db = context.bot_data['db']
+        await db.update_custom_task(
             task_id,
             status='completed',
             completed_at=datetime.now().isoformat(),
             result_text=result_text if result_text else None,
             result_photo=None
         )
+        await reschedule_task_reminders(context, task_id)
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         
         text = (
             f"✅ **ЗАДАЧА ЗАВЕРШЕНА!**\n\n"
@@ -1238,18 +1208,15 @@ async def complete_fast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         # Обновляем задачу в БД
         # Используем глобальный экземпляр db из context.bot_data
         from datetime import datetime
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
-        db.update_custom_task(
+        db = context.bot_data['db']
+        await db.update_custom_task(
             task_id,
             status='completed',
             completed_at=datetime.now().isoformat()
         )
+        await reschedule_task_reminders(context, task_id)
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         
         text = (
             f"✅ **ЗАДАЧА ЗАВЕРШЕНА!**\n\n"
@@ -1468,20 +1435,16 @@ async def finish_add_employee(update: Update, context: ContextTypes.DEFAULT_TYPE
             # Пытаемся получить user_id из базы данных, если пользователь уже есть
             if 'db' in context.bot_data:
                 db = context.bot_data['db']
-                user_id = db.get_user_id_by_username(username)
+                user_id = await db.get_user_id_by_username(username)
         except:
             pass
         
         # Сохраняем сотрудника в БД
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
+        db = context.bot_data['db']
         
         # Сохраняем (user_id может быть None, если пользователь еще не взаимодействовал с ботом)
         # Используем initials как name (для обратной совместимости)
-        db.save_user_id(username, user_id, initials)
+        await db.save_user_id(username, user_id, initials)
         
         text = (
             f"✅ **СОТРУДНИК ДОБАВЛЕН!**\n\n"
@@ -1564,13 +1527,9 @@ async def start_work_task(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return -1
         
         # Получаем задачу из БД
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
+        db = context.bot_data['db']
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
             return -1
@@ -1602,7 +1561,8 @@ async def start_work_task(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Это группа - отправляем в личные сообщения
             try:
                 user = query.from_user
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=user.id,
                     text=text,
                     reply_markup=keyboard,
@@ -1650,7 +1610,8 @@ async def work_done_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             # Это группа - отправляем в личные сообщения
             try:
                 user = query.from_user
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=user.id,
                     text=text,
                     reply_markup=keyboard,
@@ -1703,7 +1664,8 @@ async def receive_work_result(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_id = user.id if user else None
         
         if user_id:
-            await context.bot.send_message(
+            await send_message(
+                context,
                 chat_id=user_id,
                 text=text,
                 reply_markup=keyboard,
@@ -1765,21 +1727,18 @@ async def receive_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Обновляем задачу в БД
         from datetime import datetime
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
+        db = context.bot_data['db']
         
-        db.update_custom_task(
+        await db.update_custom_task(
             task_id,
             status='completed',
             completed_at=datetime.now().isoformat(),
             result_text=result_text,
             result_photo=photo_file_id if photo_file_id else None
         )
+        await reschedule_task_reminders(context, task_id)
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         user = update.effective_user
         username = user.username if user.username else f"user_{user.id}"
         
@@ -1798,7 +1757,7 @@ async def receive_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     admin_username = os.getenv('ADMIN_USERNAME', '').strip()
                 
                 if admin_username:
-                    admin_id = db.get_user_id_by_username(admin_username)
+                    admin_id = await db.get_user_id_by_username(admin_username)
                     if admin_id:
                         context.bot_data['admin_id'] = admin_id
             
@@ -1814,14 +1773,16 @@ async def receive_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 
                 # Если есть фото, отправляем его администратору
                 if photo_file_id:
-                    await context.bot.send_photo(
+                    await send_photo(
+                        context,
                         chat_id=admin_id,
                         photo=photo_file_id,
                         caption=admin_text,
                         parse_mode='Markdown'
                     )
                 else:
-                    await context.bot.send_message(
+                    await send_message(
+                        context,
                         chat_id=admin_id,
                         text=admin_text,
                         parse_mode='Markdown'
@@ -1851,7 +1812,8 @@ async def receive_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Если есть фото, отправляем его вместе с текстом в личные сообщения пользователю
         if photo_file_id:
-            await context.bot.send_photo(
+            await send_photo(
+                context,
                 chat_id=user_id,
                 photo=photo_file_id,
                 caption=text,
@@ -1859,7 +1821,8 @@ async def receive_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 parse_mode='Markdown'
             )
         else:
-            await context.bot.send_message(
+            await send_message(
+                context,
                 chat_id=user_id,
                 text=text,
                 reply_markup=keyboard,
@@ -1890,21 +1853,18 @@ async def skip_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # Обновляем задачу в БД
         from datetime import datetime
-        if 'db' in context.bot_data:
-            db = context.bot_data['db']
-        else:
-            from database import Database
-            db = Database()
+        db = context.bot_data['db']
         
-        db.update_custom_task(
+        await db.update_custom_task(
             task_id,
             status='completed',
             completed_at=datetime.now().isoformat(),
             result_text=result_text,
             result_photo=None
         )
+        await reschedule_task_reminders(context, task_id)
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         user = query.from_user
         username = user.username if user.username else f"user_{user.id}"
         
@@ -1923,7 +1883,7 @@ async def skip_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     admin_username = os.getenv('ADMIN_USERNAME', '').strip()
                 
                 if admin_username:
-                    admin_id = db.get_user_id_by_username(admin_username)
+                    admin_id = await db.get_user_id_by_username(admin_username)
                     if admin_id:
                         context.bot_data['admin_id'] = admin_id
             
@@ -1935,7 +1895,8 @@ async def skip_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     f"📄 Описание работы: {result_text}\n\n"
                     f"ID задачи: #{task_id}"
                 )
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=admin_id,
                     text=admin_text,
                     parse_mode='Markdown'
@@ -1961,7 +1922,8 @@ async def skip_work_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         if user_id:
             try:
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=user_id,
                     text=text,
                     reply_markup=keyboard,
@@ -2100,7 +2062,7 @@ async def receive_team_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ Ошибка: база данных не найдена")
             return -1
         
-        db.save_user(username, name)
+        await db.save_user(username, name)
         from menu import get_team_menu
         text = f"✅ **СОТРУДНИК ДОБАВЛЕН**\n\n@{username} ({name}) успешно добавлен в команду."
         await update.message.reply_text(text, reply_markup=get_team_menu(), parse_mode='Markdown')
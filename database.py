@@ -5,295 +5,1091 @@
 
 import sqlite3
 import os
+import asyncio
+import functools
+import json
 import logging
-from threading import Lock
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Condition, Lock
 
 # Настройка логирования для модуля database
 logger_db = logging.getLogger(__name__)
 
+# Размер пула соединений по умолчанию (можно переопределить через DB_POOL_SIZE)
+DEFAULT_POOL_SIZE = 5
+
+
+def _env_int(name: str, default: int) -> int:
+    """Читает целое число из переменной окружения"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logger_db.warning(f"Некорректное значение {name}, используется {default}")
+        return default
+
+
+# Настройки SQLite, применяемые при старте (переопределяются переменными окружения)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL').strip().upper()
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').strip().upper()
+DB_CACHE_SIZE_KB = _env_int('DB_CACHE_SIZE_KB', 8192)  # 8 МБ страничного кэша на соединение
+DB_MMAP_SIZE = _env_int('DB_MMAP_SIZE', 64 * 1024 * 1024)  # 64 МБ memory-mapped I/O
+
+# Сколько дней хранить историю чек-листов (0 - хранить бессрочно)
+CHECKLIST_HISTORY_DAYS = _env_int('CHECKLIST_HISTORY_DAYS', 180)
+
+# Сколько дней хранить журнал отправленных напоминаний и сколько ключей держать в памяти
+REMINDER_LEDGER_DAYS = _env_int('REMINDER_LEDGER_DAYS', 30)
+REMINDER_CACHE_SIZE = _env_int('REMINDER_CACHE_SIZE', 1024)
+
+# Сколько отправленных чек-листов (сообщений) держать в памяти
+CHECKLIST_MESSAGE_CACHE_SIZE = _env_int('CHECKLIST_MESSAGE_CACHE_SIZE', 256)
+
+
+class ReadWriteLock:
+    """
+    Блокировка читатели/писатели для доступа к БД
+    read() - совместный доступ, читатели работают параллельно
+    write() - писатели выполняются строго по одному; в режиме WAL читатели им не мешают
+    exclusive() - монопольный доступ (создание таблиц и миграции)
+    """
+    
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._writer_lock = Lock()
+        self._active = 0
+        self._exclusive = False
+        self._waiting_exclusive = 0
+        # Пока WAL не включен, запись должна исключать чтение (rollback journal)
+        self.concurrent_reads = False
+    
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._exclusive or self._waiting_exclusive:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if self._active == 0:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        if not self.concurrent_reads:
+            with self.exclusive():
+                yield
+            return
+        with self.read():
+            with self._writer_lock:
+                yield
+    
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._waiting_exclusive += 1
+            try:
+                while self._exclusive or self._active:
+                    self._cond.wait()
+            finally:
+                self._waiting_exclusive -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
 # Блокировка для безопасной работы с базой данных
-db_lock = Lock()
+db_lock = ReadWriteLock()
+
+
+class ConnectionPool:
+    """
+    Пул постоянных соединений с SQLite
+    Соединения создаются лениво (не больше size штук) и переиспользуются,
+    чтобы не платить за connect/close на каждый запрос
+    """
+    
+    def __init__(self, db_path: str, size: int = DEFAULT_POOL_SIZE, timeout: float = 10.0,
+                 health_check_interval: float = 30.0, pragmas: list = None):
+        """
+        db_path - путь к файлу базы данных
+        size - максимальное количество открытых соединений
+        timeout - сколько ждать свободное соединение (и блокировку SQLite)
+        health_check_interval - через сколько секунд простоя проверять соединение перед выдачей
+        pragmas - PRAGMA, выполняемые на каждом новом соединении
+        """
+        self.db_path = db_path
+        self.pragmas = list(pragmas or [])
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._last_used = {}
+        self._created = 0
+        self._lock = Lock()
+        self._closed = False
+    
+    def _connect(self):
+        """Открывает новое соединение с базой данных"""
+        # Используем timeout для предотвращения блокировок
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=self.timeout)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+    
+    def _is_healthy(self, conn) -> bool:
+        """Проверяет, что соединение живое"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def acquire(self):
+        """Берет соединение из пула (или создает новое, если лимит не исчерпан)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError("Нет свободных соединений в пуле")
+        
+        # Проверяем соединение, только если оно долго простаивало
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for > self.health_check_interval and not self._is_healthy(conn):
+            logger_db.warning("Соединение из пула не прошло проверку, переподключаемся")
+            self._discard(conn)
+            with self._lock:
+                self._created += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return conn
+    
+    def release(self, conn):
+        """Возвращает соединение в пул"""
+        try:
+            # Незавершенная транзакция не должна достаться следующему запросу
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger_db.warning(f"Соединение сломано при возврате в пул: {e}")
+            self._discard(conn)
+            return
+        
+        if self._closed:
+            self._discard(conn)
+            return
+        
+        self._last_used[id(conn)] = time.monotonic()
+        self._idle.put(conn)
+    
+    def _discard(self, conn):
+        """Закрывает соединение и освобождает место в пуле"""
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+    
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: with pool.connection() as conn: ..."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """Закрывает все свободные соединения; занятые закроются при возврате"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+# ========== МИГРАЦИИ СХЕМЫ ==========
+# Каждая миграция выполняется один раз; номер последней примененной хранится в schema_version.
+# Миграции написаны идемпотентно (IF NOT EXISTS, проверка колонок), поэтому старые базы,
+# созданные до появления schema_version, проходят их без ошибок.
+
+# Начальные еженедельные задачи (раньше хранились в tasks.py)
+INITIAL_WEEKLY_TASKS = {
+    0: [  # ПОНЕДЕЛЬНИК
+        "Проверить календарь в почте спланировать день",
+        "Выгрузить инвенту, провести анализ",
+        "Просмотреть 40 графану на наличие фруода",
+        "Просмотреть графану 73 на наличие с2с",
+        "Провести обход совместно с менеджером сц",
+        "Проверить пазл на наличие заявок близких к просроку",
+        "На основе анализа составить план отработки",
+        "Заполнить отчеты, написать письма"
+    ],
+    1: [  # ВТОРНИК
+        "Проверить календарь в почте спланировать день",
+        "Подготовиться к встрече",
+        "Отработка фрода",
+        "Просмотр 39 графаны",
+        "Просмотреть графану 73 на наличие с2с",
+        "Проверить наличие с2с в недостачах",
+        "Заполнить отчеты, написать письма"
+    ],
+    2: [  # СРЕДА
+        "Проверить календарь в почте спланировать день",
+        "Выставление ШС озон джоб",
+        "Провести обход совместно с менеджером сц",
+        "Просмотреть графану 73 на наличие с2с",
+        "Проверка проведения инвентаризации операциями",
+        "Проверка зоны обезлички",
+        "Заполнить отчеты, написать письма"
+    ],
+    3: [  # ЧЕТВЕРГ
+        "Проверить календарь в почте спланировать день",
+        "Отработка фрода",
+        "Просмотр 39 графаны",
+        "Просмотреть графану 73 на наличие с2с",
+        "Предварительные итоги разбора недостач с операциями",
+        "Заполнить отчеты, написать письма"
+    ],
+    4: [  # ПЯТНИЦА
+        "Проверить календарь в почте спланировать день",
+        "Проверить пазл на наличие заявок близких к просроку",
+        "Просмотреть графану 73 на наличие с2с",
+        "Выставление ШС озон джоб",
+        "Заполнить отчеты, написать письма"
+    ]
+}
+
+# Начальные сотрудники: (username, user_id, name)
+INITIAL_USERS = [
+    ('alex301182', None, 'Vesenko, Aleksandr'),
+    ('Korudirp', None, 'Cherenkov, Ruslan')
+]
+
+
+def _table_columns(cursor, table: str) -> list:
+    """Список колонок таблицы"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _migrate_base_tables(cursor):
+    """Создает основные таблицы"""
+    # Таблица для статусов задач
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_statuses (
+            task_key TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT '⚪'
+        )
+    ''')
+    
+    # Таблица для хранения ID пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            user_id INTEGER,
+            name TEXT NOT NULL
+        )
+    ''')
+    
+    # Таблица для новых задач (созданных через меню)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS custom_tasks (
+            task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            deadline TEXT,
+            assignee TEXT,
+            creator TEXT NOT NULL,
+            status TEXT DEFAULT 'active',
+            created_at TEXT NOT NULL,
+            completed_at TEXT,
+            result_text TEXT,
+            result_photo TEXT,
+            completed_assignees TEXT,
+            in_progress_assignees TEXT
+        )
+    ''')
+    
+    # Таблица для еженедельных задач
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day INTEGER NOT NULL,
+            task_text TEXT NOT NULL,
+            task_order INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    
+    # Таблица для отметок присутствия
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presence (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT NOT NULL,
+            time TEXT,
+            delay_minutes INTEGER,
+            reason TEXT,
+            created_at TEXT NOT NULL,
+            UNIQUE(username, date)
+        )
+    ''')
+    
+    # Таблица для блокировки спамеров
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blocked_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            reason TEXT,
+            blocked_at TEXT NOT NULL
+        )
+    ''')
+    
+    # Таблица для логирования спам-попыток
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spam_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            message_text TEXT,
+            detected_at TEXT NOT NULL
+        )
+    ''')
+
+
+def _migrate_users_name_column(cursor):
+    """Добавляет колонку name в users (старые базы хранили инициалы в initials)"""
+    columns = _table_columns(cursor, 'users')
+    if 'name' in columns:
+        return
+    cursor.execute('ALTER TABLE users ADD COLUMN name TEXT')
+    # Если есть колонка initials, копируем данные из initials в name
+    if 'initials' in columns:
+        cursor.execute('UPDATE users SET name = initials WHERE name IS NULL OR name = ""')
+
+
+def _migrate_rename_users(cursor):
+    """Переименовывает существующих пользователей в полные имена"""
+    # Lysenko Alexander -> Vesenko, Aleksandr
+    cursor.execute("UPDATE users SET name = 'Vesenko, Aleksandr' WHERE name = 'AG' OR name = 'Lysenko Alexander' OR username LIKE '%vesenko%' OR username LIKE '%lysenko%'")
+    # Cherykov Ruslan -> Cherenkov, Ruslan
+    cursor.execute("UPDATE users SET name = 'Cherenkov, Ruslan' WHERE name = 'KA' OR name = 'Cherykov Ruslan' OR username LIKE '%cherykov%' OR username LIKE '%cherenkov%'")
+
+
+def _migrate_custom_tasks_assignees(cursor):
+    """Добавляет в custom_tasks списки исполнителей (в работе / завершили)"""
+    columns = _table_columns(cursor, 'custom_tasks')
+    if 'completed_assignees' not in columns:
+        cursor.execute('ALTER TABLE custom_tasks ADD COLUMN completed_assignees TEXT')
+    if 'in_progress_assignees' not in columns:
+        cursor.execute('ALTER TABLE custom_tasks ADD COLUMN in_progress_assignees TEXT')
+
+
+def _migrate_seed_weekly_tasks(cursor):
+    """Заполняет еженедельные задачи, если таблица пуста"""
+    cursor.execute('SELECT COUNT(*) FROM weekly_tasks')
+    if cursor.fetchone()[0] > 0:
+        return
+    from datetime import datetime
+    now = datetime.now().isoformat()
+    cursor.executemany('''
+        INSERT INTO weekly_tasks (day, task_text, task_order, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', [
+        (day, task_text, order, now)
+        for day, tasks in INITIAL_WEEKLY_TASKS.items()
+        for order, task_text in enumerate(tasks)
+    ])
+
+
+def _migrate_seed_users(cursor):
+    """Добавляет начальных пользователей, если их еще нет"""
+    cursor.executemany('''
+        INSERT OR IGNORE INTO users (username, user_id, name)
+        VALUES (?, ?, ?)
+    ''', INITIAL_USERS)
+
+
+def _migrate_checklist_by_date(cursor):
+    """
+    Статусы чек-листа с привязкой к дате: (дата, id еженедельной задачи, исполнитель)
+    Старая таблица task_statuses хранила ключи "{день}_{номер}_{исполнитель}" без даты,
+    поэтому отметки прошлой недели всплывали снова. Переносятся только отметки сегодняшнего
+    дня недели (под сегодняшней датой), остальные отбрасываются - их дату уже не восстановить
+    """
+    # Оперативная таблица - только текущие дни, переносится в историю при смене суток
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS checklist_statuses (
+            date TEXT NOT NULL,
+            weekly_task_id INTEGER NOT NULL,
+            member TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT '⚪',
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (date, weekly_task_id, member)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Архив прошедших дней - только отмеченные статусы (⚪ не хранится)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS checklist_history (
+            date TEXT NOT NULL,
+            weekly_task_id INTEGER NOT NULL,
+            member TEXT NOT NULL,
+            status TEXT NOT NULL,
+            PRIMARY KEY (date, weekly_task_id, member)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checklist_history_member
+        ON checklist_history (member, date)
+    ''')
+    
+    _backfill_task_statuses(cursor)
+    cursor.execute('DROP TABLE IF EXISTS task_statuses')
+
+
+def _backfill_task_statuses(cursor, today=None):
+    """
+    Переносит отметки сегодняшнего дня недели из task_statuses в checklist_statuses
+    today - дата (по умолчанию сегодня по Москве)
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_statuses'")
+    if cursor.fetchone() is None:
+        return
+    cursor.execute('SELECT COUNT(*) FROM task_statuses')
+    total = cursor.fetchone()[0]
+    if not total:
+        return
+
+    from datetime import datetime
+    if today is None:
+        from deadlines import MOSCOW_TZ
+        today = datetime.now(MOSCOW_TZ).date()
+    day = today.weekday()
+    now = datetime.now().isoformat()
+
+    # Номер задачи в ключе - позиция в списке дня (с 1), как в get_weekly_tasks
+    cursor.execute('SELECT id FROM weekly_tasks WHERE day = ? ORDER BY task_order', (day,))
+    weekly_task_ids = [row[0] for row in cursor.fetchall()]
+    prefix = f"{day}_"
+    cursor.execute(
+        'SELECT task_key, status FROM task_statuses WHERE task_key >= ? AND task_key < ?',
+        (prefix, prefix + '￿')
+    )
+    rows = []
+    for task_key, status in cursor.fetchall():
+        number, _, member = task_key[len(prefix):].partition('_')
+        if not number.isdigit() or not member or status == '⚪':
+            continue
+        if 1 <= int(number) <= len(weekly_task_ids):
+            rows.append((today.isoformat(), weekly_task_ids[int(number) - 1], member, status, now))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO checklist_statuses (date, weekly_task_id, member, status, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    logger_db.warning(
+        f"Миграция task_statuses: перенесено {len(rows)} отметок за {today.isoformat()}, "
+        f"отброшено {total - len(rows)} записей без даты (прошлые дни недели и пустые статусы)"
+    )
+
+
+def _migrate_reminder_ledger(cursor):
+    """Журнал отправленных напоминаний о задачах (защита от повторов после перезапуска)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_ledger (
+            task_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            sent_at TEXT NOT NULL,
+            PRIMARY KEY (task_id, kind, slot)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminder_ledger_sent_at
+        ON reminder_ledger (sent_at)
+    ''')
+
+
+def _migrate_checklist_messages(cursor):
+    """
+    Отправленные сообщения с чек-листом: (чат, сообщение) -> дата, день и задачи по порядку кнопок
+    tasks - JSON-список [[weekly_task_id, текст], ...]
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS checklist_messages (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            tasks TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checklist_messages_date
+        ON checklist_messages (date)
+    ''')
+
+
+def _migrate_custom_tasks_deadline_ts(cursor):
+    """
+    Добавляет в custom_tasks разобранный срок deadline_ts (UTC timestamp) с индексом
+    Для существующих задач "сегодня" считается от даты создания задачи
+    """
+    if 'deadline_ts' not in _table_columns(cursor, 'custom_tasks'):
+        cursor.execute('ALTER TABLE custom_tasks ADD COLUMN deadline_ts INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_custom_tasks_deadline_ts
+        ON custom_tasks (deadline_ts)
+    ''')
+    
+    from datetime import datetime
+    from deadlines import deadline_timestamp
+    cursor.execute('''
+        SELECT task_id, deadline, created_at FROM custom_tasks
+        WHERE deadline_ts IS NULL AND deadline IS NOT NULL AND deadline != ''
+    ''')
+    updates = []
+    for task_id, deadline, created_at in cursor.fetchall():
+        try:
+            reference = datetime.fromisoformat(created_at).date()
+        except (TypeError, ValueError):
+            reference = None
+        deadline_ts = deadline_timestamp(deadline, reference)
+        if deadline_ts is not None:
+            updates.append((deadline_ts, task_id))
+    cursor.executemany('UPDATE custom_tasks SET deadline_ts = ? WHERE task_id = ?', updates)
+
+
+# Упорядоченный список миграций: (версия, описание, функция)
+# Новые миграции добавляются только в конец, номера не переиспользуются
+MIGRATIONS = [
+    (1, "основные таблицы", _migrate_base_tables),
+    (2, "колонка users.name", _migrate_users_name_column),
+    (3, "переименование пользователей", _migrate_rename_users),
+    (4, "исполнители custom_tasks", _migrate_custom_tasks_assignees),
+    (5, "начальные еженедельные задачи", _migrate_seed_weekly_tasks),
+    (6, "начальные пользователи", _migrate_seed_users),
+    (7, "статусы чек-листа по датам", _migrate_checklist_by_date),
+    (8, "журнал напоминаний", _migrate_reminder_ledger),
+    (9, "разобранный срок custom_tasks", _migrate_custom_tasks_deadline_ts),
+    (10, "сообщения с чек-листами", _migrate_checklist_messages),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# Колонки custom_tasks в порядке, в котором их читают get_custom_task / get_custom_tasks
+CUSTOM_TASK_COLUMNS = (
+    'task_id', 'title', 'description', 'deadline', 'assignee', 'creator',
+    'status', 'created_at', 'completed_at', 'result_text', 'result_photo',
+    'completed_assignees', 'in_progress_assignees', 'deadline_ts'
+)
+CUSTOM_TASK_FIELDS = ', '.join(CUSTOM_TASK_COLUMNS)
+
+
+def _custom_task_from_row(row) -> dict:
+    """Строка custom_tasks -> словарь задачи"""
+    task = dict(zip(CUSTOM_TASK_COLUMNS, row))
+    task['completed_assignees'] = task['completed_assignees'] or ''
+    task['in_progress_assignees'] = task['in_progress_assignees'] or ''
+    return task
 
 
 class Database:
     """Класс для работы с базой данных"""
     
-    def __init__(self, db_path='bot_database.db'):
+    def __init__(self, db_path='bot_database.db', pool_size: int = None):
         """
         Инициализация базы данных
         db_path - путь к файлу базы данных
+        pool_size - размер пула соединений (по умолчанию DB_POOL_SIZE или 5)
         """
         self.db_path = db_path
+        # Схема таблицы users определяется один раз в init_database
+        self.users_name_column = None
+        self._users_sql = {}
+        # ID заблокированных пользователей - держим в памяти, чтобы не ходить в БД на каждое сообщение
+        self._blocked_ids = set()
+        # Кэш состава команды: списки и индексы по username, user_id и имени (см. _reload_roster)
+        self._roster = {'members': [], 'by_username': {}, 'by_user_id': {}, 'by_name': {}}
+        # Недавно отправленные напоминания: (task_id, kind, slot) -> True, порядок - по давности
+        self._reminder_cache = OrderedDict()
+        self._reminder_cache_lock = Lock()
+        # Отправленные чек-листы: (chat_id, message_id) -> модель сообщения (см. get_checklist_message)
+        self._checklist_messages = OrderedDict()
+        self._checklist_messages_lock = Lock()
+        if pool_size is None:
+            pool_size = _env_int('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.pool = ConnectionPool(db_path, size=pool_size, pragmas=[
+            f"PRAGMA synchronous={DB_SYNCHRONOUS}",
+            f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}",
+            f"PRAGMA mmap_size={DB_MMAP_SIZE}",
+        ])
+        self.configure_database()
         self.init_database()
+        self.load_blocked_users()
+    
+    def configure_database(self):
+        """
+        Настраивает журнал SQLite при старте
+        В режиме WAL чтения идут параллельно с записью и не ждут её
+        """
+        try:
+            with db_lock.exclusive():
+                conn = self.pool.acquire()
+                try:
+                    mode = conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}").fetchone()[0]
+                finally:
+                    self.pool.release(conn)
+            db_lock.concurrent_reads = str(mode).upper() == 'WAL'
+            logger_db.info(
+                f"SQLite: journal_mode={mode}, synchronous={DB_SYNCHRONOUS}, "
+                f"cache={DB_CACHE_SIZE_KB} КБ, mmap={DB_MMAP_SIZE} байт"
+            )
+        except Exception as e:
+            logger_db.error(f"Ошибка настройки журнала SQLite: {e}", exc_info=True)
     
     def get_connection(self):
-        """Создает соединение с базой данных"""
+        """
+        Создает отдельное (не пуловое) соединение с базой данных
+        Вызывающий код сам закрывает его; для обычных запросов используйте connection()
+        """
         # Используем timeout для предотвращения блокировок
         return sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0)
     
+    def connection(self):
+        """Соединение из пула: with db.connection() as conn: ..."""
+        return self.pool.connection()
+    
+    def close(self):
+        """Закрывает пул соединений (вызывается при остановке бота)"""
+        self.pool.close()
+        logger_db.info("Пул соединений с БД закрыт")
+    
     def init_database(self):
-        """Создает таблицы в базе данных, если их еще нет"""
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Таблица для статусов задач
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS task_statuses (
-                        task_key TEXT PRIMARY KEY,
-                        status TEXT NOT NULL DEFAULT '⚪'
-                    )
-                ''')
-                
-                # Таблица для хранения ID пользователей
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        username TEXT PRIMARY KEY,
-                        user_id INTEGER,
-                        name TEXT NOT NULL
-                    )
-                ''')
-                
-                # Миграция: добавляем колонку name, если её нет
-                # Проверяем, какие колонки уже есть
-                cursor.execute("PRAGMA table_info(users)")
-                existing_columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'name' not in existing_columns:
-                    try:
-                        cursor.execute('ALTER TABLE users ADD COLUMN name TEXT')
-                        # Если есть колонка initials, копируем данные из initials в name
-                        if 'initials' in existing_columns:
-                            cursor.execute('UPDATE users SET name = initials WHERE name IS NULL OR name = ""')
-                    except sqlite3.OperationalError as e:
-                        logger_db.warning(f"Ошибка добавления колонки name: {e}")
-                
-                # Миграция: переименовываем существующих пользователей
-                try:
-                    # Lysenko Alexander -> Vesenko, Aleksandr
-                    cursor.execute("UPDATE users SET name = 'Vesenko, Aleksandr' WHERE name = 'AG' OR name = 'Lysenko Alexander' OR username LIKE '%vesenko%' OR username LIKE '%lysenko%'")
-                    # Cherykov Ruslan -> Cherenkov, Ruslan
-                    cursor.execute("UPDATE users SET name = 'Cherenkov, Ruslan' WHERE name = 'KA' OR name = 'Cherykov Ruslan' OR username LIKE '%cherykov%' OR username LIKE '%cherenkov%'")
-                    conn.commit()
-                except Exception as e:
-                    logger_db.warning(f"Ошибка миграции имен пользователей: {e}")
-                
-                # Таблица для новых задач (созданных через меню)
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS custom_tasks (
-                        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        title TEXT NOT NULL,
-                        description TEXT,
-                        deadline TEXT,
-                        assignee TEXT,
-                        creator TEXT NOT NULL,
-                        status TEXT DEFAULT 'active',
-                        created_at TEXT NOT NULL,
-                        completed_at TEXT,
-                        result_text TEXT,
-                        result_photo TEXT,
-                        completed_assignees TEXT,
-                        in_progress_assignees TEXT
-                    )
-                ''')
-                
-                # Добавляем поля, если их еще нет
-                # Таблица для еженедельных задач
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS weekly_tasks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        day INTEGER NOT NULL,
-                        task_text TEXT NOT NULL,
-                        task_order INTEGER DEFAULT 0,
-                        created_at TEXT NOT NULL
-                    )
-                ''')
-                
-                # Инициализация еженедельных задач, если таблица пуста
-                cursor.execute('SELECT COUNT(*) FROM weekly_tasks')
-                if cursor.fetchone()[0] == 0:
-                    # Загружаем начальные задачи из tasks.py
-                    initial_tasks = {
-                        0: [  # ПОНЕДЕЛЬНИК
-                            "Проверить календарь в почте спланировать день",
-                            "Выгрузить инвенту, провести анализ",
-                            "Просмотреть 40 графану на наличие фруода",
-                            "Просмотреть графану 73 на наличие с2с",
-                            "Провести обход совместно с менеджером сц",
-                            "Проверить пазл на наличие заявок близких к просроку",
-                            "На основе анализа составить план отработки",
-                            "Заполнить отчеты, написать письма"
-                        ],
-                        1: [  # ВТОРНИК
-                            "Проверить календарь в почте спланировать день",
-                            "Подготовиться к встрече",
-                            "Отработка фрода",
-                            "Просмотр 39 графаны",
-                            "Просмотреть графану 73 на наличие с2с",
-                            "Проверить наличие с2с в недостачах",
-                            "Заполнить отчеты, написать письма"
-                        ],
-                        2: [  # СРЕДА
-                            "Проверить календарь в почте спланировать день",
-                            "Выставление ШС озон джоб",
-                            "Провести обход совместно с менеджером сц",
-                            "Просмотреть графану 73 на наличие с2с",
-                            "Проверка проведения инвентаризации операциями",
-                            "Проверка зоны обезлички",
-                            "Заполнить отчеты, написать письма"
-                        ],
-                        3: [  # ЧЕТВЕРГ
-                            "Проверить календарь в почте спланировать день",
-                            "Отработка фрода",
-                            "Просмотр 39 графаны",
-                            "Просмотреть графану 73 на наличие с2с",
-                            "Предварительные итоги разбора недостач с операциями",
-                            "Заполнить отчеты, написать письма"
-                        ],
-                        4: [  # ПЯТНИЦА
-                            "Проверить календарь в почте спланировать день",
-                            "Проверить пазл на наличие заявок близких к просроку",
-                            "Просмотреть графану 73 на наличие с2с",
-                            "Выставление ШС озон джоб",
-                            "Заполнить отчеты, написать письма"
-                        ]
-                    }
-                    from datetime import datetime
-                    now = datetime.now().isoformat()
-                    for day, tasks in initial_tasks.items():
-                        for order, task_text in enumerate(tasks):
-                            cursor.execute('''
-                                INSERT INTO weekly_tasks (day, task_text, task_order, created_at)
-                                VALUES (?, ?, ?, ?)
-                            ''', (day, task_text, order, now))
-                
-                try:
-                    cursor.execute('ALTER TABLE custom_tasks ADD COLUMN completed_assignees TEXT')
-                except sqlite3.OperationalError:
-                    pass
-                try:
-                    cursor.execute('ALTER TABLE custom_tasks ADD COLUMN in_progress_assignees TEXT')
-                except sqlite3.OperationalError:
-                    pass
-                
-                # Таблица для отметок присутствия
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS presence (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT NOT NULL,
-                        user_id INTEGER NOT NULL,
-                        date TEXT NOT NULL,
-                        status TEXT NOT NULL,
-                        time TEXT,
-                        delay_minutes INTEGER,
-                        reason TEXT,
-                        created_at TEXT NOT NULL,
-                        UNIQUE(username, date)
-                    )
-                ''')
-                
-                # Таблица для блокировки спамеров
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS blocked_users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        reason TEXT,
-                        blocked_at TEXT NOT NULL
-                    )
-                ''')
-                
-                # Таблица для логирования спам-попыток
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS spam_log (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        username TEXT,
-                        message_text TEXT,
-                        detected_at TEXT NOT NULL
-                    )
-                ''')
-                
-                # Добавляем начальных пользователей, если их еще нет
-                # Проверяем, какие колонки есть в таблице
-                cursor.execute("PRAGMA table_info(users)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'name' in columns:
-                    initial_users = [
-                        ('alex301182', None, 'Vesenko, Aleksandr'),
-                        ('Korudirp', None, 'Cherenkov, Ruslan')
-                    ]
-                    cursor.executemany('''
-                        INSERT OR IGNORE INTO users (username, user_id, name)
-                        VALUES (?, ?, ?)
-                    ''', initial_users)
-                elif 'initials' in columns:
-                    initial_users = [
-                        ('alex301182', None, 'AG'),
-                        ('Korudirp', None, 'KA')
-                    ]
-                    cursor.executemany('''
-                        INSERT OR IGNORE INTO users (username, user_id, initials)
-                        VALUES (?, ?, ?)
-                    ''', initial_users)
-                
-                conn.commit()
-                conn.close()
+        """
+        Приводит схему базы данных к актуальной версии
+        Если база уже актуальна, выполняется только чтение номера версии
+        """
+        try:
+            with db_lock.exclusive():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    version = self._get_schema_version(cursor)
+                    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+                    
+                    for number, description, migrate in pending:
+                        logger_db.info(f"Миграция БД #{number}: {description}")
+                        migrate(cursor)
+                        from datetime import datetime
+                        cursor.execute(
+                            'INSERT OR REPLACE INTO schema_version (version, applied_at) VALUES (?, ?)',
+                            (number, datetime.now().isoformat())
+                        )
+                        conn.commit()
+                    
+                    if pending:
+                        # Схема users могла измениться - определяем ее заново
+                        self._load_users_schema(cursor)
+                        logger_db.info(f"Схема БД обновлена до версии {SCHEMA_VERSION}")
+                    else:
+                        # После миграции #2 имя сотрудника всегда хранится в колонке name
+                        self._build_users_sql('name')
+                    self._reload_roster(cursor)
+                finally:
+                    self.pool.release(conn)
         except Exception as e:
             # Логируем ошибку, но не падаем
             logger_db.error(f"Ошибка инициализации БД: {e}", exc_info=True)
     
-    def get_task_status(self, task_key: str) -> str:
+    def _get_schema_version(self, cursor) -> int:
+        """Номер последней примененной миграции (0 для новой или старой базы без schema_version)"""
+        try:
+            cursor.execute('SELECT MAX(version) FROM schema_version')
+            return cursor.fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TEXT NOT NULL
+                )
+            ''')
+            return 0
+    
+    def _load_users_schema(self, cursor):
         """
-        Получить статус задачи
-        task_key - уникальный ключ задачи (например, "0_1_AG")
+        Определяет, в какой колонке users хранится имя сотрудника (name или старая initials),
+        и заранее готовит SQL-запросы под эту схему
+        Вызывается только после применения миграций (и после добавления колонки name)
+        """
+        columns = _table_columns(cursor, 'users')
+        if 'name' in columns:
+            name_column = 'name'
+        elif 'initials' in columns:
+            name_column = 'initials'
+        else:
+            name_column = None
+        self._build_users_sql(name_column)
+    
+    def _build_users_sql(self, name_column: str):
+        """Готовит SQL-запросы к users под колонку имени name_column"""
+        self.users_name_column = name_column
+        if name_column:
+            self._users_sql = {
+                'save_user_id': f'''
+                    INSERT OR REPLACE INTO users (username, user_id, {name_column})
+                    VALUES (?, ?, ?)
+                ''',
+                'save_user': f'''
+                    INSERT OR REPLACE INTO users (username, user_id, {name_column})
+                    VALUES (?, COALESCE((SELECT user_id FROM users WHERE username = ?), NULL), ?)
+                ''',
+                'get_team': f'SELECT username, user_id, {name_column} FROM users',
+            }
+        else:
+            self._users_sql = {
+                'get_team': 'SELECT username, user_id FROM users',
+            }
+        logger_db.debug(f"Схема users: колонка имени = {name_column}")
+    
+    def _reload_roster(self, cursor):
+        """
+        Перечитывает таблицу users в кэш состава команды
+        Вызывается при инициализации и сразу после каждой записи в users (под блокировкой записи),
+        поэтому читатели всегда видят актуальный состав без запросов к БД
+        """
+        members = []
+        if self._users_sql:
+            cursor.execute(self._users_sql['get_team'])
+            for r in cursor.fetchall():
+                name = (r[2] if len(r) > 2 else "") or ""
+                members.append({
+                    "username": r[0],
+                    "user_id": r[1],
+                    "name": name,
+                    "initials": name  # Для обратной совместимости
+                })
+        # Новый снимок собирается целиком и подменяется одной операцией присваивания
+        self._roster = {
+            'members': members,
+            'by_username': {m['username']: m for m in members if m['username']},
+            'by_user_id': {m['user_id']: m for m in members if m['user_id'] is not None},
+            'by_name': {m['name']: m for m in members if m['name']},
+        }
+        logger_db.debug(f"Кэш команды обновлен: {[m['username'] for m in members]}")
+    
+    def _ensure_users_name_column(self, cursor):
+        """Добавляет колонку name, если в users нет ни name, ни initials (вызывать под блокировкой записи)"""
+        if self.users_name_column:
+            return
+        try:
+            cursor.execute('ALTER TABLE users ADD COLUMN name TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self._load_users_schema(cursor)
+    
+    def get_checklist_status(self, date: str, weekly_task_id: int, member: str) -> str:
+        """
+        Получить статус задачи чек-листа
+        date - дата чек-листа в формате YYYY-MM-DD
+        weekly_task_id - id задачи из weekly_tasks
+        member - исполнитель
         Возвращает статус: ⚪, ⏳ или ✅
         """
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.read():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT status FROM task_statuses WHERE task_key = ?',
-                        (task_key,)
-                    )
+                    cursor.execute('''
+                        SELECT status FROM checklist_statuses
+                        WHERE date = ? AND weekly_task_id = ? AND member = ?
+                    ''', (date, weekly_task_id, member))
                     result = cursor.fetchone()
-                    if result:
-                        return result[0]
-                    else:
-                        # Если статуса нет, возвращаем дефолтный без создания записи
-                        # Запись будет создана при первом set_task_status
-                        return '⚪'
+                    return result[0] if result else '⚪'
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             # В случае ошибки возвращаем дефолтный статус
-            logger_db.error(f"Ошибка получения статуса задачи {task_key}: {e}", exc_info=True)
+            logger_db.error(f"Ошибка получения статуса {date}/{weekly_task_id}/{member}: {e}", exc_info=True)
             return '⚪'
     
-    def set_task_status(self, task_key: str, status: str):
+    def set_checklist_status(self, date: str, weekly_task_id: int, member: str, status: str):
         """
-        Установить статус задачи
-        task_key - уникальный ключ задачи
+        Установить статус задачи чек-листа
         status - новый статус (⚪, ⏳ или ✅)
         """
+        self.set_checklist_statuses(date, {(weekly_task_id, member): status})
+    
+    def set_checklist_statuses(self, date: str, statuses: dict):
+        """
+        Установить несколько статусов чек-листа одной транзакцией
+        statuses - словарь {(weekly_task_id, member): статус}
+        """
+        if not statuses:
+            return
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    from datetime import datetime
+                    updated_at = datetime.now().isoformat()
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO checklist_statuses (date, weekly_task_id, member, status, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', [
+                        (date, weekly_task_id, member, status, updated_at)
+                        for (weekly_task_id, member), status in statuses.items()
+                    ])
+                    conn.commit()
+                    self._update_cached_checklists(date, statuses)
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка сохранения статусов чек-листа за {date} ({len(statuses)} шт.): {e}", exc_info=True)
+    
+    def cycle_checklist_status(self, date: str, weekly_task_id: int, member: str) -> str:
+        """
+        Переключает статус по кругу ⚪ → ⏳ → ✅ → ⚪ одной транзакцией
+        Возвращает новый статус (или None при ошибке)
+        """
+        status_cycle = {"⚪": "⏳", "⏳": "✅", "✅": "⚪"}
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     cursor.execute('''
-                        INSERT OR REPLACE INTO task_statuses (task_key, status)
-                        VALUES (?, ?)
-                    ''', (task_key, status))
+                        SELECT status FROM checklist_statuses
+                        WHERE date = ? AND weekly_task_id = ? AND member = ?
+                    ''', (date, weekly_task_id, member))
+                    result = cursor.fetchone()
+                    new_status = status_cycle.get(result[0] if result else '⚪', '⚪')
+                    from datetime import datetime
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO checklist_statuses (date, weekly_task_id, member, status, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (date, weekly_task_id, member, new_status, datetime.now().isoformat()))
                     conn.commit()
+                    self._update_cached_checklists(date, {(weekly_task_id, member): new_status})
+                    return new_status
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
-            # Логируем ошибку, но не падаем
-            logger_db.error(f"Ошибка сохранения статуса {task_key}={status}: {e}", exc_info=True)
+            logger_db.error(f"Ошибка переключения статуса {date}/{weekly_task_id}/{member}: {e}", exc_info=True)
+            return None
+    
+    def get_checklist_statuses(self, date: str, weekly_task_ids: list = None, members: list = None) -> dict:
+        """
+        Получить статусы чек-листа за дату одним запросом
+        weekly_task_ids, members - фильтры (None - без фильтра)
+        Возвращает словарь {(weekly_task_id, member): статус}; если заданы оба фильтра,
+        отсутствующие сочетания заполняются ⚪
+        Прошедшие даты дочитываются из checklist_history
+        """
+        statuses = {}
+        if weekly_task_ids is not None and members is not None:
+            statuses = {(task_id, member): '⚪' for task_id in weekly_task_ids for member in members}
+        try:
+            with db_lock.read():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    # Выборка по префиксу первичного ключа (date) - размер не зависит от длины истории
+                    for table in ('checklist_history', 'checklist_statuses'):
+                        cursor.execute(
+                            f'SELECT weekly_task_id, member, status FROM {table} WHERE date = ?',
+                            (date,)
+                        )
+                        for weekly_task_id, member, status in cursor.fetchall():
+                            if weekly_task_ids is not None and weekly_task_id not in weekly_task_ids:
+                                continue
+                            if members is not None and member not in members:
+                                continue
+                            statuses[(weekly_task_id, member)] = status
+                    return statuses
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка получения статусов чек-листа за {date}: {e}", exc_info=True)
+            return statuses
+    
+    def get_day_status_matrix(self, date: str, day: int, members: list, weekly_tasks: list = None) -> dict:
+        """
+        Матрица статусов чек-листа дня: {"0_1": {"AG": "✅", "KA": "⚪"}, ...}
+        Ключи "{день}_{номер}" совпадают с task_id в кнопках утреннего сообщения
+        date - дата чек-листа (YYYY-MM-DD)
+        day - номер дня недели, задачи которого показаны в чек-листе
+        members - исполнители
+        weekly_tasks - задачи дня из get_weekly_tasks (если не указаны, загружаются)
+        """
+        if weekly_tasks is None:
+            weekly_tasks = self.get_weekly_tasks(day)
+        task_ids = [task['id'] for task in weekly_tasks]
+        statuses = self.get_checklist_statuses(date, task_ids, members)
+        return {
+            f"{day}_{i}": {member: statuses[(task['id'], member)] for member in members}
+            for i, task in enumerate(weekly_tasks, 1)
+        }
+    
+    def save_checklist_message(self, chat_id: int, message_id: int, date: str, day: int, tasks: list) -> dict:
+        """
+        Запоминает отправленное сообщение с чек-листом
+        tasks - [(weekly_task_id, текст), ...] в порядке кнопок (кнопка task_{day}_{i} - элемент i-1)
+        Возвращает модель сообщения (как get_checklist_message)
+        """
+        tasks = [(int(weekly_task_id), text) for weekly_task_id, text in tasks]
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    from datetime import datetime
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO checklist_messages (chat_id, message_id, date, day, tasks, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (chat_id, message_id, date, day, json.dumps(tasks, ensure_ascii=False), datetime.now().isoformat()))
+                    conn.commit()
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка сохранения чек-листа {chat_id}/{message_id}: {e}", exc_info=True)
+        return self._cache_checklist_message(chat_id, message_id, date, day, tasks)
+    
+    def get_checklist_message(self, chat_id: int, message_id: int) -> dict:
+        """
+        Модель отправленного чек-листа или None, если сообщение неизвестно:
+        {'date', 'day', 'tasks': [(weekly_task_id, текст), ...], 'statuses': {(weekly_task_id, member): статус}}
+        Берется из памяти; после перезапуска - из checklist_messages и статусов за дату
+        В statuses есть только отмеченные сочетания, отсутствующие означают ⚪
+        """
+        key = (chat_id, message_id)
+        with self._checklist_messages_lock:
+            model = self._checklist_messages.get(key)
+            if model is not None:
+                self._checklist_messages.move_to_end(key)
+                return {**model, 'statuses': dict(model['statuses'])}
+        try:
+            with db_lock.read():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        'SELECT date, day, tasks FROM checklist_messages WHERE chat_id = ? AND message_id = ?',
+                        (chat_id, message_id)
+                    )
+                    row = cursor.fetchone()
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка загрузки чек-листа {chat_id}/{message_id}: {e}", exc_info=True)
+            return None
+        if not row:
+            return None
+        date, day, tasks = row
+        return self._cache_checklist_message(chat_id, message_id, date, day, [tuple(task) for task in json.loads(tasks)])
+    
+    def _cache_checklist_message(self, chat_id: int, message_id: int, date: str, day: int, tasks: list) -> dict:
+        """Кладет модель в кэш (статусы - из БД за дату) и возвращает ее копию"""
+        statuses = self.get_checklist_statuses(date, [weekly_task_id for weekly_task_id, _ in tasks])
+        model = {
+            'chat_id': chat_id, 'message_id': message_id,
+            'date': date, 'day': day, 'tasks': tasks, 'statuses': statuses,
+        }
+        with self._checklist_messages_lock:
+            self._checklist_messages[(chat_id, message_id)] = model
+            self._checklist_messages.move_to_end((chat_id, message_id))
+            while len(self._checklist_messages) > CHECKLIST_MESSAGE_CACHE_SIZE:
+                self._checklist_messages.popitem(last=False)
+            return {**model, 'statuses': dict(statuses)}
+    
+    def _update_cached_checklists(self, date: str, statuses: dict):
+        """Переносит новые статусы во все закэшированные чек-листы за эту дату"""
+        with self._checklist_messages_lock:
+            for model in self._checklist_messages.values():
+                if model['date'] == date:
+                    model['statuses'].update(statuses)
+    
+    def rollover_checklists(self, today: str, history_days: int = None) -> dict:
+        """
+        Переносит статусы прошедших дней (date < today) в checklist_history
+        Неотмеченные (⚪) статусы не архивируются
+        history_days - сколько дней хранить историю (0 - бессрочно, по умолчанию CHECKLIST_HISTORY_DAYS)
+        Возвращает счетчики {'archived': ..., 'purged': ...}
+        """
+        if history_days is None:
+            history_days = CHECKLIST_HISTORY_DAYS
+        result = {'archived': 0, 'purged': 0}
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO checklist_history (date, weekly_task_id, member, status)
+                        SELECT date, weekly_task_id, member, status
+                        FROM checklist_statuses
+                        WHERE date < ? AND status != '⚪'
+                    ''', (today,))
+                    result['archived'] = cursor.rowcount
+                    cursor.execute('DELETE FROM checklist_statuses WHERE date < ?', (today,))
+                    if history_days > 0:
+                        from datetime import date, timedelta
+                        cutoff = (date.fromisoformat(today) - timedelta(days=history_days)).isoformat()
+                        cursor.execute('DELETE FROM checklist_history WHERE date < ?', (cutoff,))
+                        result['purged'] = cursor.rowcount
+                        cursor.execute('DELETE FROM checklist_messages WHERE date < ?', (cutoff,))
+                    conn.commit()
+                finally:
+                    self.pool.release(conn)
+            logger_db.info(
+                f"Чек-листы до {today} перенесены в историю: {result['archived']} статусов, "
+                f"удалено устаревших: {result['purged']}"
+            )
+        except Exception as e:
+            logger_db.error(f"Ошибка переноса чек-листов в историю: {e}", exc_info=True)
+        return result
     
     def save_user_id(self, username: str, user_id: int, name: str):
         """
@@ -301,177 +1097,104 @@ class Database:
         username - имя пользователя в Telegram (например, "alex301182")
         user_id - ID пользователя в Telegram
         name - имя сотрудника (например, "Vesenko, Aleksandr")
+        Если в кэше команды уже есть такая же запись, БД не трогается
+        Возвращает True, если запись в БД была изменена
         """
+        if self._is_user_id_saved(username, user_id, name):
+            return False
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
-                    # Проверяем, какие колонки есть в таблице
-                    cursor.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    
-                    if 'name' in columns:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, name)
-                            VALUES (?, ?, ?)
-                        ''', (username, user_id, name))
-                    elif 'initials' in columns:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, initials)
-                            VALUES (?, ?, ?)
-                        ''', (username, user_id, name))
-                    else:
-                        # Если нет ни name, ни initials - добавляем колонку name
-                        try:
-                            cursor.execute('ALTER TABLE users ADD COLUMN name TEXT')
-                        except sqlite3.OperationalError:
-                            pass
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, name)
-                            VALUES (?, ?, ?)
-                        ''', (username, user_id, name))
+                    self._ensure_users_name_column(cursor)
+                    # Повторная проверка: пока ждали блокировку, запись мог сделать другой поток
+                    if self._is_user_id_saved(username, user_id, name):
+                        return False
+                    cursor.execute(self._users_sql['save_user_id'], (username, user_id, name))
                     conn.commit()
+                    self._reload_roster(cursor)
+                    logger_db.info(f"ID пользователя {username} сохранен: {user_id} ({name})")
+                    return True
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             # Логируем ошибку, но не падаем
             logger_db.error(f"Ошибка сохранения ID пользователя {username}: {e}", exc_info=True)
-
+            return False
+    
+    def _is_user_id_saved(self, username: str, user_id: int, name: str) -> bool:
+        """Проверяет по кэшу команды, что тройка (username, user_id, name) уже сохранена"""
+        member = self._roster['by_username'].get(username)
+        return member is not None and member['user_id'] == user_id and member['name'] == (name or "")
+    
     def save_user(self, username: str, name: str):
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
-                    # Проверяем, какие колонки есть в таблице
-                    cursor.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    logger_db.info(f"Колонки в таблице users: {columns}")
-                    
-                    # Если есть колонка name - используем её, иначе initials
-                    if 'name' in columns:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, name)
-                            VALUES (?, COALESCE((SELECT user_id FROM users WHERE username = ?), NULL), ?)
-                        ''', (username, username, name))
-                    elif 'initials' in columns:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, initials)
-                            VALUES (?, COALESCE((SELECT user_id FROM users WHERE username = ?), NULL), ?)
-                        ''', (username, username, name))
-                    else:
-                        # Если нет ни name, ни initials - добавляем колонку name
-                        try:
-                            cursor.execute('ALTER TABLE users ADD COLUMN name TEXT')
-                        except sqlite3.OperationalError:
-                            pass
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO users (username, user_id, name)
-                            VALUES (?, COALESCE((SELECT user_id FROM users WHERE username = ?), NULL), ?)
-                        ''', (username, username, name))
-                    
+                    self._ensure_users_name_column(cursor)
+                    cursor.execute(self._users_sql['save_user'], (username, username, name))
                     conn.commit()
+                    self._reload_roster(cursor)
                     logger_db.info(f"Пользователь {username} ({name}) успешно сохранен в БД")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка сохранения пользователя {username}: {e}", exc_info=True)
-
+    
     def remove_user(self, username: str):
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     cursor.execute('DELETE FROM users WHERE username = ?', (username,))
                     conn.commit()
+                    self._reload_roster(cursor)
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка удаления пользователя {username}: {e}", exc_info=True)
-
+    
     def get_team(self) -> list:
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    # Проверяем, какие колонки есть в таблице
-                    cursor.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    
-                    # Формируем запрос в зависимости от наличия колонок
-                    if 'name' in columns:
-                        cursor.execute('SELECT username, user_id, name FROM users')
-                    elif 'initials' in columns:
-                        cursor.execute('SELECT username, user_id, initials FROM users')
-                    else:
-                        cursor.execute('SELECT username, user_id FROM users')
-                    
-                    rows = cursor.fetchall()
-                    result = []
-                    for r in rows:
-                        username = r[0] if len(r) > 0 else ""
-                        user_id = r[1] if len(r) > 1 else None
-                        name_or_initials = r[2] if len(r) > 2 else ""
-                        if username:  # Только если username не пустой
-                            result.append({
-                                "username": username,
-                                "user_id": user_id,
-                                "name": name_or_initials,
-                                "initials": name_or_initials  # Для обратной совместимости
-                            })
-                    logger_db.info(f"Получено {len(result)} сотрудников из БД: {[r['username'] for r in result]}")
-                    return result
-                finally:
-                    conn.close()
-        except Exception as e:
-            logger_db.error(f"Ошибка получения команды: {e}", exc_info=True)
-            return []
-
+        """Возвращает состав команды (из кэша, без запроса к БД)"""
+        return [dict(m) for m in self._roster['members'] if m['username']]
+    
     def get_team_initials(self) -> list:
         """Возвращает список имен команды (для обратной совместимости используется старое название)"""
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    # Пытаемся получить name, если нет - используем initials (для обратной совместимости)
-                    try:
-                        cursor.execute('SELECT name FROM users')
-                    except sqlite3.OperationalError:
-                        cursor.execute('SELECT initials FROM users')
-                    return [row[0] for row in cursor.fetchall() if row[0]]
-                finally:
-                    conn.close()
-        except Exception as e:
-            logger_db.error("Ошибка получения имен команды", exc_info=True)
-            return []
+        return [m['name'] for m in self._roster['members'] if m['name']]
     
     def get_team_names(self) -> list:
         """Возвращает список имен команды"""
         return self.get_team_initials()
     
+    def get_member_by_username(self, username: str) -> dict:
+        """Сотрудник по username в Telegram или None"""
+        member = self._roster['by_username'].get(username)
+        return dict(member) if member else None
+    
+    def get_member_by_name(self, name: str) -> dict:
+        """Сотрудник по имени (например, "Vesenko, Aleksandr") или None"""
+        member = self._roster['by_name'].get(name)
+        return dict(member) if member else None
+    
+    def get_member_by_user_id(self, user_id: int) -> dict:
+        """Сотрудник по ID в Telegram или None"""
+        member = self._roster['by_user_id'].get(user_id)
+        return dict(member) if member else None
+    
+    def is_team_member_name(self, name: str) -> bool:
+        """Проверяет, что имя принадлежит сотруднику команды"""
+        return bool(name) and name in self._roster['by_name']
+    
     def get_user_ids(self) -> list:
         """
         Получить список всех ID пользователей
         Возвращает список ID для отправки личных сообщений
         """
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT user_id FROM users WHERE user_id IS NOT NULL')
-                    results = cursor.fetchall()
-                    return [row[0] for row in results if row[0] is not None]
-                finally:
-                    conn.close()
-        except Exception as e:
-            # Логируем ошибку, но не падаем
-            logger_db.error(f"Ошибка получения списка ID пользователей: {e}", exc_info=True)
-            return []
+        return [m['user_id'] for m in self._roster['members'] if m['user_id'] is not None]
     
     def get_user_id_by_username(self, username: str) -> int:
         """
@@ -479,82 +1202,44 @@ class Database:
         username - имя пользователя в Telegram
         Возвращает ID пользователя или None
         """
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT user_id FROM users WHERE username = ?',
-                        (username,)
-                    )
-                    result = cursor.fetchone()
-                    if result and result[0] is not None:
-                        return result[0]
-                    return None
-                finally:
-                    conn.close()
-        except Exception as e:
-            # Логируем ошибку, но не падаем
-            logger_db.error(f"Ошибка получения ID пользователя {username}: {e}", exc_info=True)
-            return None
+        member = self._roster['by_username'].get(username)
+        return member['user_id'] if member else None
     
     def get_all_employees(self) -> list:
         """
         Получить список всех сотрудников
         Возвращает список словарей с информацией о сотрудниках
         """
-        try:
-            with db_lock:
-                conn = self.get_connection()
-                try:
-                    cursor = conn.cursor()
-                    # Проверяем, какие колонки есть в таблице
-                    cursor.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    
-                    if 'name' in columns:
-                        cursor.execute('SELECT username, user_id, name FROM users ORDER BY name')
-                    elif 'initials' in columns:
-                        cursor.execute('SELECT username, user_id, initials FROM users ORDER BY initials')
-                    else:
-                        cursor.execute('SELECT username, user_id FROM users ORDER BY username')
-                    
-                    results = cursor.fetchall()
-                    employees = []
-                    for row in results:
-                        employees.append({
-                            'username': row[0],
-                            'user_id': row[1],
-                            'name': row[2] if len(row) > 2 else "",
-                            'initials': row[2] if len(row) > 2 else ""  # Для обратной совместимости
-                        })
-                    return employees
-                finally:
-                    conn.close()
-        except Exception as e:
-            logger_db.error(f"Ошибка получения списка сотрудников: {e}", exc_info=True)
-            return []
+        members = self._roster['members']
+        if self.users_name_column:
+            members = sorted(members, key=lambda m: m['name'])
+        else:
+            members = sorted(members, key=lambda m: m['username'] or "")
+        return [dict(m) for m in members]
     
-    def save_custom_task(self, title: str, description: str, deadline: str, assignee: str, creator: str) -> int:
-        """Сохраняет новую задачу, созданную через меню"""
+    def save_custom_task(self, title: str, description: str, deadline: str, assignee: str, creator: str,
+                         deadline_ts: int = None) -> int:
+        """
+        Сохраняет новую задачу, созданную через меню
+        deadline_ts - разобранный срок (UTC timestamp, см. deadlines.deadline_timestamp)
+        """
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     from datetime import datetime
                     created_at = datetime.now().isoformat()
                     cursor.execute('''
-                        INSERT INTO custom_tasks (title, description, deadline, assignee, creator, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (title, description, deadline, assignee, creator, created_at))
+                        INSERT INTO custom_tasks (title, description, deadline, deadline_ts, assignee, creator, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (title, description, deadline, deadline_ts, assignee, creator, created_at))
                     task_id = cursor.lastrowid
                     conn.commit()
                     logger_db.info(f"Задача #{task_id} сохранена: {title}")
                     return task_id
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка сохранения новой задачи: {e}", exc_info=True)
             return None
@@ -562,27 +1247,17 @@ class Database:
     def get_custom_tasks(self, status: str = None) -> list:
         """Получает список новых задач"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.read():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     if status:
-                        cursor.execute('SELECT * FROM custom_tasks WHERE status = ?', (status,))
+                        cursor.execute(f'SELECT {CUSTOM_TASK_FIELDS} FROM custom_tasks WHERE status = ?', (status,))
                     else:
-                        cursor.execute('SELECT * FROM custom_tasks')
-                    tasks = []
-                    for row in cursor.fetchall():
-                        tasks.append({
-                            'task_id': row[0], 'title': row[1], 'description': row[2],
-                            'deadline': row[3], 'assignee': row[4], 'creator': row[5],
-                            'status': row[6], 'created_at': row[7], 'completed_at': row[8],
-                            'result_text': row[9], 'result_photo': row[10],
-                            'completed_assignees': row[11] if len(row) > 11 else '',
-                            'in_progress_assignees': row[12] if len(row) > 12 else ''
-                        })
-                    return tasks
+                        cursor.execute(f'SELECT {CUSTOM_TASK_FIELDS} FROM custom_tasks')
+                    return [_custom_task_from_row(row) for row in cursor.fetchall()]
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка получения списка задач: {e}", exc_info=True)
             return []
@@ -590,33 +1265,59 @@ class Database:
     def get_custom_task(self, task_id: int) -> dict:
         """Получает одну новую задачу по ID"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.read():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
-                    cursor.execute('SELECT * FROM custom_tasks WHERE task_id = ?', (task_id,))
+                    cursor.execute(f'SELECT {CUSTOM_TASK_FIELDS} FROM custom_tasks WHERE task_id = ?', (task_id,))
                     row = cursor.fetchone()
-                    if row:
-                        return {
-                            'task_id': row[0], 'title': row[1], 'description': row[2],
-                            'deadline': row[3], 'assignee': row[4], 'creator': row[5],
-                            'status': row[6], 'created_at': row[7], 'completed_at': row[8],
-                            'result_text': row[9], 'result_photo': row[10],
-                            'completed_assignees': row[11] if len(row) > 11 else '',
-                            'in_progress_assignees': row[12] if len(row) > 12 else ''
-                        }
-                    return None
+                    return _custom_task_from_row(row) if row else None
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка получения задачи {task_id}: {e}", exc_info=True)
             return None
     
+    def get_tasks_with_deadline_between(self, start_ts: int = None, end_ts: int = None,
+                                        statuses: tuple = ('active', 'in_progress')) -> list:
+        """
+        Задачи со сроком в диапазоне [start_ts, end_ts) (UTC timestamp), по возрастанию срока
+        Границы можно опустить (None); выборка идет по индексу deadline_ts
+        Например, "срок в ближайшие 4 часа": get_tasks_with_deadline_between(now, now + 4 * 3600)
+        """
+        conditions = ['deadline_ts IS NOT NULL']
+        params = []
+        if start_ts is not None:
+            conditions.append('deadline_ts >= ?')
+            params.append(int(start_ts))
+        if end_ts is not None:
+            conditions.append('deadline_ts < ?')
+            params.append(int(end_ts))
+        if statuses:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        try:
+            with db_lock.read():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(f'''
+                        SELECT {CUSTOM_TASK_FIELDS} FROM custom_tasks
+                        WHERE {' AND '.join(conditions)}
+                        ORDER BY deadline_ts
+                    ''', params)
+                    return [_custom_task_from_row(row) for row in cursor.fetchall()]
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка выборки задач по сроку: {e}", exc_info=True)
+            return []
+    
     def update_custom_task(self, task_id: int, **kwargs):
         """Обновляет поля новой задачи"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     set_clauses = []
@@ -632,30 +1333,30 @@ class Database:
                         conn.commit()
                     logger_db.info(f"Задача #{task_id} обновлена: {list(kwargs.keys())}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка обновления задачи {task_id}: {e}", exc_info=True)
     
     def delete_custom_task(self, task_id: int):
         """Удаляет новую задачу"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     cursor.execute('DELETE FROM custom_tasks WHERE task_id = ?', (task_id,))
                     conn.commit()
                     logger_db.info(f"Задача #{task_id} удалена")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка удаления задачи {task_id}: {e}", exc_info=True)
     
     def get_weekly_tasks(self, day: int = None) -> list:
         """Получить еженедельные задачи для дня (или все, если day=None)"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.read():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     if day is not None:
@@ -674,7 +1375,7 @@ class Database:
                     results = cursor.fetchall()
                     return [{'id': r[0], 'day': r[1], 'task_text': r[2], 'task_order': r[3]} for r in results]
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка получения еженедельных задач: {e}", exc_info=True)
             return []
@@ -682,8 +1383,8 @@ class Database:
     def add_weekly_task(self, day: int, task_text: str) -> int:
         """Добавить еженедельную задачу"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     # Получаем максимальный порядок для дня
@@ -703,7 +1404,7 @@ class Database:
                     logger_db.info(f"Добавлена еженедельная задача для дня {day}: {task_text[:50]}")
                     return task_id
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка добавления еженедельной задачи: {e}", exc_info=True)
             return -1
@@ -711,8 +1412,8 @@ class Database:
     def update_weekly_task(self, task_id: int, task_text: str = None, day: int = None, task_order: int = None):
         """Обновить еженедельную задачу"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     updates = []
@@ -734,30 +1435,30 @@ class Database:
                         conn.commit()
                         logger_db.info(f"Обновлена еженедельная задача #{task_id}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка обновления еженедельной задачи {task_id}: {e}", exc_info=True)
     
     def delete_weekly_task(self, task_id: int):
         """Удалить еженедельную задачу"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     cursor.execute('DELETE FROM weekly_tasks WHERE id = ?', (task_id,))
                     conn.commit()
                     logger_db.info(f"Удалена еженедельная задача #{task_id}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка удаления еженедельной задачи {task_id}: {e}", exc_info=True)
     
     def save_presence(self, username: str, user_id: int, status: str, time: str = None, delay_minutes: int = None, reason: str = None):
         """Сохраняет отметку присутствия"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     from datetime import datetime
@@ -771,31 +1472,37 @@ class Database:
                     conn.commit()
                     logger_db.info(f"Отметка присутствия сохранена для {username}: {status}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка сохранения отметки присутствия для {username}: {e}", exc_info=True)
     
-    def is_user_blocked(self, user_id: int) -> bool:
-        """Проверяет, заблокирован ли пользователь"""
+    def load_blocked_users(self):
+        """Загружает ID заблокированных пользователей в память (вызывается при старте)"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.read():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
-                    cursor.execute('SELECT user_id FROM blocked_users WHERE user_id = ?', (user_id,))
-                    result = cursor.fetchone()
-                    return result is not None
+                    cursor.execute('SELECT user_id FROM blocked_users')
+                    self._blocked_ids = {row[0] for row in cursor.fetchall()}
+                    logger_db.info(f"Загружено заблокированных пользователей: {len(self._blocked_ids)}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
-            logger_db.error(f"Ошибка проверки блокировки пользователя {user_id}: {e}", exc_info=True)
-            return False
+            logger_db.error(f"Ошибка загрузки заблокированных пользователей: {e}", exc_info=True)
+    
+    def is_user_blocked(self, user_id: int) -> bool:
+        """
+        Проверяет, заблокирован ли пользователь
+        Проверка идет по множеству в памяти, запроса к БД нет
+        """
+        return user_id in self._blocked_ids
     
     def block_user(self, user_id: int, username: str = None, reason: str = "Spam"):
         """Блокирует пользователя"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     from datetime import datetime
@@ -805,17 +1512,41 @@ class Database:
                         VALUES (?, ?, ?, ?)
                     ''', (user_id, username, reason, blocked_at))
                     conn.commit()
+                    self._blocked_ids.add(user_id)
                     logger_db.warning(f"Пользователь {username} (ID: {user_id}) заблокирован: {reason}")
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка блокировки пользователя {user_id}: {e}", exc_info=True)
     
+    def unblock_user(self, user_id: int) -> bool:
+        """
+        Снимает блокировку с пользователя
+        Возвращает True, если пользователь был заблокирован
+        """
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('DELETE FROM blocked_users WHERE user_id = ?', (user_id,))
+                    conn.commit()
+                    removed = cursor.rowcount > 0
+                    self._blocked_ids.discard(user_id)
+                    if removed:
+                        logger_db.warning(f"Пользователь ID: {user_id} разблокирован")
+                    return removed
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка разблокировки пользователя {user_id}: {e}", exc_info=True)
+            return False
+    
     def log_spam_attempt(self, user_id: int, username: str = None, message_text: str = None):
         """Логирует попытку спама"""
         try:
-            with db_lock:
-                conn = self.get_connection()
+            with db_lock.write():
+                conn = self.pool.acquire()
                 try:
                     cursor = conn.cursor()
                     from datetime import datetime
@@ -829,7 +1560,164 @@ class Database:
                     ''', (user_id, username, message_text, detected_at))
                     conn.commit()
                 finally:
-                    conn.close()
+                    self.pool.release(conn)
         except Exception as e:
             logger_db.error(f"Ошибка логирования спама для {user_id}: {e}", exc_info=True)
+    
+    def get_presence_usernames(self, date_str: str) -> set:
+        """Возвращает username всех, кто отметил присутствие в указанную дату (YYYY-MM-DD)"""
+        try:
+            with db_lock.read():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT username FROM presence WHERE date = ?', (date_str,))
+                    return {row[0] for row in cursor.fetchall()}
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка получения отметок присутствия за {date_str}: {e}", exc_info=True)
+            return set()
+    
+    def try_claim_reminder(self, task_id: int, kind: str, slot: str) -> bool:
+        """
+        Отмечает напоминание как отправленное, если его еще не отправляли
+        Ключ (task_id, kind, slot) уникален в reminder_ledger, поэтому после перезапуска
+        бота повторной отправки не будет
+        Возвращает True, если напоминание нужно отправить (запись создана этим вызовом)
+        """
+        key = (task_id, kind, slot)
+        with self._reminder_cache_lock:
+            if key in self._reminder_cache:
+                self._reminder_cache.move_to_end(key)
+                return False
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    from datetime import datetime
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO reminder_ledger (task_id, kind, slot, sent_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', (task_id, kind, slot, datetime.now().isoformat()))
+                    conn.commit()
+                    claimed = cursor.rowcount > 0
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка записи напоминания {key} в журнал: {e}", exc_info=True)
+            return False
+        self._remember_reminder(key)
+        return claimed
 
+    def release_reminder(self, task_id: int, kind: str, slot: str):
+        """
+        Снимает отметку try_claim_reminder, если напоминание так и не ушло
+        (ошибка отправки или остановка бота), чтобы его можно было отправить снова
+        """
+        key = (task_id, kind, slot)
+        with self._reminder_cache_lock:
+            self._reminder_cache.pop(key, None)
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        'DELETE FROM reminder_ledger WHERE task_id = ? AND kind = ? AND slot = ?',
+                        key
+                    )
+                    conn.commit()
+                finally:
+                    self.pool.release(conn)
+        except Exception as e:
+            logger_db.error(f"Ошибка удаления напоминания {key} из журнала: {e}", exc_info=True)
+
+    def _remember_reminder(self, key: tuple):
+        """Добавляет ключ в ограниченный кэш отправленных напоминаний (вытесняются самые старые)"""
+        with self._reminder_cache_lock:
+            self._reminder_cache[key] = True
+            self._reminder_cache.move_to_end(key)
+            while len(self._reminder_cache) > REMINDER_CACHE_SIZE:
+                self._reminder_cache.popitem(last=False)
+    
+    def sweep_reminder_ledger(self, ttl_days: int = None) -> int:
+        """
+        Удаляет из журнала напоминаний записи старше ttl_days (по умолчанию REMINDER_LEDGER_DAYS)
+        Возвращает количество удаленных записей
+        """
+        if ttl_days is None:
+            ttl_days = REMINDER_LEDGER_DAYS
+        try:
+            with db_lock.write():
+                conn = self.pool.acquire()
+                try:
+                    cursor = conn.cursor()
+                    from datetime import datetime, timedelta
+                    cutoff = (datetime.now() - timedelta(days=ttl_days)).isoformat()
+                    cursor.execute('DELETE FROM reminder_ledger WHERE sent_at < ?', (cutoff,))
+                    conn.commit()
+                    removed = cursor.rowcount
+                finally:
+                    self.pool.release(conn)
+            # Кэш небольшой - проще сбросить, чем искать в нем удаленные ключи
+            with self._reminder_cache_lock:
+                self._reminder_cache.clear()
+            logger_db.info(f"Журнал напоминаний очищен: удалено {removed} записей старше {ttl_days} дн.")
+            return removed
+        except Exception as e:
+            logger_db.error(f"Ошибка очистки журнала напоминаний: {e}", exc_info=True)
+            return 0
+
+
+class AsyncDatabase:
+    """
+    Асинхронная обертка над Database для использования в обработчиках
+    Любой метод Database доступен как awaitable: await db.get_team()
+    Сами запросы выполняются в отдельном потоке, поэтому медленная запись
+    в SQLite не останавливает цикл событий бота
+    """
+    
+    # Методы, которые отвечают из памяти процесса и не обращаются к SQLite
+    IN_MEMORY_METHODS = {
+        'is_user_blocked',
+        'get_team', 'get_team_initials', 'get_team_names', 'get_all_employees',
+        'get_user_ids', 'get_user_id_by_username', 'is_team_member_name',
+        'get_member_by_username', 'get_member_by_name', 'get_member_by_user_id',
+    }
+    
+    def __init__(self, db: Database, max_workers: int = None):
+        """
+        db - синхронный экземпляр Database
+        max_workers - количество потоков для запросов к БД (по умолчанию - размер пула соединений)
+        """
+        self.db = db
+        if max_workers is None:
+            max_workers = db.pool.size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+    
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        
+        if name in self.IN_MEMORY_METHODS:
+            # Ответ уже в памяти - поток не нужен, но вызов остается awaitable
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return attr(*args, **kwargs)
+        else:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+        
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, method)
+        return method
+    
+    def close(self):
+        """Дожидается завершения запросов и закрывает БД"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,85 @@
+"""
+МОДУЛЬ ДЛЯ РАЗБОРА СРОКОВ (ДЕДЛАЙНОВ) ЗАДАЧ
+Срок разбирается один раз - при создании или изменении задачи - и хранится
+в custom_tasks.deadline_ts как UTC timestamp (секунды)
+"""
+
+import logging
+import re
+from datetime import date, datetime
+from functools import lru_cache
+import pytz
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# "сегодня до 15:00", "сегодня до 15", "сегодня до 3:00 PM", "today 15:00"
+_TODAY_RE = re.compile(
+    r'^(?:сегодня|today)(?:\s+до)?\s+(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?$',
+    re.IGNORECASE
+)
+# "ДД.ММ.ГГГГ ЧЧ:ММ" или "ДД.ММ.ГГГГ"
+_DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})(?:\s+(\d{1,2}):(\d{2}))?$')
+
+
+@lru_cache(maxsize=1024)
+def _parse(deadline_str: str, reference: date) -> datetime:
+    match = _TODAY_RE.match(deadline_str)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2) or 0)
+        meridiem = (match.group(3) or '').lower()
+        if meridiem == 'pm' and hour != 12:
+            hour += 12
+        elif meridiem == 'am' and hour == 12:
+            hour = 0
+        return MOSCOW_TZ.localize(datetime(reference.year, reference.month, reference.day, hour, minute))
+
+    match = _DATE_RE.match(deadline_str)
+    if match:
+        day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        if match.group(4) is not None:
+            hour, minute = int(match.group(4)), int(match.group(5))
+        else:
+            # Если только дата, ставим время 23:59
+            hour, minute = 23, 59
+        return MOSCOW_TZ.localize(datetime(year, month, day, hour, minute))
+
+    return None
+
+
+def parse_deadline(deadline_str: str, reference: date = None) -> datetime:
+    """
+    Парсит строку дедлайна в datetime (часовой пояс - Москва)
+    Поддерживает форматы:
+    - ДД.ММ.ГГГГ ЧЧ:ММ
+    - ДД.ММ.ГГГГ
+    - сегодня до 15:00
+    - сегодня до 3:00 PM
+    reference - дата, от которой считается "сегодня" (по умолчанию текущая дата по Москве)
+    Возвращает None, если строку разобрать не удалось
+    """
+    if not deadline_str:
+        return None
+    if reference is None:
+        reference = datetime.now(MOSCOW_TZ).date()
+    try:
+        return _parse(' '.join(deadline_str.split()), reference)
+    except ValueError:
+        # Несуществующая дата или время (31.02, 25:00 и т.п.)
+        logger.error(f"Не удалось распарсить дедлайн: {deadline_str}")
+        return None
+
+
+def deadline_timestamp(deadline_str: str, reference: date = None) -> int:
+    """Срок задачи как UTC timestamp (секунды) или None"""
+    deadline = parse_deadline(deadline_str, reference)
+    return int(deadline.timestamp()) if deadline else None
+
+
+def deadline_from_timestamp(deadline_ts: int) -> datetime:
+    """Обратное преобразование: UTC timestamp -> datetime по Москве"""
+    if deadline_ts is None:
+        return None
+    return datetime.fromtimestamp(deadline_ts, MOSCOW_TZ)
@@ -2,11 +2,19 @@
 НОВЫЕ ОБРАБОТЧИКИ ДЛЯ МЕНЮ И ФУНКЦИЙ
 """
 
+import hashlib
+import json
 import logging
+from collections import OrderedDict
 from datetime import datetime
 import pytz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from reminders import reschedule_task_reminders
+from outbox import send_message, edit_reply_markup
+import metrics
+from router import CallbackRouter
+from callback_codec import encode_callback_data, callback_data_matches
 
 logger = logging.getLogger(__name__)
 
@@ -28,16 +36,114 @@ def build_status_line(team_initials: list, in_progress: list, completed: list) -
     return "Статусы: " + " ".join([f"[{s}]" for s in symbols])
 
 
+# Участники чек-листа: общий статус задачи считается по их отметкам
+CHECKLIST_MEMBERS = ("AG", "KA")
+# Кто из сотрудников какой участник чек-листа (по username в Telegram и по имени в БД)
+CHECKLIST_MEMBER_USERNAMES = {"alex301182": "AG", "Korudirp": "KA"}
+CHECKLIST_MEMBER_NAMES = {"Vesenko, Aleksandr": "AG", "Cherenkov, Ruslan": "KA"}
+# Длина текста кнопки чек-листа (для мобильных)
+CHECKLIST_BUTTON_TEXT_LENGTH = 20
+CHECKLIST_BUTTON_MAX_LENGTH = 25
+
+
+def checklist_overall_status(statuses: dict, weekly_task_id: int, members=CHECKLIST_MEMBERS) -> str:
+    """
+    Общий статус задачи чек-листа: ✅ - все выполнили, 👤 на каждого взявшего (⏳ или ✅), иначе ⚪
+    statuses - {(weekly_task_id, member): статус}, отсутствующие сочетания - ⚪
+    """
+    member_statuses = [statuses.get((weekly_task_id, member), "⚪") for member in members]
+    if all(status == "✅" for status in member_statuses):
+        return "✅"
+    active_count = sum(1 for status in member_statuses if status in ("⏳", "✅"))
+    return "👤" * active_count if active_count else "⚪"
+
+
+def checklist_member_key(username: str, user_name: str):
+    """Ключ участника чек-листа (AG, KA), под которым хранятся его отметки, или None"""
+    if user_name in CHECKLIST_MEMBERS:
+        return user_name
+    return CHECKLIST_MEMBER_USERNAMES.get(username) or CHECKLIST_MEMBER_NAMES.get(user_name)
+
+
+def checklist_button_text(index: int, task_text: str, status: str) -> str:
+    """Текст кнопки задачи "1. Текст задачи ⚪" с укорачиванием для мобильных"""
+    short_text = task_text
+    if len(short_text) > CHECKLIST_BUTTON_TEXT_LENGTH:
+        short_text = short_text[:CHECKLIST_BUTTON_TEXT_LENGTH - 3] + "..."
+    button_text = f"{index}. {short_text} {status}"
+    if len(button_text) > CHECKLIST_BUTTON_MAX_LENGTH:
+        max_text_len = CHECKLIST_BUTTON_MAX_LENGTH - len(f"{index}. {status}")
+        button_text = f"{index}. {task_text[:max_text_len - 3]}... {status}"
+    return button_text
+
+
+def build_checklist_keyboard(checklist: dict) -> InlineKeyboardMarkup:
+    """Клавиатура чек-листа по модели сообщения (см. Database.get_checklist_message)"""
+    statuses = checklist.get('statuses', {})
+    day = checklist['day']
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            checklist_button_text(i, task_text, checklist_overall_status(statuses, weekly_task_id)),
+            callback_data=f"task_{day}_{i}"
+        )]
+        for i, (weekly_task_id, task_text) in enumerate(checklist['tasks'], 1)
+    ])
+
+
+# Последнее, что мы вывели в сообщение: (chat_id, message_id) -> (хэш текста и клавиатуры, edit_date)
+RENDER_CACHE_SIZE = 1000
+_rendered_messages = OrderedDict()
+
+
+def _render_hash(text: str, reply_markup, parse_mode) -> str:
+    """Хэш содержимого сообщения: текст, клавиатура и режим разметки"""
+    markup = reply_markup.to_dict() if reply_markup is not None else None
+    raw = json.dumps([text, markup, parse_mode], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _remember_render(key, render_hash: str, edit_date):
+    _rendered_messages[key] = (render_hash, edit_date)
+    _rendered_messages.move_to_end(key)
+    while len(_rendered_messages) > RENDER_CACHE_SIZE:
+        _rendered_messages.popitem(last=False)
+
+
 async def safe_edit_message(query, text: str, reply_markup=None, parse_mode='Markdown'):
-    """Безопасное редактирование сообщения с обработкой ошибки 'Message is not modified'"""
+    """
+    Безопасное редактирование сообщения с обработкой ошибки 'Message is not modified'
+    Если сообщение уже показывает то же самое (тот же хэш и его никто не правил после нас -
+    совпадает edit_date), запрос к Telegram не отправляется, только ответ на нажатие
+    """
+    message = query.message
+    key = (message.chat_id, message.message_id) if message else None
+    render_hash = _render_hash(text, reply_markup, parse_mode)
+    if key is not None:
+        cached = _rendered_messages.get(key)
+        if cached == (render_hash, message.edit_date):
+            _rendered_messages.move_to_end(key)
+            metrics.increment('edits.render_cache.hit')
+            try:
+                await query.answer()
+            except Exception:
+                pass  # на нажатие уже ответили
+            return
+        metrics.increment('edits.render_cache.miss')
+    
     try:
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        edited = await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        if key is not None:
+            _remember_render(key, render_hash, getattr(edited, 'edit_date', None))
     except Exception as e:
         error_msg = str(e)
         if "Message is not modified" in error_msg:
             # Игнорируем эту ошибку - сообщение уже имеет нужное содержимое
+            if key is not None:
+                _remember_render(key, render_hash, message.edit_date)
             await query.answer()
         else:
+            if key is not None:
+                _rendered_messages.pop(key, None)
             # Для других ошибок логируем и пробуем отправить новое сообщение
             logger.warning(f"Ошибка редактирования сообщения: {e}")
             try:
@@ -47,445 +153,483 @@ async def safe_edit_message(query, text: str, reply_markup=None, parse_mode='Mar
                 await query.answer("❌ Ошибка обновления сообщения")
 
 
-async def handle_menu_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db):
-    """Обработка нажатий на кнопки меню"""
+# Маршруты кнопок меню: menu_*, team_*, weekly_*, test_*
+menu_router = CallbackRouter('menu')
+# Эти кнопки - точки входа ConversationHandler, здесь их пропускаем
+menu_router.ignore("menu_create_task", "menu_add_employee", "team_add", "weekly_add")
+
+
+@menu_router.route("menu_main", "menu_back")
+async def show_main_menu(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Главное меню"""
+    from menu import get_main_menu
+    text = (
+        "👋 **ГЛАВНОЕ МЕНЮ**\n\n"
+        "Выберите действие:"
+    )
+    try:
+        await safe_edit_message(query, text, get_main_menu())
+    except Exception as edit_error:
+        # Если не удалось отредактировать (например, сообщение с фото), отправляем новое
+        logger.warning(f"Не удалось отредактировать сообщение, отправляем новое: {edit_error}")
+        await query.message.reply_text(text, reply_markup=get_main_menu(), parse_mode='Markdown')
+
+
+@menu_router.route("menu_view_tasks")
+async def show_active_tasks(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Список активных задач"""
+    from menu import get_tasks_menu
+    tasks = await db.get_custom_tasks(status='active')
+    if not tasks:
+        text = "📋 **МОИ ЗАДАЧИ**\n\nУ вас пока нет активных задач."
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+        ]])
+    else:
+        text = f"📋 **МОИ ЗАДАЧИ**\n\nНайдено задач: {len(tasks)}"
+        keyboard = get_tasks_menu(tasks)
+    await safe_edit_message(query, text, keyboard)
+
+
+@menu_router.route("menu_complete_task")
+async def show_tasks_to_complete(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Выбор задачи для завершения"""
+    from menu import get_tasks_menu
+    tasks = await db.get_custom_tasks(status='active')
+    if not tasks:
+        text = "✅ **ЗАВЕРШЕНИЕ ЗАДАЧИ**\n\nУ вас нет активных задач для завершения."
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+        ]])
+    else:
+        text = "✅ **ЗАВЕРШЕНИЕ ЗАДАЧИ**\n\nВыберите задачу:"
+        keyboard = get_tasks_menu(tasks)
+    await safe_edit_message(query, text, keyboard)
+
+
+@menu_router.route("menu_settings")
+async def show_settings(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Настройки"""
+    text = (
+        "⚙️ **НАСТРОЙКИ**\n\n"
+        "Здесь будут настройки бота"
+    )
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+    ]])
+    await safe_edit_message(query, text, keyboard)
+
+
+@menu_router.route("menu_testing")
+async def show_testing_menu(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Меню тестирования"""
+    from menu import get_testing_menu
+    text = (
+        "🧪 **ТЕСТИРОВАНИЕ**\n\n"
+        "Выберите действие для тестирования:"
+    )
+    await safe_edit_message(query, text, get_testing_menu())
+
+
+@menu_router.route("menu_team")
+async def show_team_menu(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Меню управления командой"""
+    # Показываем меню команды
+    from menu import get_team_menu
+    text = "👥 **УПРАВЛЕНИЕ КОМАНДОЙ**"
+    await safe_edit_message(query, text, get_team_menu())
+
+
+@menu_router.route("team_list_btn")
+async def show_team_list(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Список команды"""
+    team = await db.get_team()
+    if not team:
+        text = "👥 **КОМАНДА**\n\nСписок пуст"
+    else:
+        lines = [f"@{m.get('username')} ({m.get('name', m.get('initials', ''))})" for m in team]
+        text = "👥 **КОМАНДА**\n\n" + "\n".join(lines)
+    from menu import get_team_menu
+    await safe_edit_message(query, text, get_team_menu())
+
+
+@menu_router.route("team_remove")
+async def choose_member_to_remove(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Выбор сотрудника для удаления"""
+    # Показываем список сотрудников для удаления
+    team = await db.get_team()
+    if not team:
+        text = "👥 **УДАЛЕНИЕ СОТРУДНИКА**\n\nСписок пуст. Нечего удалять."
+        from menu import get_team_menu
+        await safe_edit_message(query, text, get_team_menu())
+    else:
+        text = "🗑️ **УДАЛЕНИЕ СОТРУДНИКА**\n\nВыберите сотрудника для удаления:"
+        from menu import get_team_remove_menu
+        await safe_edit_message(query, text, get_team_remove_menu(team))
+
+
+@menu_router.route("team_remove_confirm_{username}", action="team_remove_confirm")
+async def remove_member(query, context: ContextTypes.DEFAULT_TYPE, db, username: str):
+    """Подтверждение удаления сотрудника"""
     try:
+        await db.remove_user(username)
+        text = f"✅ **СОТРУДНИК УДАЛЕН**\n\n@{username} успешно удален из команды."
+        from menu import get_team_menu
+        await safe_edit_message(query, text, get_team_menu())
+        await query.answer("✅ Сотрудник удален")
+        logger.info(f"Сотрудник @{username} удален из команды")
+    except Exception as e:
+        logger.error(f"Ошибка удаления сотрудника @{username}: {e}", exc_info=True)
+        await query.answer("❌ Ошибка при удалении", show_alert=True)
+
+
+@menu_router.route("team_remove_cancel")
+async def cancel_member_removal(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Отмена удаления сотрудника"""
+    from menu import get_team_menu
+    text = "❌ **ОТМЕНА**\n\nУдаление отменено."
+    await safe_edit_message(query, text, get_team_menu())
+    await query.answer("Отменено")
+
+
+@menu_router.route("team_remove_{username}", action="team_remove")
+async def confirm_member_removal(query, context: ContextTypes.DEFAULT_TYPE, db, username: str):
+    """Подтверждение перед удалением сотрудника"""
+    text = (
+        f"⚠️ **ПОДТВЕРЖДЕНИЕ УДАЛЕНИЯ**\n\n"
+        f"Вы уверены, что хотите удалить @{username} из команды?\n\n"
+        f"Это действие нельзя отменить."
+    )
+    from menu import get_team_remove_confirm_menu
+    await safe_edit_message(query, text, get_team_remove_confirm_menu(username))
+    await query.answer()
+
+
+@menu_router.route("team_earned")
+async def choose_member_earned(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Кнопка "Сотрудник заработал" - выбор сотрудника"""
+    team = await db.get_team()
+    if not team:
+        text = "👥 **СОТРУДНИК ЗАРАБОТАЛ**\n\nСписок команды пуст."
+        from menu import get_team_menu
+        await safe_edit_message(query, text, get_team_menu())
+    else:
+        text = "💰 **СОТРУДНИК ЗАРАБОТАЛ**\n\nВыберите сотрудника:"
+        keyboard = []
+        for member in team:
+            username = member.get('username', '')
+            name = member.get('name', member.get('initials', ''))
+            keyboard.append([
+                InlineKeyboardButton(
+                    f"💰 @{username} ({name})",
+                    callback_data=encode_callback_data("team_earned", username)
+                )
+            ])
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="menu_team")])
+        await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
         await query.answer()
-        user = query.from_user
-        username = user.username if user else None
-        
-        if data == "menu_main" or data == "menu_back":
-            from menu import get_main_menu
-            text = (
-                "👋 **ГЛАВНОЕ МЕНЮ**\n\n"
-                "Выберите действие:"
-            )
-            try:
-                await safe_edit_message(query, text, get_main_menu())
-            except Exception as edit_error:
-                # Если не удалось отредактировать (например, сообщение с фото), отправляем новое
-                logger.warning(f"Не удалось отредактировать сообщение, отправляем новое: {edit_error}")
-                await query.message.reply_text(text, reply_markup=get_main_menu(), parse_mode='Markdown')
-        
-        elif data == "menu_create_task":
-            # ConversationHandler обработает это через entry_points
-            # НЕ обрабатываем здесь, чтобы ConversationHandler мог перехватить
-            # Возвращаемся без обработки - ConversationHandler сам обработает
-            return
-        
-        elif data == "menu_view_tasks":
-            from menu import get_tasks_menu, get_main_menu
-            tasks = db.get_custom_tasks(status='active')
-            if not tasks:
-                text = "📋 **МОИ ЗАДАЧИ**\n\nУ вас пока нет активных задач."
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
-                ]])
-            else:
-                text = f"📋 **МОИ ЗАДАЧИ**\n\nНайдено задач: {len(tasks)}"
-                keyboard = get_tasks_menu(tasks)
-            await safe_edit_message(query, text, keyboard)
-        
-        elif data == "menu_complete_task":
-            tasks = db.get_custom_tasks(status='active')
-            if not tasks:
-                text = "✅ **ЗАВЕРШЕНИЕ ЗАДАЧИ**\n\nУ вас нет активных задач для завершения."
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
-                ]])
+
+
+@menu_router.route("team_earned_{username}", action="team_earned")
+async def mark_member_earned(query, context: ContextTypes.DEFAULT_TYPE, db, username: str):
+    """Отметка "заработал" для выбранного сотрудника"""
+    member = await db.get_member_by_username(username)
+    if member:
+        name = member.get('name', member.get('initials', ''))
+        text = f"✅ **ОТМЕЧЕНО**\n\n@{username} ({name}) заработал!"
+        from menu import get_team_menu
+        await safe_edit_message(query, text, get_team_menu())
+        await query.answer("✅ Отмечено")
+        logger.info(f"Сотрудник @{username} отмечен как заработавший")
+    else:
+        await query.answer("❌ Сотрудник не найден", show_alert=True)
+
+
+@menu_router.route("menu_help")
+async def show_help(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Помощь"""
+    text = (
+        "❓ **ПОМОЩЬ**\n\n"
+        "**Основные функции:**\n"
+        "📝 **Создать задачу** - создать новую задачу с описанием, сроком и исполнителем\n\n"
+        "👥 **Команда** - управление сотрудниками:\n"
+        "  • Просмотр списка команды\n"
+        "  • Добавление новых сотрудников\n"
+        "  • Удаление сотрудников\n\n"
+        "📅 **Еженедельные задачи** - управление задачами по дням недели:\n"
+        "  • Просмотр задач на день\n"
+        "  • Добавление новых задач\n"
+        "  • Редактирование задач\n"
+        "  • Удаление задач\n\n"
+        "**Дополнительно:**\n"
+        "🧪 **Тестирование** - тестовые функции бота"
+    )
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+    ]])
+    await safe_edit_message(query, text, keyboard)
+
+
+@menu_router.route("menu_weekly_tasks")
+async def show_weekly_tasks_menu(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Меню еженедельных задач"""
+    from menu import get_weekly_tasks_menu
+    text = (
+        "📅 **ЕЖЕНЕДЕЛЬНЫЕ ЗАДАЧИ**\n\n"
+        "Управление задачами по дням недели:\n"
+        "• Просмотр задач на день\n"
+        "• Добавление новых задач\n"
+        "• Редактирование задач\n"
+        "• Удаление задач"
+    )
+    await safe_edit_message(query, text, get_weekly_tasks_menu())
+
+
+@menu_router.route("weekly_view")
+async def choose_weekly_view_day(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Выбор дня для просмотра еженедельных задач"""
+    from menu import get_weekly_day_menu
+    text = "📋 **ПРОСМОТР ЗАДАЧ**\n\nВыберите день недели:"
+    keyboard = get_weekly_day_menu()
+    await safe_edit_message(query, text, keyboard)
+
+
+@menu_router.route("weekly_day_{day:int}")
+async def show_weekly_day(query, context: ContextTypes.DEFAULT_TYPE, db, day: int):
+    """Еженедельные задачи на день"""
+    day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
+    day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
+
+    tasks = await db.get_weekly_tasks(day)
+    if not tasks:
+        text = f"📋 **{day_name.upper()}**\n\nЗадач пока нет."
+    else:
+        lines = [f"{i+1}. {task['task_text']}" for i, task in enumerate(tasks)]
+        text = f"📋 **{day_name.upper()}**\n\n" + "\n".join(lines)
+
+    from menu import get_weekly_day_menu
+    await safe_edit_message(query, text, get_weekly_day_menu())
+
+
+@menu_router.route("weekly_edit")
+async def choose_weekly_edit_day(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Выбор дня для редактирования"""
+    keyboard = [
+        [
+            InlineKeyboardButton("Понедельник", callback_data="weekly_edit_day_0"),
+            InlineKeyboardButton("Вторник", callback_data="weekly_edit_day_1")
+        ],
+        [
+            InlineKeyboardButton("Среда", callback_data="weekly_edit_day_2"),
+            InlineKeyboardButton("Четверг", callback_data="weekly_edit_day_3")
+        ],
+        [
+            InlineKeyboardButton("Пятница", callback_data="weekly_edit_day_4")
+        ],
+        [
+            InlineKeyboardButton("🔙 Назад", callback_data="menu_weekly_tasks")
+        ]
+    ]
+    text = "✏️ **РЕДАКТИРОВАНИЕ ЗАДАЧ**\n\nВыберите день недели:"
+    await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
+
+
+@menu_router.route("weekly_delete")
+async def choose_weekly_delete_day(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Выбор дня для удаления"""
+    # Создаем специальное меню для выбора дня при удалении
+    keyboard = [
+        [
+            InlineKeyboardButton("Понедельник", callback_data="weekly_delete_day_0"),
+            InlineKeyboardButton("Вторник", callback_data="weekly_delete_day_1")
+        ],
+        [
+            InlineKeyboardButton("Среда", callback_data="weekly_delete_day_2"),
+            InlineKeyboardButton("Четверг", callback_data="weekly_delete_day_3")
+        ],
+        [
+            InlineKeyboardButton("Пятница", callback_data="weekly_delete_day_4")
+        ],
+        [
+            InlineKeyboardButton("🔙 Назад", callback_data="menu_weekly_tasks")
+        ]
+    ]
+    text = "🗑️ **УДАЛЕНИЕ ЗАДАЧИ**\n\nВыберите день недели:"
+    await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
+
+
+@menu_router.route("weekly_edit_day_{day:int}")
+async def choose_weekly_task_to_edit(query, context: ContextTypes.DEFAULT_TYPE, db, day: int):
+    """Выбор задачи дня для редактирования"""
+    day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
+    day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
+
+    tasks = await db.get_weekly_tasks(day)
+    if not tasks:
+        text = f"✏️ **РЕДАКТИРОВАНИЕ: {day_name.upper()}**\n\nЗадач пока нет."
+        from menu import get_weekly_day_menu
+        await safe_edit_message(query, text, get_weekly_day_menu())
+    else:
+        from menu import get_weekly_tasks_list_menu
+        text = f"✏️ **РЕДАКТИРОВАНИЕ: {day_name.upper()}**\n\nВыберите задачу для редактирования:"
+        await safe_edit_message(query, text, get_weekly_tasks_list_menu(tasks, day, "weekly_edit_task"))
+
+
+@menu_router.route("weekly_edit_task_{task_id:int}")
+async def start_weekly_task_edit(query, context: ContextTypes.DEFAULT_TYPE, db, task_id: int):
+    """Начало редактирования еженедельной задачи"""
+    all_tasks = await db.get_weekly_tasks()
+    task_info = next((t for t in all_tasks if t['id'] == task_id), None)
+    if task_info:
+        context.user_data['weekly_edit_task_id'] = task_id
+        text = (
+            f"✏️ **РЕДАКТИРОВАНИЕ ЗАДАЧИ**\n\n"
+            f"Текущий текст: {task_info['task_text']}\n\n"
+            "Введите новый текст задачи:"
+        )
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("❌ Отмена", callback_data="weekly_edit_cancel")
+        ]])
+        await safe_edit_message(query, text, keyboard)
+        # Сохраняем состояние для обработки текста
+        context.user_data['weekly_edit_state'] = True
+    else:
+        await query.answer("❌ Задача не найдена", show_alert=True)
+
+
+@menu_router.route("weekly_delete_day_{day:int}")
+async def choose_weekly_task_to_delete(query, context: ContextTypes.DEFAULT_TYPE, db, day: int):
+    """Выбор задачи дня для удаления"""
+    day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
+    day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
+
+    tasks = await db.get_weekly_tasks(day)
+    if not tasks:
+        text = f"🗑️ **УДАЛЕНИЕ: {day_name.upper()}**\n\nЗадач пока нет."
+        from menu import get_weekly_day_menu
+        await safe_edit_message(query, text, get_weekly_day_menu())
+    else:
+        from menu import get_weekly_tasks_list_menu
+        text = f"🗑️ **УДАЛЕНИЕ: {day_name.upper()}**\n\nВыберите задачу для удаления:"
+        await safe_edit_message(query, text, get_weekly_tasks_list_menu(tasks, day, "weekly_delete_task"))
+
+
+@menu_router.route("weekly_delete_task_{task_id:int}")
+async def delete_weekly_task(query, context: ContextTypes.DEFAULT_TYPE, db, task_id: int):
+    """Удаление еженедельной задачи"""
+    all_tasks = await db.get_weekly_tasks()
+    task_info = next((t for t in all_tasks if t['id'] == task_id), None)
+    if task_info:
+        await db.delete_weekly_task(task_id)
+        await query.answer("✅ Задача удалена", show_alert=True)
+        # Возвращаемся к меню
+        from menu import get_weekly_tasks_menu
+        text = "📅 **ЕЖЕНЕДЕЛЬНЫЕ ЗАДАЧИ**\n\nЗадача успешно удалена."
+        await safe_edit_message(query, text, get_weekly_tasks_menu())
+    else:
+        await query.answer("❌ Задача не найдена", show_alert=True)
+
+
+@menu_router.route("test_daily_tasks")
+async def test_daily_tasks(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Тестовая отправка ежедневных задач"""
+    # Тестовая отправка ежедневных задач - вызываем send_morning_tasks напрямую
+    try:
+        await query.answer("⏳ Отправка задач...")
+
+        # Используем функцию из bot_data или импортируем напрямую
+        if 'send_morning_tasks' in context.bot_data:
+            send_morning_tasks_func = context.bot_data['send_morning_tasks']
+        else:
+            # Если нет в bot_data, импортируем напрямую
+            import sys
+            import importlib
+            if 'bot' in sys.modules:
+                bot_module = sys.modules['bot']
+                send_morning_tasks_func = bot_module.send_morning_tasks
             else:
-                text = "✅ **ЗАВЕРШЕНИЕ ЗАДАЧИ**\n\nВыберите задачу:"
-                keyboard = get_tasks_menu(tasks)
-            await safe_edit_message(query, text, keyboard)
-        
-        elif data == "menu_settings":
-            text = (
-                "⚙️ **НАСТРОЙКИ**\n\n"
-                "Здесь будут настройки бота"
-            )
+                raise ImportError("Не удалось найти функцию send_morning_tasks")
+
+        # Создаем обертку для app, как в force_morning_command
+        class AppWrapper:
+            def __init__(self, bot, bot_data):
+                self.bot = bot
+                self.bot_data = bot_data
+
+        app_wrapper = AppWrapper(context.bot, context.bot_data)
+
+        # Вызываем функцию
+        await send_morning_tasks_func(app_wrapper, force_weekend=True)
+
+        text = "✅ **ЕЖЕДНЕВНЫЕ ЗАДАЧИ**\n\nЗадачи успешно отправлены в группу!"
+
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
+        ]])
+        await safe_edit_message(query, text, keyboard)
+    except Exception as e:
+        logger.error(f"Ошибка отправки ежедневных задач: {e}", exc_info=True)
+        try:
+            text = f"❌ **ОШИБКА**\n\nНе удалось отправить задачи:\n{str(e)[:200]}"
             keyboard = InlineKeyboardMarkup([[
-                InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+                InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
             ]])
             await safe_edit_message(query, text, keyboard)
-        
-        elif data == "menu_testing":
-            from menu import get_testing_menu
-            text = (
-                "🧪 **ТЕСТИРОВАНИЕ**\n\n"
-                "Выберите действие для тестирования:"
-            )
-            await safe_edit_message(query, text, get_testing_menu())
-        
-        elif data == "menu_team":
-            # Показываем меню команды
-            from menu import get_team_menu
-            text = "👥 **УПРАВЛЕНИЕ КОМАНДОЙ**"
-            await safe_edit_message(query, text, get_team_menu())
-        
-        elif data == "team_list_btn":
-            team = db.get_team()
-            if not team:
-                text = "👥 **КОМАНДА**\n\nСписок пуст"
-            else:
-                lines = [f"@{m.get('username')} ({m.get('name', m.get('initials', ''))})" for m in team]
-                text = "👥 **КОМАНДА**\n\n" + "\n".join(lines)
-            from menu import get_team_menu
-            await safe_edit_message(query, text, get_team_menu())
-        
-        elif data == "team_remove":
-            # Показываем список сотрудников для удаления
-            team = db.get_team()
-            if not team:
-                text = "👥 **УДАЛЕНИЕ СОТРУДНИКА**\n\nСписок пуст. Нечего удалять."
-                from menu import get_team_menu
-                await safe_edit_message(query, text, get_team_menu())
-            else:
-                text = "🗑️ **УДАЛЕНИЕ СОТРУДНИКА**\n\nВыберите сотрудника для удаления:"
-                from menu import get_team_remove_menu
-                await safe_edit_message(query, text, get_team_remove_menu(team))
-        
-        elif data.startswith("team_remove_"):
-            # Обработка выбора сотрудника для удаления или подтверждения
-            if data.startswith("team_remove_confirm_"):
-                # Подтверждение удаления
-                username = data.replace("team_remove_confirm_", "")
-                try:
-                    db.remove_user(username)
-                    text = f"✅ **СОТРУДНИК УДАЛЕН**\n\n@{username} успешно удален из команды."
-                    from menu import get_team_menu
-                    await safe_edit_message(query, text, get_team_menu())
-                    await query.answer("✅ Сотрудник удален")
-                    logger.info(f"Сотрудник @{username} удален из команды")
-                except Exception as e:
-                    logger.error(f"Ошибка удаления сотрудника @{username}: {e}", exc_info=True)
-                    await query.answer("❌ Ошибка при удалении", show_alert=True)
-            elif data == "team_remove_cancel":
-                # Отмена удаления
-                from menu import get_team_menu
-                text = "❌ **ОТМЕНА**\n\nУдаление отменено."
-                await safe_edit_message(query, text, get_team_menu())
-                await query.answer("Отменено")
-            else:
-                # Выбор сотрудника для удаления - показываем подтверждение
-                username = data.replace("team_remove_", "")
-                text = (
-                    f"⚠️ **ПОДТВЕРЖДЕНИЕ УДАЛЕНИЯ**\n\n"
-                    f"Вы уверены, что хотите удалить @{username} из команды?\n\n"
-                    f"Это действие нельзя отменить."
-                )
-                from menu import get_team_remove_confirm_menu
-                await safe_edit_message(query, text, get_team_remove_confirm_menu(username))
-                await query.answer()
-        
-        elif data == "team_earned":
-            # Кнопка "Сотрудник заработал"
-            team = db.get_team()
-            if not team:
-                text = "👥 **СОТРУДНИК ЗАРАБОТАЛ**\n\nСписок команды пуст."
-                from menu import get_team_menu
-                await safe_edit_message(query, text, get_team_menu())
-            else:
-                text = "💰 **СОТРУДНИК ЗАРАБОТАЛ**\n\nВыберите сотрудника:"
-                keyboard = []
-                for member in team:
-                    username = member.get('username', '')
-                    name = member.get('name', member.get('initials', ''))
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"💰 @{username} ({name})",
-                            callback_data=f"team_earned_{username}"
-                        )
-                    ])
-                keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="menu_team")])
-                await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
-                await query.answer()
-        
-        elif data.startswith("team_earned_"):
-            # Обработка выбора сотрудника для отметки "заработал"
-            username = data.replace("team_earned_", "")
-            team = db.get_team()
-            member = next((m for m in team if m.get('username') == username), None)
-            if member:
-                name = member.get('name', member.get('initials', ''))
-                text = f"✅ **ОТМЕЧЕНО**\n\n@{username} ({name}) заработал!"
-                from menu import get_team_menu
-                await safe_edit_message(query, text, get_team_menu())
-                await query.answer("✅ Отмечено")
-                logger.info(f"Сотрудник @{username} отмечен как заработавший")
+        except:
+            await query.answer(f"❌ Ошибка: {str(e)[:100]}", show_alert=True)
+
+
+@menu_router.route("test_employees")
+async def test_employees(query, context: ContextTypes.DEFAULT_TYPE, db):
+    """Контроль сотрудников - отправка кнопок присутствия (как в 07:50)"""
+    try:
+        await query.answer("⏳ Отправка кнопок...")
+
+        # Используем функцию из bot_data или импортируем напрямую
+        if 'send_presence_buttons' in context.bot_data:
+            send_presence_buttons_func = context.bot_data['send_presence_buttons']
+        else:
+            # Если нет в bot_data, импортируем напрямую
+            import sys
+            if 'bot' in sys.modules:
+                bot_module = sys.modules['bot']
+                send_presence_buttons_func = bot_module.send_presence_buttons
             else:
-                await query.answer("❌ Сотрудник не найден", show_alert=True)
-        
-        elif data == "menu_help":
-            text = (
-                "❓ **ПОМОЩЬ**\n\n"
-                "**Основные функции:**\n"
-                "📝 **Создать задачу** - создать новую задачу с описанием, сроком и исполнителем\n\n"
-                "👥 **Команда** - управление сотрудниками:\n"
-                "  • Просмотр списка команды\n"
-                "  • Добавление новых сотрудников\n"
-                "  • Удаление сотрудников\n\n"
-                "📅 **Еженедельные задачи** - управление задачами по дням недели:\n"
-                "  • Просмотр задач на день\n"
-                "  • Добавление новых задач\n"
-                "  • Редактирование задач\n"
-                "  • Удаление задач\n\n"
-                "**Дополнительно:**\n"
-                "🧪 **Тестирование** - тестовые функции бота"
-            )
+                raise ImportError("Не удалось найти функцию send_presence_buttons")
+
+        # Создаем обертку для app
+        class AppWrapper:
+            def __init__(self, bot, bot_data):
+                self.bot = bot
+                self.bot_data = bot_data
+
+        app_wrapper = AppWrapper(context.bot, context.bot_data)
+
+        # Вызываем функцию с force_weekend=True для тестирования
+        await send_presence_buttons_func(app_wrapper, force_weekend=True)
+
+        text = "✅ **КОНТРОЛЬ СОТРУДНИКОВ**\n\nКнопки 'На рабочем месте' и 'Опаздываю' отправлены в группу!"
+
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
+        ]])
+        await safe_edit_message(query, text, keyboard)
+    except Exception as e:
+        logger.error(f"Ошибка отправки кнопок присутствия: {e}", exc_info=True)
+        try:
+            text = f"❌ **ОШИБКА**\n\nНе удалось отправить кнопки:\n{str(e)[:200]}"
             keyboard = InlineKeyboardMarkup([[
-                InlineKeyboardButton("🔙 Назад в меню", callback_data="menu_main")
+                InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
             ]])
             await safe_edit_message(query, text, keyboard)
-        
-        elif data == "menu_team":
-            from menu import get_team_menu
-            text = (
-                "👥 **УПРАВЛЕНИЕ КОМАНДОЙ**\n\n"
-                "Выберите действие:"
-            )
-            await safe_edit_message(query, text, get_team_menu())
-        
-        elif data == "menu_weekly_tasks":
-            from menu import get_weekly_tasks_menu
-            text = (
-                "📅 **ЕЖЕНЕДЕЛЬНЫЕ ЗАДАЧИ**\n\n"
-                "Управление задачами по дням недели:\n"
-                "• Просмотр задач на день\n"
-                "• Добавление новых задач\n"
-                "• Редактирование задач\n"
-                "• Удаление задач"
-            )
-            await safe_edit_message(query, text, get_weekly_tasks_menu())
-        
-        elif data == "weekly_view":
-            from menu import get_weekly_day_menu
-            text = "📋 **ПРОСМОТР ЗАДАЧ**\n\nВыберите день недели:"
-            keyboard = get_weekly_day_menu()
-            await safe_edit_message(query, text, keyboard)
-        
-        elif data.startswith("weekly_day_"):
-            day = int(data.split("_")[-1])
-            day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
-            day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
-            
-            tasks = db.get_weekly_tasks(day)
-            if not tasks:
-                text = f"📋 **{day_name.upper()}**\n\nЗадач пока нет."
-            else:
-                lines = [f"{i+1}. {task['task_text']}" for i, task in enumerate(tasks)]
-                text = f"📋 **{day_name.upper()}**\n\n" + "\n".join(lines)
-            
-            from menu import get_weekly_day_menu
-            await safe_edit_message(query, text, get_weekly_day_menu())
-        
-        elif data == "weekly_add":
-            # ConversationHandler обработает это
-            return
-        
-        elif data == "weekly_edit":
-            keyboard = [
-                [
-                    InlineKeyboardButton("Понедельник", callback_data="weekly_edit_day_0"),
-                    InlineKeyboardButton("Вторник", callback_data="weekly_edit_day_1")
-                ],
-                [
-                    InlineKeyboardButton("Среда", callback_data="weekly_edit_day_2"),
-                    InlineKeyboardButton("Четверг", callback_data="weekly_edit_day_3")
-                ],
-                [
-                    InlineKeyboardButton("Пятница", callback_data="weekly_edit_day_4")
-                ],
-                [
-                    InlineKeyboardButton("🔙 Назад", callback_data="menu_weekly_tasks")
-                ]
-            ]
-            text = "✏️ **РЕДАКТИРОВАНИЕ ЗАДАЧ**\n\nВыберите день недели:"
-            await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
-        
-        elif data == "weekly_delete":
-            # Создаем специальное меню для выбора дня при удалении
-            keyboard = [
-                [
-                    InlineKeyboardButton("Понедельник", callback_data="weekly_delete_day_0"),
-                    InlineKeyboardButton("Вторник", callback_data="weekly_delete_day_1")
-                ],
-                [
-                    InlineKeyboardButton("Среда", callback_data="weekly_delete_day_2"),
-                    InlineKeyboardButton("Четверг", callback_data="weekly_delete_day_3")
-                ],
-                [
-                    InlineKeyboardButton("Пятница", callback_data="weekly_delete_day_4")
-                ],
-                [
-                    InlineKeyboardButton("🔙 Назад", callback_data="menu_weekly_tasks")
-                ]
-            ]
-            text = "🗑️ **УДАЛЕНИЕ ЗАДАЧИ**\n\nВыберите день недели:"
-            await safe_edit_message(query, text, InlineKeyboardMarkup(keyboard))
-        
-        elif data.startswith("weekly_edit_day_"):
-            day = int(data.split("_")[-1])
-            day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
-            day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
-            
-            tasks = db.get_weekly_tasks(day)
-            if not tasks:
-                text = f"✏️ **РЕДАКТИРОВАНИЕ: {day_name.upper()}**\n\nЗадач пока нет."
-                from menu import get_weekly_day_menu
-                await safe_edit_message(query, text, get_weekly_day_menu())
-            else:
-                from menu import get_weekly_tasks_list_menu
-                text = f"✏️ **РЕДАКТИРОВАНИЕ: {day_name.upper()}**\n\nВыберите задачу для редактирования:"
-                await safe_edit_message(query, text, get_weekly_tasks_list_menu(tasks, day, "weekly_edit_task"))
-        
-        elif data.startswith("weekly_edit_task_"):
-            task_id = int(data.split("_")[-1])
-            all_tasks = db.get_weekly_tasks()
-            task_info = next((t for t in all_tasks if t['id'] == task_id), None)
-            if task_info:
-                context.user_data['weekly_edit_task_id'] = task_id
-                text = (
-                    f"✏️ **РЕДАКТИРОВАНИЕ ЗАДАЧИ**\n\n"
-                    f"Текущий текст: {task_info['task_text']}\n\n"
-                    "Введите новый текст задачи:"
-                )
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("❌ Отмена", callback_data="weekly_edit_cancel")
-                ]])
-                await safe_edit_message(query, text, keyboard)
-                # Сохраняем состояние для обработки текста
-                context.user_data['weekly_edit_state'] = True
-            else:
-                await query.answer("❌ Задача не найдена", show_alert=True)
-        
-        elif data.startswith("weekly_delete_day_"):
-            day = int(data.split("_")[-1])
-            day_names = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница"]
-            day_name = day_names[day] if 0 <= day < 5 else f"День {day}"
-            
-            tasks = db.get_weekly_tasks(day)
-            if not tasks:
-                text = f"🗑️ **УДАЛЕНИЕ: {day_name.upper()}**\n\nЗадач пока нет."
-                from menu import get_weekly_day_menu
-                await safe_edit_message(query, text, get_weekly_day_menu())
-            else:
-                from menu import get_weekly_tasks_list_menu
-                text = f"🗑️ **УДАЛЕНИЕ: {day_name.upper()}**\n\nВыберите задачу для удаления:"
-                await safe_edit_message(query, text, get_weekly_tasks_list_menu(tasks, day, "weekly_delete_task"))
-        
-        elif data.startswith("weekly_delete_task_"):
-            task_id = int(data.split("_")[-1])
-            all_tasks = db.get_weekly_tasks()
-            task_info = next((t for t in all_tasks if t['id'] == task_id), None)
-            if task_info:
-                db.delete_weekly_task(task_id)
-                await query.answer("✅ Задача удалена", show_alert=True)
-                # Возвращаемся к меню
-                from menu import get_weekly_tasks_menu
-                text = "📅 **ЕЖЕНЕДЕЛЬНЫЕ ЗАДАЧИ**\n\nЗадача успешно удалена."
-                await safe_edit_message(query, text, get_weekly_tasks_menu())
-            else:
-                await query.answer("❌ Задача не найдена", show_alert=True)
-        
-        elif data == "team_add":
-            # ConversationHandler обработает это через entry_points
-            # НЕ обрабатываем здесь, чтобы ConversationHandler мог перехватить
-            return
-        
-        elif data == "menu_add_employee":
-            # ConversationHandler обработает это через entry_points
-            # НЕ обрабатываем здесь, чтобы ConversationHandler мог перехватить
-            return
-        
-        elif data == "test_daily_tasks":
-            # Тестовая отправка ежедневных задач - вызываем send_morning_tasks напрямую
-            try:
-                await query.answer("⏳ Отправка задач...")
-                
-                # Используем функцию из bot_data или импортируем напрямую
-                if 'send_morning_tasks' in context.bot_data:
-                    send_morning_tasks_func = context.bot_data['send_morning_tasks']
-                else:
-                    # Если нет в bot_data, импортируем напрямую
-                    import sys
-                    import importlib
-                    if 'bot' in sys.modules:
-                        bot_module = sys.modules['bot']
-                        send_morning_tasks_func = bot_module.send_morning_tasks
-                    else:
-                        raise ImportError("Не удалось найти функцию send_morning_tasks")
-                
-                # Создаем обертку для app, как в force_morning_command
-                class AppWrapper:
-                    def __init__(self, bot):
-                        self.bot = bot
-                
-                app_wrapper = AppWrapper(context.bot)
-                
-                # Вызываем функцию
-                await send_morning_tasks_func(app_wrapper, force_weekend=True)
-                
-                text = "✅ **ЕЖЕДНЕВНЫЕ ЗАДАЧИ**\n\nЗадачи успешно отправлены в группу!"
-                
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
-                ]])
-                await safe_edit_message(query, text, keyboard)
-            except Exception as e:
-                logger.error(f"Ошибка отправки ежедневных задач: {e}", exc_info=True)
-                try:
-                    text = f"❌ **ОШИБКА**\n\nНе удалось отправить задачи:\n{str(e)[:200]}"
-                    keyboard = InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
-                    ]])
-                    await safe_edit_message(query, text, keyboard)
-                except:
-                    await query.answer(f"❌ Ошибка: {str(e)[:100]}", show_alert=True)
-        
-        elif data == "test_employees":
-            # Контроль сотрудников - отправка кнопок присутствия (как в 07:50)
-            try:
-                await query.answer("⏳ Отправка кнопок...")
-                
-                # Используем функцию из bot_data или импортируем напрямую
-                if 'send_presence_buttons' in context.bot_data:
-                    send_presence_buttons_func = context.bot_data['send_presence_buttons']
-                else:
-                    # Если нет в bot_data, импортируем напрямую
-                    import sys
-                    if 'bot' in sys.modules:
-                        bot_module = sys.modules['bot']
-                        send_presence_buttons_func = bot_module.send_presence_buttons
-                    else:
-                        raise ImportError("Не удалось найти функцию send_presence_buttons")
-                
-                # Создаем обертку для app
-                class AppWrapper:
-                    def __init__(self, bot):
-                        self.bot = bot
-                
-                app_wrapper = AppWrapper(context.bot)
-                
-                # Вызываем функцию с force_weekend=True для тестирования
-                await send_presence_buttons_func(app_wrapper, force_weekend=True)
-                
-                text = "✅ **КОНТРОЛЬ СОТРУДНИКОВ**\n\nКнопки 'На рабочем месте' и 'Опаздываю' отправлены в группу!"
-                
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
-                ]])
-                await safe_edit_message(query, text, keyboard)
-            except Exception as e:
-                logger.error(f"Ошибка отправки кнопок присутствия: {e}", exc_info=True)
-                try:
-                    text = f"❌ **ОШИБКА**\n\nНе удалось отправить кнопки:\n{str(e)[:200]}"
-                    keyboard = InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 К тестированию", callback_data="menu_testing")
-                    ]])
-                    await safe_edit_message(query, text, keyboard)
-                except:
-                    await query.answer(f"❌ Ошибка: {str(e)[:100]}", show_alert=True)
-        
+        except:
+            await query.answer(f"❌ Ошибка: {str(e)[:100]}", show_alert=True)
+
+async def handle_menu_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db):
+    """Обработка нажатий на кнопки меню (обработчик выбирается по menu_router)"""
+    try:
+        await query.answer()
+        await menu_router.dispatch(data, query, context, db)
     except Exception as e:
         logger.error(f"Ошибка в handle_menu_callback: {e}", exc_info=True)
         await query.answer("❌ Произошла ошибка")
@@ -505,7 +649,7 @@ async def handle_presence_callback(query, data: str, context: ContextTypes.DEFAU
         if data == "presence_here":
             # На рабочем месте - отправляем сообщение в общий чат
             time_str = datetime.now(MOSCOW_TZ).strftime("%H:%M")
-            db.save_presence(username, user_id, "here", time=time_str)
+            await db.save_presence(username, user_id, "here", time=time_str)
             
             # Отправляем сообщение в общий чат от пользователя
             try:
@@ -517,7 +661,8 @@ async def handle_presence_callback(query, data: str, context: ContextTypes.DEFAU
                 if chat_id:
                     chat_id = int(chat_id) if isinstance(chat_id, str) else chat_id
                     message_text = f"На рабочем месте. {time_str}"
-                    await context.bot.send_message(
+                    await send_message(
+                        context,
                         chat_id=chat_id,
                         text=message_text
                     )
@@ -610,7 +755,8 @@ async def handle_delay_callback(query, data: str, context: ContextTypes.DEFAULT_
                     
                     # Формат: "Test опоздание 0ч 15 мин"
                     delay_text = f"{user_display_name} опоздание {hour}ч {minute} мин"
-                    await context.bot.send_message(
+                    await send_message(
+                        context,
                         chat_id=chat_id,
                         text=delay_text
                     )
@@ -622,7 +768,8 @@ async def handle_delay_callback(query, data: str, context: ContextTypes.DEFAULT_
             # Но только если пользователь уже начал диалог с ботом
             try:
                 reason_text = "Напишите руководителю причину опоздания."
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=user_id,
                     text=reason_text
                 )
@@ -635,31 +782,36 @@ async def handle_delay_callback(query, data: str, context: ContextTypes.DEFAULT_
             
             # Сохраняем в БД
             time_str = datetime.now(MOSCOW_TZ).strftime("%H:%M")
-            db.save_presence(username, user_id, "late", time=time_str, delay_minutes=delay_minutes)
+            await db.save_presence(username, user_id, "late", time=time_str, delay_minutes=delay_minutes)
     
     except Exception as e:
         logger.error(f"Ошибка в handle_delay_callback: {e}", exc_info=True)
         await query.answer("❌ Произошла ошибка")
 
 
-async def handle_new_task_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db, get_task_actions_menu, get_confirm_menu):
-    """Обработка новых задач из меню"""
+async def handle_new_task_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db, get_task_actions_menu, get_confirm_menu,
+                                   action: str = None, task_id: int = None):
+    """
+    Обработка новых задач из меню
+    action и task_id передаются для компактных кнопок; иначе они разбираются из data ("task_view_5")
+    """
     try:
         await query.answer()
-        parts = data.split("_")
-        
-        if len(parts) < 3:
-            await query.answer("❌ Неверный формат", show_alert=True)
-            return
-        
-        action = parts[1]  # view, edit, delete, complete, share
-        try:
-            task_id = int(parts[2])
-        except (ValueError, IndexError):
-            await query.answer("❌ Ошибка формата ID задачи", show_alert=True)
-            return
+        if action is None:
+            parts = data.split("_")
+            
+            if len(parts) < 3:
+                await query.answer("❌ Неверный формат", show_alert=True)
+                return
+            
+            action = parts[1]  # view, edit, delete, complete, share
+            try:
+                task_id = int(parts[2])
+            except (ValueError, IndexError):
+                await query.answer("❌ Ошибка формата ID задачи", show_alert=True)
+                return
         
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
             return
@@ -700,7 +852,8 @@ async def handle_new_task_callback(query, data: str, context: ContextTypes.DEFAU
         elif action == "complete_fast":
             # Быстрое завершение без формы
             from datetime import datetime
-            db.update_custom_task(task_id, status='completed', completed_at=datetime.now().isoformat())
+            await db.update_custom_task(task_id, status='completed', completed_at=datetime.now().isoformat())
+            await reschedule_task_reminders(context, task_id)
             await query.answer("✅ Задача завершена!")
             text = f"✅ **ЗАДАЧА ЗАВЕРШЕНА**\n\nЗадача: **{task['title']}**\n\nСтатус изменен на 'Завершена'"
             keyboard = InlineKeyboardMarkup([[
@@ -717,19 +870,12 @@ async def handle_new_task_callback(query, data: str, context: ContextTypes.DEFAU
         await query.answer("❌ Произошла ошибка")
 
 
-async def handle_old_task_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db):
-    """Обработка старых задач (формат task_0_1)"""
+async def handle_old_task_callback(query, data: str, context: ContextTypes.DEFAULT_TYPE, db, day: int, task_index: int):
+    """Обработка старых задач (формат task_{day}_{task_index}, например task_0_1)"""
     try:
         await query.answer()
         
-        # Парсим task_id (формат: task_0_1 -> task_id = "0_1")
-        parts = data.split("_")
-        if len(parts) < 3:
-            logger.error(f"Неверный формат task_id: {data}, parts={parts}")
-            await query.answer("❌ Ошибка формата", show_alert=True)
-            return
-        
-        task_id = "_".join(parts[1:])  # "0_1"
+        task_id = f"{day}_{task_index}"
         logger.info(f"Обработка старой задачи: task_id={task_id}")
         
         # Определяем пользователя
@@ -742,12 +888,8 @@ async def handle_old_task_callback(query, data: str, context: ContextTypes.DEFAU
         user_id = user.id
         
         # Получаем имя пользователя из БД
-        team = db.get_team()
-        user_name = username
-        for member in team:
-            if member.get('username') == username:
-                user_name = member.get('name', member.get('initials', username))
-                break
+        member = await db.get_member_by_username(username)
+        user_name = (member.get('name') or username) if member else username
         
         # Если пользователя нет в БД, используем username как имя
         if user_name == username:
@@ -761,123 +903,54 @@ async def handle_old_task_callback(query, data: str, context: ContextTypes.DEFAU
         logger.info(f"Пользователь: {username} ({user_name})")
         
         # Сохраняем user_id в БД
-        db.save_user_id(username, user_id, user_name)
+        await db.save_user_id(username, user_id, user_name)
         logger.info(f"ID пользователя сохранен в БД")
         
-        # Получаем текущий статус пользователя для этой задачи
-        status_key = f"{task_id}_{user_name}"
-        current_status = db.get_task_status(status_key)
-        logger.info(f"Текущий статус для {status_key}: {current_status}")
-        
-        # Циклически меняем статус: ⚪ → ⏳ → ✅ → ⚪
-        status_cycle = {"⚪": "⏳", "⏳": "✅", "✅": "⚪"}
-        new_status = status_cycle.get(current_status, "⚪")
-        
-        # Сохраняем новый статус
-        db.set_task_status(status_key, new_status)
-        logger.info(f"Новый статус для {status_key}: {new_status}")
-        
-        # Получаем статусы всех пользователей для этой задачи
-        status_ag = db.get_task_status(f"{task_id}_AG")
-        status_ka = db.get_task_status(f"{task_id}_KA")
-        
-        logger.info(f"Статусы: AG={status_ag}, KA={status_ka}")
-        
-        # Определяем общий статус задачи
-        # ✅ только если все выполнили
-        if status_ag == "✅" and status_ka == "✅":
-            overall_status = "✅"
-        else:
-            # Считаем количество исполнителей, которые взяли задачу (⏳ или ✅)
-            active_count = sum(1 for status in [status_ag, status_ka] if status in ["⏳", "✅"])
-            
-            if active_count > 0:
-                # Показываем количество исполнителей эмодзи 👤
-                overall_status = "👤" * active_count
-            else:
-                overall_status = "⚪"
-        
-        logger.info(f"Общий статус задачи: {overall_status}")
-        
-        # Обновляем кнопку в сообщении
+        # Модель сообщения (дата, задачи по порядку кнопок, статусы) - из кэша, текст сообщения не разбираем
         message = query.message
-        if not message or not message.text:
+        if not message:
             logger.error("Не удалось получить сообщение для обновления")
             return
-        
-        # Извлекаем оригинальный текст задачи из сообщения
-        message_lines = message.text.split("\n")
-        task_text = None
-        task_number = None
-        
-        # Ищем строку с задачей (формат: "1. Название задачи")
-        for line in message_lines:
-            if line.strip().startswith(f"{task_id.split('_')[1]}."):
-                task_text = line.split(".", 1)[1].strip()
-                task_number = task_id.split("_")[1]
-                break
-        
-        if not task_text:
-            # Если не нашли, пытаемся извлечь из текущего текста кнопки
-            if message.reply_markup and message.reply_markup.inline_keyboard:
-                for row in message.reply_markup.inline_keyboard:
-                    for button in row:
-                        if button.callback_data == data:
-                            # Убираем статус из текста кнопки
-                            button_text = button.text
-                            # Убираем эмодзи статуса в конце (⚪, ⏳, ✅, или 👤)
-                            # Сначала проверяем множественные 👤
-                            if "👤" in button_text:
-                                # Убираем все 👤 из конца
-                                task_text = button_text.rstrip("👤").strip()
-                            else:
-                                # Проверяем одиночные эмодзи
-                                for status_emoji in ["⚪", "⏳", "✅"]:
-                                    if button_text.endswith(f" {status_emoji}"):
-                                        task_text = button_text[:-2].strip()
-                                        break
-                            # Убираем номер задачи если есть
-                            if task_text and task_text.startswith(f"{task_id.split('_')[1]}."):
-                                task_text = task_text.split(".", 1)[1].strip()
-                            break
-        
-        if not task_text:
-            logger.error(f"Не удалось извлечь текст задачи для task_id={task_id}")
-            await query.answer("❌ Ошибка обновления", show_alert=True)
+        checklist = await db.get_checklist_message(message.chat_id, message.message_id)
+        if checklist is None:
+            # Сообщение отправлено до появления моделей чек-листов - строим модель по еженедельным задачам
+            # Чек-лист привязан к дате отправки сообщения (по Москве), а номер задачи - к id еженедельной задачи
+            weekly_tasks = await db.get_weekly_tasks(day)
+            checklist_date = message.date.astimezone(MOSCOW_TZ).date().isoformat()
+            checklist = await db.save_checklist_message(
+                message.chat_id, message.message_id, checklist_date, day,
+                [(task['id'], task['task_text']) for task in weekly_tasks]
+            )
+        if not 1 <= task_index <= len(checklist['tasks']):
+            logger.error(f"Задача {task_id} не найдена в чек-листе сообщения {message.message_id}")
+            await query.answer("❌ Задача не найдена", show_alert=True)
+            return
+        weekly_task_id = checklist['tasks'][task_index - 1][0]
+        checklist_date = checklist['date']
+        
+        # Отметки хранятся под ключом участника (AG, KA) - по нему их читают клавиатура и напоминания
+        member_key = checklist_member_key(username, user_name)
+        if member_key is None:
+            logger.info(f"{username} ({user_name}) не участвует в чек-листе")
+            await query.answer("ℹ️ Вы не участвуете в этом чек-листе", show_alert=True)
             return
         
-        # Формируем новый текст кнопки
-        # ОПТИМИЗАЦИЯ ДЛЯ МОБИЛЬНЫХ: ограничиваем длину до 30 символов
-        max_mobile_length = 30
-        if len(task_text) > max_mobile_length:
-            task_text_short = task_text[:max_mobile_length-3] + "..."
-            button_text = f"{task_number}. {task_text_short} {overall_status}" if task_number else f"{task_text_short} {overall_status}"
-        else:
-            button_text = f"{task_number}. {task_text} {overall_status}" if task_number else f"{task_text} {overall_status}"
-        
-        # Обновляем клавиатуру
-        current_markup = message.reply_markup
-        if not current_markup or not current_markup.inline_keyboard:
-            logger.error("Не удалось получить клавиатуру для обновления")
+        # Циклически меняем статус: ⚪ → ⏳ → ✅ → ⚪ (чтение и запись - одна транзакция)
+        new_status = await db.cycle_checklist_status(checklist_date, weekly_task_id, member_key)
+        if new_status is None:
+            await query.answer("❌ Ошибка сохранения", show_alert=True)
             return
+        logger.info(f"Новый статус для {checklist_date}/{task_id}/{member_key}: {new_status}")
         
-        # Находим и обновляем нужную кнопку
-        new_keyboard = []
-        for row in current_markup.inline_keyboard:
-            new_row = []
-            for button in row:
-                if button.callback_data == data:
-                    # Обновляем эту кнопку
-                    from telegram import InlineKeyboardButton
-                    new_row.append(InlineKeyboardButton(button_text, callback_data=data))
-                else:
-                    new_row.append(button)
-            if new_row:
-                new_keyboard.append(new_row)
+        # Клавиатура целиком строится из модели (по одной кнопке на задачу) в момент правки:
+        # нажатия нескольких человек за EDIT_COALESCE_SECONDS уходят в Telegram одной правкой
+        chat_id, message_id = message.chat_id, message.message_id
+        
+        async def render_keyboard():
+            latest = await db.get_checklist_message(chat_id, message_id)
+            return build_checklist_keyboard(latest) if latest else None
         
-        from telegram import InlineKeyboardMarkup
-        await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(new_keyboard))
-        logger.info(f"Кнопка обновлена: {button_text}")
+        await edit_reply_markup(context, chat_id, message_id, render_keyboard, current_markup=message.reply_markup)
         
     except Exception as e:
         logger.error(f"Ошибка в handle_old_task_callback: {e}", exc_info=True)
@@ -908,7 +981,7 @@ async def handle_confirm_callback(query, data: str, context: ContextTypes.DEFAUL
         if action_type == "cancel":
             # Отмена действия
             if action == "delete":
-                task = db.get_custom_task(item_id)
+                task = await db.get_custom_task(item_id)
                 if task:
                     text = f"📋 **ЗАДАЧА #{item_id}**\n\nУдаление отменено."
                     from menu import get_task_actions_menu
@@ -917,9 +990,10 @@ async def handle_confirm_callback(query, data: str, context: ContextTypes.DEFAUL
         
         if action_type == "confirm":
             if action == "delete":
-                task = db.get_custom_task(item_id)
+                task = await db.get_custom_task(item_id)
                 if task:
-                    db.delete_custom_task(item_id)
+                    await db.delete_custom_task(item_id)
+                    await reschedule_task_reminders(context, item_id)
                     text = "🗑️ **ЗАДАЧА УДАЛЕНА**\n\nЗадача успешно удалена."
                     keyboard = InlineKeyboardMarkup([[
                         InlineKeyboardButton("🔙 К задачам", callback_data="menu_view_tasks")
@@ -944,30 +1018,17 @@ async def handle_assignee_callback(query, data: str, context: ContextTypes.DEFAU
         await query.answer("❌ Произошла ошибка")
 
 
-async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_TYPE, db):
-    """Обработка кнопки 'Взять в работу' - просто отмечает, что задача взята"""
+async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_TYPE, db, task_id: int, assignee: str):
+    """Обработка кнопки 'Взять в работу' - просто отмечает, что задача взята (work_take_{task_id}_{assignee})"""
     try:
         await query.answer()
         
-        # Парсим данные: work_take_{task_id}_{assignee}
-        parts = data.split("_")
-        if len(parts) < 4:
-            await query.answer("❌ Неверный формат", show_alert=True)
-            return
-        
-        try:
-            task_id = int(parts[2])
-            assignee = parts[3]
-            team_initials = db.get_team_initials()
-            if assignee not in team_initials:
-                await query.answer("❌ Неверный исполнитель", show_alert=True)
-                return
-        except (ValueError, IndexError):
-            await query.answer("❌ Ошибка формата данных", show_alert=True)
+        if not await db.is_team_member_name(assignee):
+            await query.answer("❌ Неверный исполнитель", show_alert=True)
             return
         
         # Получаем задачу
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
             return
@@ -997,14 +1058,14 @@ async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_
         
         # Добавляем в список взятых в работу
         in_progress_list.append(assignee)
-        db.update_custom_task(task_id, status='in_progress', in_progress_assignees=','.join(in_progress_list))
+        await db.update_custom_task(task_id, status='in_progress', in_progress_assignees=','.join(in_progress_list))
         
         # Обновляем сообщение в группе - добавляем ⏰ к тексту задачи
         if query.message and query.message.chat.type in ['group', 'supergroup']:
             try:
                 # Получаем текущий текст сообщения
                 current_text = query.message.text or query.message.caption or ""
-                team_initials = db.get_team_initials() if task_assignee == 'all' else [assignee]
+                team_initials = await db.get_team_initials() if task_assignee == 'all' else [assignee]
                 status_line = build_status_line(team_initials, in_progress_list, completed_list)
                 new_text = current_text
                 if 'Статусы:' in current_text:
@@ -1025,15 +1086,12 @@ async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_
             if query.message and query.message.chat.type in ['group', 'supergroup']:
                 chat_id = query.message.chat.id
                 # Получаем имя пользователя из БД
-                team = db.get_team()
-                user_name = assignee
-                for member in team:
-                    if member.get('name', member.get('initials', '')) == assignee:
-                        user_name = f"@{member.get('username', assignee)}"
-                        break
+                member = await db.get_member_by_name(assignee)
+                user_name = f"@{member['username']}" if member and member.get('username') else assignee
                 
                 take_text = f"✅ {user_name} взял задачу #{task_id} в работу"
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=chat_id,
                     text=take_text,
                     reply_to_message_id=query.message.message_id
@@ -1052,10 +1110,10 @@ async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_
                     new_row = []
                     for button in row:
                         # Если это кнопка "Взять в работу" для этого исполнителя - заменяем на "Готово"
-                        if button.callback_data == data:
+                        if button.callback_data == query.data:
                             new_row.append(InlineKeyboardButton(
                                 f"✅ {assignee} - Готово",
-                                callback_data=f"work_done_{task_id}_{assignee}"
+                                callback_data=encode_callback_data("work_done", task_id, assignee)
                             ))
                         else:
                             new_row.append(button)
@@ -1076,7 +1134,8 @@ async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_
                 f"⏰ Срок: {task.get('deadline', 'Не указан')}\n"
                 f"👤 Исполнитель: {assignee}"
             )
-            await context.bot.send_message(
+            await send_message(
+                context,
                 chat_id=user_id,
                 text=confirm_text,
                 parse_mode='Markdown'
@@ -1091,30 +1150,17 @@ async def handle_work_task_take(query, data: str, context: ContextTypes.DEFAULT_
         await query.answer("❌ Произошла ошибка", show_alert=True)
 
 
-async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_TYPE, db):
-    """Обработка кнопки 'Готово' - отмечает задачу как выполненную"""
+async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_TYPE, db, task_id: int, assignee: str):
+    """Обработка кнопки 'Готово' - отмечает задачу как выполненную (work_done_{task_id}_{assignee})"""
     try:
         await query.answer()
         
-        # Парсим данные: work_done_{task_id}_{assignee}
-        parts = data.split("_")
-        if len(parts) < 4:
-            await query.answer("❌ Неверный формат", show_alert=True)
-            return
-        
-        try:
-            task_id = int(parts[2])
-            assignee = parts[3]
-            team_names = db.get_team_initials()  # Получаем список имен команды
-            if assignee not in team_names:
-                await query.answer("❌ Неверный исполнитель", show_alert=True)
-                return
-        except (ValueError, IndexError):
-            await query.answer("❌ Ошибка формата данных", show_alert=True)
+        if not await db.is_team_member_name(assignee):
+            await query.answer("❌ Неверный исполнитель", show_alert=True)
             return
         
         # Получаем задачу
-        task = db.get_custom_task(task_id)
+        task = await db.get_custom_task(task_id)
         if not task:
             await query.answer("❌ Задача не найдена", show_alert=True)
             return
@@ -1155,49 +1201,46 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
             
             # Обновляем задачу с новым списком завершенных
             completed_str = ','.join(completed_list)
-            db.update_custom_task(
+            await db.update_custom_task(
                 task_id,
                 completed_assignees=completed_str
             )
             
             # Проверяем, все ли исполнители завершили
-            team_names = db.get_team_initials()
+            team_names = await db.get_team_initials()
             all_completed = all(assignee_code in completed_list for assignee_code in team_names)
             
             if all_completed:
                 # Все завершили - задача полностью завершена
-                db.update_custom_task(
+                await db.update_custom_task(
                     task_id,
                     status='completed',
                     completed_at=datetime.now().isoformat()
                 )
         else:
             # Конкретный исполнитель - сразу завершаем
-            db.update_custom_task(
+            await db.update_custom_task(
                 task_id,
                 status='completed',
                 completed_at=datetime.now().isoformat()
             )
+        await reschedule_task_reminders(context, task_id)
         
         # Отправляем уведомление в чат о выполнении задачи
         try:
             if query.message and query.message.chat.type in ['group', 'supergroup']:
                 chat_id = query.message.chat.id
                 # Получаем имя пользователя из БД
-                team = db.get_team()
-                user_name = assignee
-                for member in team:
-                    if member.get('name', member.get('initials', '')) == assignee:
-                        user_name = f"@{member.get('username', assignee)}"
-                        break
+                member = await db.get_member_by_name(assignee)
+                user_name = f"@{member['username']}" if member and member.get('username') else assignee
                 # Проверяем, полностью ли завершена задача
                 task_assignee = task.get('assignee', 'all')
                 if task_assignee == 'all':
                     # Получаем обновленную задачу
-                    updated_task = db.get_custom_task(task_id)
+                    updated_task = await db.get_custom_task(task_id)
                     completed_assignees = updated_task.get('completed_assignees', '') or ''
                     completed_list = [x.strip() for x in completed_assignees.split(',') if x.strip()] if completed_assignees else []
-                    team_names = db.get_team_initials()
+                    team_names = await db.get_team_initials()
                     all_completed = all(assignee_code in completed_list for assignee_code in team_names)
                     
                     if all_completed:
@@ -1227,7 +1270,8 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
                         f"🆔 ID задачи: #{task_id}\n"
                         f"🕐 Время: {datetime.now(MOSCOW_TZ).strftime('%H:%M')}"
                     )
-                await context.bot.send_message(
+                await send_message(
+                    context,
                     chat_id=chat_id,
                     text=completion_text,
                     reply_to_message_id=query.message.message_id,
@@ -1250,7 +1294,8 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
                     new_row = []
                     for button in row:
                         # Если это кнопка для этого исполнителя - заменяем на "✅ Выполнено"
-                        if f"work_take_{task_id}_{assignee}" in button.callback_data or f"work_done_{task_id}_{assignee}" in button.callback_data:
+                        if (callback_data_matches(button.callback_data, "work_take", task_id, assignee)
+                                or callback_data_matches(button.callback_data, "work_done", task_id, assignee)):
                             assignee_names = {
                                 "AG": "Lysenko Alexander",
                                 "KA": "Ruslan Cherenkov"
@@ -1258,7 +1303,7 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
                             assignee_name = assignee_names.get(assignee, assignee)
                             new_row.append(InlineKeyboardButton(
                                 f"✅ {assignee_name} - Выполнено",
-                                callback_data=f"work_status_{task_id}_{assignee}"
+                                callback_data=encode_callback_data("work_status", task_id, assignee)
                             ))
                         else:
                             new_row.append(button)
@@ -1273,12 +1318,12 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
         if query.message and query.message.chat.type in ['group', 'supergroup']:
             try:
                 current_text = query.message.text or query.message.caption or ""
-                updated_task = db.get_custom_task(task_id)
+                updated_task = await db.get_custom_task(task_id)
                 in_progress_assignees = updated_task.get('in_progress_assignees', '') or ''
                 completed_assignees = updated_task.get('completed_assignees', '') or ''
                 in_progress_list = in_progress_assignees.split(',') if in_progress_assignees else []
                 completed_list = completed_assignees.split(',') if completed_assignees else []
-                team_initials = db.get_team_initials() if task_assignee == 'all' else [assignee]
+                team_initials = await db.get_team_initials() if task_assignee == 'all' else [assignee]
                 status_line = build_status_line(team_initials, in_progress_list, completed_list)
                 if 'Статусы:' in current_text:
                     import re
@@ -1296,7 +1341,8 @@ async def handle_work_task_done(query, data: str, context: ContextTypes.DEFAULT_
         # Отправляем подтверждение пользователю в личные сообщения
         try:
             confirm_text = f"✅ Задача #{task_id} отмечена как выполненная!\n\n📝 {task['title']}"
-            await context.bot.send_message(
+            await send_message(
+                context,
                 chat_id=user_id,
                 text=confirm_text
             )
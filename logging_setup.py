@@ -0,0 +1,174 @@
+"""
+МОДУЛЬ ДЛЯ НАСТРОЙКИ ЛОГИРОВАНИЯ
+Записи из обработчиков только кладутся в очередь (QueueHandler), а в консоль и файл bot.log
+их пишет отдельный поток (QueueListener) - запись на диск и ротация файла не задерживают
+цикл событий.
+
+Переменные окружения:
+- LOG_LEVEL - общий уровень (по умолчанию INFO)
+- LOG_LEVELS - уровни отдельных модулей: "database=WARNING,handlers=DEBUG"
+- LOG_FORMAT - "text" (по умолчанию) или "json" (одна JSON-запись на строку)
+- LOG_FILE - файл лога (по умолчанию bot.log, пустая строка - без файла)
+- LOG_RATE_LIMIT - сколько одинаковых записей (одна и та же строка кода) уровня ниже WARNING
+  пропускать за LOG_RATE_WINDOW секунд; остальные отбрасываются, а их число дописывается
+  к следующей пропущенной записи (по умолчанию 0 - без ограничения, записи не теряются)
+- LOG_RATE_LIMITS - то же для отдельных модулей (по имени файла): "bot=20,handlers=50,database=0";
+  по умолчанию ограничены только bot и handlers, где пишут обработчики кнопок
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', '0'))
+LOG_RATE_LIMITS = os.getenv('LOG_RATE_LIMITS', '')
+LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', '10'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Библиотеки, которые пишут INFO на каждый запрос к Telegram
+DEFAULT_MODULE_LEVELS = {'httpx': 'WARNING', 'httpcore': 'WARNING'}
+# Модули с горячими путями (button_callback, handle_old_task_callback): запись на каждое нажатие
+DEFAULT_RATE_LIMITS = {'bot': 20, 'handlers': 20}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON (для систем сбора логов)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Как QueueHandler, но трассировка ошибки остается отдельным полем (exc_text),
+    а не склеивается с текстом - так ее правильно выводят и текстовый, и JSON-формат
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает частоту одинаковых записей: ключ - место в коде (модуль и номер строки),
+    так что f-строки с разными значениями считаются одной записью
+    limits - лимиты отдельных модулей (имя файла без .py), остальным - limit
+    WARNING и выше пропускаются всегда
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW, limits: dict = None):
+        super().__init__()
+        self.limit = limit
+        self.limits = limits or {}
+        self.window = window
+        # (pathname, lineno) -> [начало окна, пропущено в окне, отброшено]
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        limit = self.limits.get(record.module, self.limit)
+        if limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or now - slot[0] >= self.window:
+                suppressed = slot[2] if slot else 0
+                self._slots[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} (еще {suppressed} похожих записей пропущено)"
+                    record.args = None
+                return True
+            if slot[1] < limit:
+                slot[1] += 1
+                return True
+            slot[2] += 1
+            return False
+
+
+def _parse_levels(spec: str) -> dict:
+    """"database=WARNING,handlers=DEBUG" -> {'database': 'WARNING', 'handlers': 'DEBUG'}"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _parse_limits(spec: str) -> dict:
+    """"bot=20,database=0" -> {'bot': 20, 'database': 0}; нечисловые значения пропускаются"""
+    limits = {}
+    for name, value in _parse_levels(spec).items():
+        if value.isdigit():
+            limits[name] = int(value)
+    return limits
+
+
+def setup_logging():
+    """
+    Настраивает корневой логгер: очередь + фоновый поток записи
+    Повторный вызов ничего не делает; поток останавливается при выходе из процесса
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=5, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(limits={**DEFAULT_RATE_LIMITS, **_parse_limits(LOG_RATE_LIMITS)}))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in {**DEFAULT_MODULE_LEVELS, **_parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописываем оставшиеся в очереди записи при выходе
+    atexit.register(_listener.stop)
+    return _listener
@@ -5,6 +5,7 @@
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 import logging
+from callback_codec import encode_callback_data
 
 logger = logging.getLogger(__name__)
 
@@ -61,14 +62,9 @@ def get_tasks_menu(tasks: list) -> InlineKeyboardMarkup:
         status_emoji = "✅" if status == "completed" else "⏳" if status == "in_progress" else "⚪"
         button_text = f"{status_emoji} {title}"
         
-        # Валидация callback_data (Telegram ограничивает до 64 байт)
-        callback_data = f"task_view_{task_id}"
-        if len(callback_data.encode('utf-8')) > 64:
-            logger.warning(f"callback_data слишком длинный для задачи {task_id}, пропускаем")
-            continue
-        
+        # Компактный callback_data всегда укладывается в 64 байта (см. callback_codec)
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=callback_data)
+            InlineKeyboardButton(button_text, callback_data=encode_callback_data("task_view", task_id))
         ])
     
     keyboard.append([
@@ -227,7 +223,7 @@ def get_team_remove_menu(team: list) -> InlineKeyboardMarkup:
         keyboard.append([
             InlineKeyboardButton(
                 f"🗑️ @{username} ({name})",
-                callback_data=f"team_remove_{username}"
+                callback_data=encode_callback_data("team_remove", username)
             )
         ])
     keyboard.append([
@@ -240,7 +236,7 @@ def get_team_remove_confirm_menu(username: str) -> InlineKeyboardMarkup:
     """Меню подтверждения удаления сотрудника"""
     keyboard = [
         [
-            InlineKeyboardButton("✅ Да, удалить", callback_data=f"team_remove_confirm_{username}"),
+            InlineKeyboardButton("✅ Да, удалить", callback_data=encode_callback_data("team_remove_confirm", username)),
             InlineKeyboardButton("❌ Отмена", callback_data="team_remove_cancel")
         ]
     ]
@@ -0,0 +1,39 @@
+"""
+МОДУЛЬ ДЛЯ ПРОСТЫХ МЕТРИК (СЧЕТЧИКОВ) БОТА
+Счетчики живут в памяти процесса; посмотреть их можно командой /metrics
+"""
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name: str, value: float = 1):
+    """Увеличивает счетчик name на value"""
+    with _lock:
+        _counters[name] += value
+
+
+def record(prefix: str, values: dict):
+    """Увеличивает несколько счетчиков с общим префиксом: record('reminders', {'sent': 2})"""
+    with _lock:
+        for key, value in values.items():
+            _counters[f"{prefix}.{key}"] += value
+
+
+def snapshot() -> dict:
+    """Копия всех счетчиков, отсортированная по имени"""
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def format_snapshot() -> str:
+    """Счетчики в виде текста - по одному на строку"""
+    lines = []
+    for name, value in snapshot().items():
+        if isinstance(value, float):
+            value = round(value, 3)
+        lines.append(f"{name}: {value}")
+    return "\n".join(lines)
@@ -0,0 +1,372 @@
+"""
+МОДУЛЬ ДЛЯ ИСХОДЯЩИХ СООБЩЕНИЙ (ОЧЕРЕДЬ ОТПРАВКИ С УЧЕТОМ ЛИМИТОВ TELEGRAM)
+Все отправки идут через MessageDispatcher:
+- общий лимит бота - около 30 сообщений в секунду
+- в один личный чат - не чаще 1 сообщения в секунду
+- в одну группу - не больше 20 сообщений в минуту
+- при RetryAfter (flood control) ждем столько, сколько просит Telegram, и повторяем
+- ответы пользователям (INTERACTIVE) уходят раньше массовых рассылок (BULK)
+
+EditCoalescer склеивает частые правки клавиатуры одного сообщения (несколько нажатий подряд)
+в одну правку с итоговой клавиатурой.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: чем меньше число, тем раньше отправка
+INTERACTIVE = 0
+BULK = 1
+
+GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', '30'))  # сообщений в секунду на весь бот
+PRIVATE_CHAT_RATE = 1.0  # сообщений в секунду в личный чат
+GROUP_CHAT_RATE = 20 / 60  # сообщений в секунду в группу (20 в минуту)
+GROUP_CHAT_BURST = 3  # сколько сообщений подряд можно отправить в группу без паузы
+WORKERS = int(os.getenv('OUTBOX_WORKERS', '8'))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE = 1.0  # секунд, удваивается с каждой попыткой
+BACKOFF_MAX = 30.0
+
+# Сколько ждать следующих нажатий, прежде чем править клавиатуру сообщения
+EDIT_COALESCE_SECONDS = float(os.getenv('EDIT_COALESCE_SECONDS', '0.7'))
+# Для скольких сообщений помнить последнюю отправленную клавиатуру
+MAX_REMEMBERED_MARKUPS = 500
+
+# Сколько чатов держать в памяти, прежде чем выбросить полные (давно не использованные) корзины
+MAX_CHAT_BUCKETS = 1000
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity
+    delay() - сколько секунд до появления токена, take() - забрать токен (только когда delay() == 0)
+    Проверка и взятие выполняются без await между ними, поэтому гонок внутри цикла событий нет
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # до этого момента отправлять нельзя (RetryAfter от Telegram)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.blocked_until - now, 0.0)
+
+    def take(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Запрещает отправку на seconds секунд"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_full(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class MessageDispatcher:
+    """
+    Очередь исходящих вызовов Bot API с лимитами и повторами
+    Вызов await dispatcher.send('send_message', INTERACTIVE, chat_id=..., text=...) возвращает
+    результат метода бота (Message) или пробрасывает его ошибку после всех попыток
+
+    Обработчик не ждет лимита чата, держа сообщение: если чату еще рано, сообщение откладывается
+    (возвращается в очередь, когда чат освободится), а обработчик берет следующее. Так массовая
+    рассылка в одну группу не занимает всех обработчиков, и ответы в другие чаты не стоят за ней.
+    Повторы после RetryAfter и сетевых ошибок тоже откладываются, а не ждут в обработчике.
+    """
+
+    def __init__(self, bot, workers: int = WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self._queue = None
+        self._workers = []
+        self._counter = itertools.count()
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._deferred = {}  # порядковый номер -> (элемент очереди, таймер возврата в очередь)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """Запускает обработчики очереди (вызывается внутри цикла событий)"""
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Очередь исходящих сообщений запущена: {self.workers} обработчиков")
+
+    async def _drain(self):
+        while True:
+            await self._queue.join()
+            if not self._deferred:
+                return
+            await asyncio.sleep(0.05)
+
+    async def stop(self, timeout: float = 10.0):
+        """Дожидается отправки оставшихся сообщений (не дольше timeout) и останавливает обработчики"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Очередь не опустела за {timeout} с, неотправлено: "
+                f"{self._queue.qsize() + len(self._deferred)}"
+            )
+        for item, handle in list(self._deferred.values()):
+            handle.cancel()
+            if not item[4].done():
+                item[4].cancel()
+        self._deferred.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def send(self, method: str, priority: int = INTERACTIVE, **kwargs):
+        """Ставит вызов метода бота в очередь и ждет результата"""
+        if not self.running:
+            # Очередь еще не запущена (например, при вызове до post_init) - отправляем напрямую
+            return await getattr(self.bot, method)(**kwargs)
+        future = asyncio.get_running_loop().create_future()
+        # (приоритет, порядковый номер, метод, аргументы, future, номер попытки)
+        await self._queue.put((priority, next(self._counter), method, kwargs, future, 1))
+        metrics.increment(f"outbox.queued.{'interactive' if priority == INTERACTIVE else 'bulk'}")
+        return await future
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.is_full()}
+            # Отрицательный chat_id - группа или канал, положительный - личный чат
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, 1)
+            else:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _defer(self, item: tuple, delay: float):
+        """Возвращает элемент в очередь через delay секунд (с прежним приоритетом и местом)"""
+        handle = asyncio.get_running_loop().call_later(delay, self._requeue, item)
+        self._deferred[item[1]] = (item, handle)
+
+    def _requeue(self, item: tuple):
+        if self._deferred.pop(item[1], None) is not None:
+            self._queue.put_nowait(item)
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._process(item)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, item: tuple):
+        """Одна попытка отправки; если чату еще рано или нужен повтор - элемент откладывается"""
+        priority, seq, method, kwargs, future, attempt = item
+        if future.done():
+            return
+        chat_id = kwargs.get('chat_id')
+        bucket = self._chat_bucket(chat_id)
+        delay = bucket.delay()
+        if delay > 0:
+            metrics.increment('outbox.throttled')
+            metrics.increment('outbox.throttled_seconds', delay)
+            self._defer(item, delay)
+            return
+
+        # Общий лимит бота короткий (доли секунды), его ждем на месте
+        delay = self._global_bucket.delay()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._global_bucket.delay()
+        if bucket.delay() > 0:
+            # Пока ждали общий лимит, слот чата занял другой обработчик
+            self._defer(item, bucket.delay())
+            return
+        self._global_bucket.take()
+        bucket.take()
+
+        try:
+            result = await getattr(self.bot, method)(**kwargs)
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            metrics.increment('outbox.retry_after')
+            if attempt >= MAX_ATTEMPTS:
+                self._fail(future, e)
+                return
+            logger.warning(f"Flood control для чата {chat_id}: ждем {retry_after} с (попытка {attempt})")
+            bucket.pause(float(retry_after))
+            self._defer((priority, seq, method, kwargs, future, attempt + 1), float(retry_after))
+        except BadRequest as e:
+            # Ошибка в самом запросе - повтор не поможет
+            self._fail(future, e)
+        except (TimedOut, NetworkError) as e:
+            metrics.increment('outbox.network_errors')
+            if attempt >= MAX_ATTEMPTS:
+                self._fail(future, e)
+                return
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+            logger.warning(f"Сетевая ошибка при отправке в чат {chat_id}: {e}; повтор через {delay} с")
+            self._defer((priority, seq, method, kwargs, future, attempt + 1), delay)
+        except Exception as e:
+            self._fail(future, e)
+        else:
+            metrics.increment('outbox.sent')
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(future, error: Exception):
+        metrics.increment('outbox.failed')
+        if not future.done():
+            future.set_exception(error)
+
+
+class EditCoalescer:
+    """
+    Отложенная правка клавиатуры сообщения: нажатия в течение delay секунд копятся,
+    затем клавиатура строится один раз (render) и отправляется одной правкой
+    Если клавиатура не изменилась по сравнению с последней отправленной, правки не будет
+    """
+
+    def __init__(self, owner, delay: float = EDIT_COALESCE_SECONDS):
+        self.owner = owner
+        self.delay = delay
+        self._pending = {}  # (chat_id, message_id) -> (render, задача с таймером)
+        self._last_markup = OrderedDict()  # (chat_id, message_id) -> словарь последней клавиатуры
+
+    def schedule(self, chat_id: int, message_id: int, render, current_markup=None):
+        """
+        Запланировать правку; render - async-функция без аргументов, возвращающая InlineKeyboardMarkup
+        current_markup - клавиатура, которая сейчас в сообщении (чтобы не слать такую же)
+        """
+        key = (chat_id, message_id)
+        if current_markup is not None and key not in self._last_markup:
+            self._remember(key, current_markup.to_dict())
+        pending = self._pending.get(key)
+        if pending:
+            # Правка уже запланирована - просто берем свежий render, таймер не сдвигаем
+            self._pending[key] = (render, pending[1])
+            metrics.increment('edits.coalesced')
+            return
+        task = asyncio.create_task(self._flush_later(key))
+        self._pending[key] = (render, task)
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.delay)
+        await self._flush(key)
+
+    async def _flush(self, key):
+        pending = self._pending.pop(key, None)
+        if not pending:
+            return
+        render = pending[0]
+        chat_id, message_id = key
+        rendered = None
+        try:
+            markup = await render()
+            if markup is None:
+                return
+            rendered = markup.to_dict()
+            if self._last_markup.get(key) == rendered:
+                metrics.increment('edits.skipped_unchanged')
+                return
+            await edit_message_reply_markup(self.owner, chat_id=chat_id, message_id=message_id, reply_markup=markup)
+            self._remember(key, rendered)
+            metrics.increment('edits.sent')
+        except BadRequest as e:
+            if "Message is not modified" in str(e):
+                if rendered is not None:
+                    self._remember(key, rendered)
+                metrics.increment('edits.skipped_unchanged')
+            else:
+                logger.error(f"Ошибка правки клавиатуры {chat_id}/{message_id}: {e}", exc_info=True)
+        except Exception as e:
+            logger.error(f"Ошибка правки клавиатуры {chat_id}/{message_id}: {e}", exc_info=True)
+
+    def _remember(self, key, rendered: dict):
+        self._last_markup[key] = rendered
+        self._last_markup.move_to_end(key)
+        while len(self._last_markup) > MAX_REMEMBERED_MARKUPS:
+            self._last_markup.popitem(last=False)
+
+    async def stop(self):
+        """Отправляет все запланированные правки сразу (при остановке бота)"""
+        for key, (_, task) in list(self._pending.items()):
+            task.cancel()
+            await self._flush(key)
+
+
+async def send_message(owner, priority: int = INTERACTIVE, **kwargs):
+    """
+    Отправляет сообщение через очередь из owner.bot_data['outbox']
+    owner - Application, context обработчика или любой объект с bot и bot_data
+    Если очереди нет, сообщение отправляется напрямую через owner.bot
+    """
+    outbox = (getattr(owner, 'bot_data', None) or {}).get('outbox')
+    if outbox:
+        return await outbox.send('send_message', priority, **kwargs)
+    return await owner.bot.send_message(**kwargs)
+
+
+async def send_photo(owner, priority: int = INTERACTIVE, **kwargs):
+    """То же, что send_message, но для фото"""
+    outbox = (getattr(owner, 'bot_data', None) or {}).get('outbox')
+    if outbox:
+        return await outbox.send('send_photo', priority, **kwargs)
+    return await owner.bot.send_photo(**kwargs)
+
+
+async def edit_message_reply_markup(owner, priority: int = INTERACTIVE, **kwargs):
+    """
+    То же, что send_message, но для правки клавиатуры
+    Напрямую через owner.bot - только без очереди (тесты, вызовы до post_init), как и у send_message
+    """
+    outbox = (getattr(owner, 'bot_data', None) or {}).get('outbox')
+    if outbox:
+        return await outbox.send('edit_message_reply_markup', priority, **kwargs)
+    return await owner.bot.edit_message_reply_markup(**kwargs)
+
+
+async def edit_reply_markup(owner, chat_id: int, message_id: int, render, current_markup=None):
+    """
+    Правка клавиатуры через owner.bot_data['edit_coalescer'] (с объединением частых правок)
+    Если объединителя нет, клавиатура строится и отправляется сразу (через очередь, если она есть)
+    """
+    coalescer = (getattr(owner, 'bot_data', None) or {}).get('edit_coalescer')
+    if coalescer:
+        coalescer.schedule(chat_id, message_id, render, current_markup)
+        return
+    markup = await render()
+    if markup is not None:
+        await edit_message_reply_markup(owner, chat_id=chat_id, message_id=message_id, reply_markup=markup)
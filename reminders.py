@@ -2,239 +2,276 @@
 МОДУЛЬ ДЛЯ НАПОМИНАНИЙ О РУЧНЫХ ЗАДАЧАХ
 """
 
+import asyncio
+import heapq
+import itertools
 import logging
+import os
+from collections import deque
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import Application, ContextTypes
 import pytz
+from deadlines import deadline_from_timestamp
+from outbox import send_message, BULK
 
 logger = logging.getLogger(__name__)
 
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
 
-def parse_deadline(deadline_str: str) -> datetime:
+# ========== ДВИЖОК НАПОМИНАНИЙ ==========
+# Моменты напоминаний задачи вычисляются один раз (при создании, изменении или завершении),
+# а движок спит до ближайшего из них. Работа пропорциональна числу сработавших напоминаний,
+# а не числу активных задач.
+
+# Статусы задач, по которым нужны напоминания
+REMINDER_STATUSES = ('active', 'in_progress')
+
+# Часы напоминаний в последние сутки перед дедлайном
+DEADLINE_DAY_HOURS = (9, 12, 14, 16)
+
+# Ежедневное напоминание, если до дедлайна больше суток
+DAILY_REMINDER_HOUR = 9
+
+# Напоминания за фиксированное время до дедлайна: (слот, отступ, подпись)
+BEFORE_DEADLINE = (
+    ('4h', timedelta(hours=4), "~4 часа"),
+    ('2h', timedelta(hours=2), "~2 часа"),
+    ('1h', timedelta(hours=1), "~1 час"),
+    ('30m', timedelta(minutes=30), "~30 минут"),
+)
+
+# Напоминания, пропущенные пока бот был выключен, отправляются при старте,
+# если опоздание не больше этого окна (минуты)
+REMINDER_GRACE_MINUTES = int(os.getenv('REMINDER_GRACE_MINUTES', '30'))
+
+# Максимальный сон без проверки очереди (защита от перевода системных часов)
+MAX_SLEEP_SECONDS = 300
+
+ASSIGNEE_NAMES = {
+    "AG": "Lysenko Alexander",
+    "KA": "Ruslan Cherenkov",
+    "all": "Все"
+}
+
+
+def compute_reminder_instants(deadline: datetime, now: datetime) -> list:
     """
-    Парсит строку дедлайна в datetime объект
-    Поддерживает форматы:
-    - ДД.ММ.ГГГГ ЧЧ:ММ
-    - ДД.ММ.ГГГГ
-    - сегодня до 15:00
-    - сегодня до 3:00 PM
+    Все будущие моменты напоминаний для дедлайна, по возрастанию
+    Возвращает список (момент, вид, слот):
+    - 'daily' - в 9:00 каждый день, пока до дедлайна больше суток
+    - 'hourly' - в 9, 12, 14 и 16 часов в последние сутки перед дедлайном
+    - 'before' - за 4 часа, 2 часа, 1 час и 30 минут до дедлайна
     """
-    if not deadline_str:
-        return None
+    if not deadline or deadline <= now:
+        return []
+    deadline = deadline.astimezone(MOSCOW_TZ)
+    now = now.astimezone(MOSCOW_TZ)
+    instants = []
     
-    now = datetime.now(MOSCOW_TZ)
-    today = now.date()
+    day = now.date()
+    while day <= deadline.date():
+        for hour in sorted(set(DEADLINE_DAY_HOURS) | {DAILY_REMINDER_HOUR}):
+            when = MOSCOW_TZ.localize(datetime(day.year, day.month, day.day, hour))
+            if when <= now or when >= deadline:
+                continue
+            if deadline - when >= timedelta(days=1):
+                if hour == DAILY_REMINDER_HOUR:
+                    instants.append((when, 'daily', day.isoformat()))
+            elif hour in DEADLINE_DAY_HOURS:
+                instants.append((when, 'hourly', f"{day.isoformat()}T{hour:02d}"))
+        day += timedelta(days=1)
     
-    deadline_str = deadline_str.strip()
+    for slot, offset, _ in BEFORE_DEADLINE:
+        when = deadline - offset
+        if when > now:
+            instants.append((when, 'before', slot))
     
-    # Формат: "сегодня до 15:00" или "сегодня до 3:00 PM"
-    if deadline_str.lower().startswith("сегодня"):
-        try:
-            time_part = deadline_str.split("до")[-1].strip()
-            # Парсим время
-            if "PM" in time_part.upper() or "AM" in time_part.upper():
-                # 12-часовой формат
-                time_str = time_part.replace("PM", "").replace("pm", "").replace("AM", "").replace("am", "").strip()
-                hour = int(time_str.split(":")[0])
-                minute = int(time_str.split(":")[1]) if ":" in time_str else 0
-                if "PM" in time_part.upper() and hour != 12:
-                    hour += 12
-                elif "AM" in time_part.upper() and hour == 12:
-                    hour = 0
-            else:
-                # 24-часовой формат
-                if ":" in time_part:
-                    hour = int(time_part.split(":")[0])
-                    minute = int(time_part.split(":")[1])
-                else:
-                    hour = int(time_part)
-                    minute = 0
-            
-            deadline = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            return MOSCOW_TZ.localize(deadline)
-        except Exception as e:
-            logger.error(f"Ошибка парсинга 'сегодня до': {e}")
-            return None
-    
-    # Формат: ДД.ММ.ГГГГ ЧЧ:ММ или ДД.ММ.ГГГГ
-    try:
-        if " " in deadline_str:
-            deadline = datetime.strptime(deadline_str, "%d.%m.%Y %H:%M")
-        else:
-            deadline = datetime.strptime(deadline_str, "%d.%m.%Y")
-            # Если только дата, ставим время 23:59
-            deadline = deadline.replace(hour=23, minute=59)
-        
-        return MOSCOW_TZ.localize(deadline)
-    except ValueError:
-        logger.error(f"Не удалось распарсить дедлайн: {deadline_str}")
-        return None
+    instants.sort(key=lambda item: item[0])
+    return instants
 
 
-async def send_custom_task_reminders(app: Application):
-    """Отправка напоминаний о ручных задачах"""
-    try:
-        db = app.bot_data.get('db')
-        if not db:
-            logger.error("База данных не найдена в bot_data")
+def build_reminder_text(task: dict, deadline: datetime, when: datetime, kind: str, slot: str) -> str:
+    """Текст напоминания о задаче"""
+    deadline_str = task.get('deadline', '')
+    assignee = ASSIGNEE_NAMES.get(task.get('assignee', 'all'), task.get('assignee') or 'Все')
+    text = (
+        f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
+        f"📝 Задача: {task['title']}\n"
+        f"⏰ Срок: {deadline_str}\n"
+    )
+    if kind == 'daily':
+        days_until = (deadline - when).days
+        text += f"📅 До дедлайна осталось {days_until} {'день' if days_until == 1 else 'дня' if days_until < 5 else 'дней'}\n"
+    elif kind == 'before':
+        label = next((label for s, _, label in BEFORE_DEADLINE if s == slot), "")
+        text += f"⏳ До дедлайна осталось {label}\n"
+    text += f"👤 Исполнитель: {assignee}"
+    if kind == 'hourly':
+        text += "\n\n⚠️ Не забудьте выполнить задачу!"
+    return text
+
+
+class ReminderEngine:
+    """
+    Планировщик напоминаний о ручных задачах
+    В куче лежит только ближайшее напоминание каждой задачи: (время, порядковый номер, task_id, поколение)
+    Поколение задачи увеличивается при каждом пересчете, поэтому устаревшие записи в куче
+    просто пропускаются, а не ищутся и удаляются
+    """
+    
+    def __init__(self, app: Application):
+        self.app = app
+        self._heap = []
+        self._plans = {}  # task_id -> (поколение, дедлайн, deque оставшихся моментов)
+        self._generations = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._stopping = False
+    
+    @property
+    def db(self):
+        return self.app.bot_data.get('db')
+    
+    async def start(self):
+        """Загружает задачи с еще не прошедшим сроком и запускает цикл напоминаний"""
+        # Берем момент чуть в прошлом, чтобы подхватить напоминания, пропущенные во время простоя;
+        # уже отправленные отсеет журнал напоминаний
+        since = datetime.now(MOSCOW_TZ) - timedelta(minutes=REMINDER_GRACE_MINUTES)
+        tasks = await self.db.get_tasks_with_deadline_between(since.timestamp(), None, REMINDER_STATUSES)
+        for task in tasks:
+            self._plan_task(task, since)
+        self._runner = asyncio.create_task(self._run())
+        logger.info(f"Движок напоминаний запущен: задач с напоминаниями {len(self._plans)}")
+    
+    async def stop(self):
+        """Останавливает цикл напоминаний"""
+        # Флаг нужен помимо cancel(): asyncio.wait_for в Python < 3.12 теряет отмену,
+        # если событие пробуждения сработало в тот же момент
+        self._stopping = True
+        self._wakeup.set()
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+    
+    async def reschedule(self, task_id: int):
+        """Пересчитывает напоминания задачи (после создания, изменения, завершения или удаления)"""
+        task = await self.db.get_custom_task(task_id)
+        if task:
+            self._plan_task(task, datetime.now(MOSCOW_TZ))
+        else:
+            self.cancel(task_id)
+        self._wakeup.set()
+    
+    def cancel(self, task_id: int):
+        """Отменяет все напоминания задачи"""
+        self._generations[task_id] = self._generations.get(task_id, 0) + 1
+        self._plans.pop(task_id, None)
+    
+    def _plan_task(self, task: dict, now: datetime):
+        task_id = task['task_id']
+        self.cancel(task_id)
+        if task.get('status') not in REMINDER_STATUSES:
             return
-        
-        # Получаем все активные задачи
-        active_tasks = db.get_custom_tasks(status='active')
-        if not active_tasks:
+        deadline = deadline_from_timestamp(task.get('deadline_ts'))
+        instants = deque(compute_reminder_instants(deadline, now))
+        if not instants:
             return
+        generation = self._generations[task_id]
+        self._plans[task_id] = (generation, deadline, instants)
+        self._push(task_id, generation, instants[0][0])
+    
+    def _push(self, task_id: int, generation: int, when: datetime):
+        heapq.heappush(self._heap, (when.timestamp(), next(self._counter), task_id, generation))
+    
+    async def _run(self):
+        while not self._stopping:
+            try:
+                # Выбрасываем записи отмененных и пересчитанных задач
+                while self._heap and self._heap[0][3] != self._generations.get(self._heap[0][2]):
+                    heapq.heappop(self._heap)
+                
+                self._wakeup.clear()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+                
+                delay = self._heap[0][0] - datetime.now(MOSCOW_TZ).timestamp()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                _, _, task_id, generation = heapq.heappop(self._heap)
+                await self._fire(task_id, generation)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка в цикле напоминаний: {e}", exc_info=True)
+                await asyncio.sleep(1)
+    
+    async def _fire(self, task_id: int, generation: int):
+        plan = self._plans.get(task_id)
+        if not plan or plan[0] != generation:
+            return
+        _, deadline, instants = plan
+        when, kind, slot = instants.popleft()
+        if instants:
+            self._push(task_id, generation, instants[0][0])
+        else:
+            self._plans.pop(task_id, None)
         
-        now = datetime.now(MOSCOW_TZ)
-        chat_id = app.bot_data.get('CHAT_ID')
-        if not chat_id:
-            import os
-            chat_id = os.getenv('CHAT_ID', '').strip()
-        
+        if deadline <= datetime.now(MOSCOW_TZ):
+            return
+        task = await self.db.get_custom_task(task_id)
+        if not task or task.get('status') not in REMINDER_STATUSES:
+            return
+        chat_id = self.app.bot_data.get('CHAT_ID') or os.getenv('CHAT_ID', '').strip()
         if not chat_id:
             logger.error("CHAT_ID не найден")
             return
-        
         chat_id = int(chat_id) if isinstance(chat_id, str) else chat_id
         
-        assignee_names = {
-            "AG": "Lysenko Alexander",
-            "KA": "Ruslan Cherenkov",
-            "all": "Все"
-        }
+        # Журнал в БД гарантирует, что одно напоминание уходит один раз, в том числе после перезапуска
+        # (если отправка не удалась, отметка снимается)
+        if not await self.db.try_claim_reminder(task_id, kind, slot):
+            logger.info(f"Напоминание о задаче #{task_id} ({kind} {slot}) уже отправлялось")
+            return
         
-        for task in active_tasks:
-            deadline_str = task.get('deadline', '')
-            if not deadline_str:
-                continue
-            
-            deadline = parse_deadline(deadline_str)
-            if not deadline:
-                continue
-            
-            # Пропускаем просроченные задачи
-            if deadline < now:
-                continue
-            
-            time_until_deadline = deadline - now
-            days_until = time_until_deadline.days
-            hours_until = time_until_deadline.total_seconds() / 3600
-            
-            # Определяем, нужно ли отправлять напоминание
-            should_remind = False
-            reminder_text = ""
-            reminder_key = None  # Ключ для отслеживания отправленных напоминаний
-            
-            # Если задача на день (дедлайн сегодня)
-            if days_until == 0:
-                # Напоминания в день дедлайна: 9:00, 12:00, 14:00, 16:00
-                current_hour = now.hour
-                if current_hour in [9, 12, 14, 16] and now.minute < 5:
-                    reminder_key = f"task_{task['task_id']}_hour_{current_hour}"
-                    if not hasattr(app.bot_data, 'sent_reminders'):
-                        app.bot_data['sent_reminders'] = set()
-                    if reminder_key not in app.bot_data['sent_reminders']:
-                        should_remind = True
-                        app.bot_data['sent_reminders'].add(reminder_key)
-                        reminder_text = (
-                            f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                            f"📝 Задача: {task['title']}\n"
-                            f"⏰ Срок: {deadline_str}\n"
-                            f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}\n\n"
-                            f"⚠️ Не забудьте выполнить задачу!"
-                        )
-                
-                # Напоминания за определенное время до дедлайна
-                if hours_until <= 4 and hours_until > 0:
-                    # За 4 часа, 2 часа, 1 час, 30 минут
-                    if 3.5 <= hours_until <= 4.5:
-                        reminder_key = f"task_{task['task_id']}_4h"
-                        # Проверяем, не отправляли ли уже это напоминание
-                        if not hasattr(app.bot_data, 'sent_reminders'):
-                            app.bot_data['sent_reminders'] = set()
-                        if reminder_key not in app.bot_data['sent_reminders']:
-                            should_remind = True
-                            app.bot_data['sent_reminders'].add(reminder_key)
-                            reminder_text = (
-                                f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                                f"📝 Задача: {task['title']}\n"
-                                f"⏰ Срок: {deadline_str}\n"
-                                f"⏳ До дедлайна осталось ~4 часа\n"
-                                f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}"
-                            )
-                    elif 1.5 <= hours_until <= 2.5:
-                        reminder_key = f"task_{task['task_id']}_2h"
-                        if not hasattr(app.bot_data, 'sent_reminders'):
-                            app.bot_data['sent_reminders'] = set()
-                        if reminder_key not in app.bot_data['sent_reminders']:
-                            should_remind = True
-                            app.bot_data['sent_reminders'].add(reminder_key)
-                            reminder_text = (
-                                f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                                f"📝 Задача: {task['title']}\n"
-                                f"⏰ Срок: {deadline_str}\n"
-                                f"⏳ До дедлайна осталось ~2 часа\n"
-                                f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}"
-                            )
-                    elif 0.5 <= hours_until <= 1.5:
-                        reminder_key = f"task_{task['task_id']}_1h"
-                        if not hasattr(app.bot_data, 'sent_reminders'):
-                            app.bot_data['sent_reminders'] = set()
-                        if reminder_key not in app.bot_data['sent_reminders']:
-                            should_remind = True
-                            app.bot_data['sent_reminders'].add(reminder_key)
-                            reminder_text = (
-                                f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                                f"📝 Задача: {task['title']}\n"
-                                f"⏰ Срок: {deadline_str}\n"
-                                f"⏳ До дедлайна осталось ~1 час\n"
-                                f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}"
-                            )
-                    elif 0.25 <= hours_until <= 0.5:
-                        reminder_key = f"task_{task['task_id']}_30m"
-                        if not hasattr(app.bot_data, 'sent_reminders'):
-                            app.bot_data['sent_reminders'] = set()
-                        if reminder_key not in app.bot_data['sent_reminders']:
-                            should_remind = True
-                            app.bot_data['sent_reminders'].add(reminder_key)
-                            reminder_text = (
-                                f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                                f"📝 Задача: {task['title']}\n"
-                                f"⏰ Срок: {deadline_str}\n"
-                                f"⏳ До дедлайна осталось ~30 минут\n"
-                                f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}"
-                            )
-            else:
-                # За несколько дней до дедлайна - напоминание раз в день
-                # Отправляем в 9:00 каждый день
-                if now.hour == 9 and now.minute < 5:
-                    reminder_key = f"task_{task['task_id']}_day_{now.date()}"
-                    if not hasattr(app.bot_data, 'sent_reminders'):
-                        app.bot_data['sent_reminders'] = set()
-                    if reminder_key not in app.bot_data['sent_reminders']:
-                        should_remind = True
-                        app.bot_data['sent_reminders'].add(reminder_key)
-                        reminder_text = (
-                            f"⏰ **НАПОМИНАНИЕ О ЗАДАЧЕ**\n\n"
-                            f"📝 Задача: {task['title']}\n"
-                            f"⏰ Срок: {deadline_str}\n"
-                            f"📅 До дедлайна осталось {days_until} {'день' if days_until == 1 else 'дня' if days_until < 5 else 'дней'}\n"
-                            f"👤 Исполнитель: {assignee_names.get(task.get('assignee', 'all'), 'Все')}"
-                        )
-            
-            if should_remind and reminder_text:
-                try:
-                    await app.bot.send_message(
-                        chat_id=chat_id,
-                        text=reminder_text,
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"✅ Напоминание о задаче #{task['task_id']} отправлено в чат {chat_id}")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка отправки напоминания: {e}", exc_info=True)
-    
-    except Exception as e:
-        logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА в send_custom_task_reminders: {e}", exc_info=True)
+        try:
+            await send_message(
+                self.app,
+                priority=BULK,
+                chat_id=chat_id,
+                text=build_reminder_text(task, deadline, when, kind, slot),
+                parse_mode='Markdown'
+            )
+            logger.info(f"✅ Напоминание о задаче #{task_id} ({kind} {slot}) отправлено в чат {chat_id}")
+        except asyncio.CancelledError:
+            # Бот останавливается, а напоминание не ушло - после запуска его догонит REMINDER_GRACE_MINUTES
+            await self.db.release_reminder(task_id, kind, slot)
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки напоминания: {e}", exc_info=True)
+            await self.db.release_reminder(task_id, kind, slot)
 
+
+async def reschedule_task_reminders(context, task_id: int):
+    """
+    Пересчитывает напоминания задачи после ее создания, изменения или завершения
+    context - ContextTypes или Application (нужен только bot_data)
+    """
+    try:
+        engine = context.bot_data.get('reminder_engine')
+        if engine and task_id:
+            await engine.reschedule(task_id)
+    except Exception as e:
+        logger.error(f"Ошибка пересчета напоминаний задачи #{task_id}: {e}", exc_info=True)
@@ -0,0 +1,187 @@
+"""
+МОДУЛЬ ДЛЯ МАРШРУТИЗАЦИИ НАЖАТИЙ НА КНОПКИ (callback_data -> обработчик)
+Маршруты объявляются один раз при запуске:
+
+    router = CallbackRouter('menu')
+
+    @router.route("menu_main")
+    async def show_main_menu(query, context, db): ...
+
+    @router.route("weekly_day_{day:int}")
+    async def show_weekly_day(query, context, db, day: int): ...
+
+- маршрут без {...} - точное совпадение (поиск в словаре)
+- {имя} - строка до конца данных (или до следующего литерала), {имя:int} - целое число
+- маршруты с параметрами хранятся в префиксном дереве по литеральной части до первого {...},
+  поэтому поиск обработчика занимает O(длина callback_data) и не зависит от числа маршрутов
+- если подходят несколько маршрутов, побеждает самый длинный литеральный префикс
+  (team_remove_confirm_{username} важнее team_remove_{username})
+
+Компактные кнопки (CallbackAction из callback_codec) строки не разбирают: обработчик ищется
+по имени действия, а значения передаются в параметры маршрута по порядку:
+
+    @router.route("team_remove_{username}", action="team_remove")
+
+Нераспознанные данные считаются в метриках: callbacks.<имя роутера>.unknown
+"""
+
+import logging
+import re
+
+import metrics
+from callback_codec import CallbackAction
+
+logger = logging.getLogger(__name__)
+
+_PARAM_RE = re.compile(r'\{(\w+)(?::(int|str))?\}')
+_CONVERTERS = {'int': (r'-?\d+', int), 'str': (r'.+?', str)}
+
+
+class Route:
+    """Один маршрут: шаблон, обработчик и (для шаблонов с параметрами) регулярное выражение"""
+
+    def __init__(self, pattern: str, handler):
+        self.pattern = pattern
+        self.handler = handler
+        self.converters = {}
+        regex = []
+        position = 0
+        for match in _PARAM_RE.finditer(pattern):
+            regex.append(re.escape(pattern[position:match.start()]))
+            name, kind = match.group(1), match.group(2) or 'str'
+            part, converter = _CONVERTERS[kind]
+            regex.append(f'(?P<{name}>{part})')
+            self.converters[name] = converter
+            position = match.end()
+        regex.append(re.escape(pattern[position:]))
+        self.literal = pattern[:pattern.index('{')] if self.converters else pattern
+        self.regex = re.compile(''.join(regex) + r'\Z') if self.converters else None
+        # Параметры, которые получает обработчик, - по порядку в шаблоне
+        self.params = tuple(name for name in self.converters if not name.startswith('_'))
+
+    def match(self, data: str):
+        """Словарь аргументов, если данные подходят под шаблон, иначе None"""
+        found = self.regex.match(data)
+        if not found:
+            return None
+        # Параметры с именем на "_" только участвуют в сопоставлении и в обработчик не передаются
+        return {
+            name: self.converters[name](value)
+            for name, value in found.groupdict().items()
+            if not name.startswith('_')
+        }
+
+
+class CallbackRouter:
+    """
+    Таблица маршрутов для callback_data
+    Обработчик вызывается как handler(*handler_args, **аргументы_из_шаблона)
+    """
+
+    def __init__(self, name: str = 'callbacks'):
+        self.name = name
+        self._exact = {}
+        self._prefix_routes = {}  # литеральный префикс -> [Route, ...]
+        self._trie = {}
+        self._actions = {}  # действие компактной кнопки -> (обработчик, имена параметров)
+
+    def add(self, pattern: str, handler, action: str = None):
+        """
+        Регистрирует обработчик для шаблона
+        action - действие компактной кнопки, которое обрабатывает этот же маршрут
+        (значения действия передаются в параметры шаблона по порядку)
+        """
+        route = Route(pattern, handler)
+        if action:
+            self.action(action, handler, route.params)
+        if route.regex is None:
+            self._exact[pattern] = route
+            return route
+        routes = self._prefix_routes.setdefault(route.literal, [])
+        routes.append(route)
+        node = self._trie
+        for char in route.literal:
+            node = node.setdefault(char, {})
+        node[None] = routes
+        return route
+
+    def route(self, *patterns: str, action: str = None):
+        """Декоратор: @router.route("menu_main", "menu_back")"""
+        def decorator(handler):
+            for pattern in patterns:
+                self.add(pattern, handler, action)
+            return handler
+        return decorator
+
+    def prefix(self, literal: str, handler, actions=()):
+        """
+        Любые данные, начинающиеся с literal (обработчик разбирает их сам)
+        actions - действия компактных кнопок, которые передаются этому же обработчику целиком
+        """
+        for action in actions:
+            self.action(action, handler)
+        return self.add(literal + '{_rest}', handler)
+
+    def action(self, name: str, handler, params=()):
+        """
+        Обработчик действия компактной кнопки: handler(*handler_args, **dict(zip(params, значения)))
+        Без params значения не передаются (обработчик получает CallbackAction среди handler_args)
+        """
+        self._actions[name] = (handler, tuple(params))
+
+    def ignore(self, *patterns: str):
+        """Данные, которые обрабатывает кто-то другой (например, ConversationHandler)"""
+        for pattern in patterns:
+            self.add(pattern, None)
+
+    def resolve(self, data: str):
+        """
+        Находит обработчик: (handler, аргументы) или (None, None), если маршрута нет
+        Для маршрутов из ignore() возвращается (None, {})
+        """
+        route = self._exact.get(data)
+        if route is not None:
+            return route.handler, {}
+
+        # Идем по дереву вдоль data и собираем все маршруты, чей префикс совпал
+        candidates = []
+        node = self._trie
+        if None in node:
+            candidates.append(node[None])
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                candidates.append(node[None])
+
+        for routes in reversed(candidates):
+            for route in routes:
+                args = route.match(data)
+                if args is not None:
+                    return route.handler, args
+        return None, None
+
+    def resolve_action(self, data: CallbackAction):
+        """То же, что resolve(), для компактной кнопки: по имени действия, без разбора строк"""
+        entry = self._actions.get(data.action)
+        if entry is None:
+            return None, None
+        handler, params = entry
+        if params and len(params) != len(data.values):
+            return None, None
+        return handler, dict(zip(params, data.values))
+
+    async def dispatch(self, data, *handler_args) -> bool:
+        """Вызывает обработчик для data (строка или CallbackAction); False - если маршрут не найден"""
+        if isinstance(data, CallbackAction):
+            handler, args = self.resolve_action(data)
+        else:
+            handler, args = self.resolve(data)
+        if args is None:
+            metrics.increment(f"callbacks.{self.name}.unknown")
+            logger.warning(f"Неизвестный формат данных кнопки ({self.name}): {data}")
+            return False
+        if handler is not None:
+            await handler(*handler_args, **args)
+        return True
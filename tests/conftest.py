@@ -0,0 +1,10 @@
+"""
+Общие настройки тестов
+Запуск из корня репозитория: python -m pytest -q
+"""
+
+import os
+import sys
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,151 @@
+"""Спам-фильтр (регулярное выражение из префиксного дерева, файл правил) и ограничение частоты"""
+
+import os
+
+import antispam
+from antispam import FLOOD_BLOCK, FLOOD_DROP, FLOOD_OK, FloodLimiter, SpamMatcher, _load_file, build_pattern
+
+
+def test_shared_prefixes_are_merged():
+    pattern = build_pattern(["ab", "abc", "abd"])
+    # Достаточно самой короткой фразы: "abc" и "abd" уже начинаются с "ab"
+    assert pattern.pattern == "ab"
+    pattern = build_pattern(["abc", "abd", "x"])
+    assert pattern.pattern == "(?:ab(?:c|d)|x)"
+    assert pattern.search("zzabdzz")
+    assert not pattern.search("ab")
+
+
+def test_metacharacters_are_escaped():
+    pattern = build_pattern(["a.b", "c+", "(d)"])
+    assert pattern.search("a.b")
+    assert not pattern.search("axb")
+    assert pattern.search("cc+")
+    assert not pattern.search("ccc")
+    assert pattern.search("(d)")
+    assert not pattern.search("d")
+
+
+def test_empty_rules_have_no_pattern():
+    assert build_pattern([]) is None
+    matcher = SpamMatcher([], [], keywords_file='')
+    assert not matcher.is_spam("обычное сообщение", "someone")
+
+
+def test_keywords_and_blacklist_ignore_case():
+    matcher = SpamMatcher(["Казино", "free MONEY"], ["SpamBot"], keywords_file='')
+    assert matcher.is_spam("ЗАХОДИ В КАЗИНО!")
+    assert matcher.is_spam("get Free Money now")
+    assert matcher.is_spam("привет", "the_spambot_42")
+    assert matcher.is_blacklisted("SPAMBOT")
+    assert not matcher.is_spam("привет", "alex")
+    assert not matcher.is_blacklisted(None)
+
+
+def test_rules_file_lines(tmp_path):
+    path = tmp_path / "spam.txt"
+    path.write_text("# комментарий\n\nКупи слона\n@ScamUser\n  реклама  \n", encoding='utf-8')
+    assert _load_file(str(path)) == (["Купи слона", "реклама"], ["ScamUser"])
+    matcher = SpamMatcher(["казино"], [], keywords_file=str(path))
+    assert matcher.is_spam("купи слона!")
+    assert matcher.is_spam("казино")
+    assert matcher.is_blacklisted("scamuser")
+    assert not matcher.is_spam("комментарий")
+
+
+def test_rules_file_is_reloaded_on_change_and_delete(tmp_path, monkeypatch):
+    monkeypatch.setattr(antispam, 'SPAM_RELOAD_SECONDS', 0)
+    path = tmp_path / "spam.txt"
+    path.write_text("первое\n", encoding='utf-8')
+    matcher = SpamMatcher(["казино"], [], keywords_file=str(path))
+    assert matcher.is_spam("первое")
+
+    path.write_text("второе\n@bad_user\n", encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    assert matcher.is_spam("второе")
+    assert not matcher.is_spam("первое")
+    assert matcher.is_blacklisted("bad_user")
+
+    # Файл удален - остаются встроенные правила
+    path.unlink()
+    assert not matcher.is_spam("второе")
+    assert not matcher.is_blacklisted("bad_user")
+    assert matcher.is_spam("казино")
+
+
+def test_reload_is_throttled(tmp_path, monkeypatch):
+    monkeypatch.setattr(antispam, 'SPAM_RELOAD_SECONDS', 3600)
+    path = tmp_path / "spam.txt"
+    path.write_text("первое\n", encoding='utf-8')
+    matcher = SpamMatcher([], [], keywords_file=str(path))
+    assert matcher.is_spam("первое")
+    path.write_text("второе\n", encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    # До следующей проверки файл не перечитывается
+    assert not matcher.is_spam("второе")
+    matcher.reload()
+    assert matcher.is_spam("второе")
+
+
+def hits(limiter, user_id, kind, count, now=0.0):
+    return [limiter.hit(user_id, kind, now=now) for _ in range(count)]
+
+
+def test_ok_then_drop_then_block():
+    limiter = FloodLimiter(window=10, max_messages=3, max_callbacks=5, block_multiplier=2)
+    assert hits(limiter, 1, 'message', 3) == [FLOOD_OK] * 3
+    # Сверх лимита - отбрасываем, пока не превышен лимит * множитель
+    assert hits(limiter, 1, 'message', 3) == [FLOOD_DROP] * 3
+    assert limiter.hit(1, 'message', now=0.0) == FLOOD_BLOCK
+    # После блокировки история очищается
+    assert limiter.hit(1, 'message', now=0.0) == FLOOD_OK
+
+
+def test_kinds_and_users_are_counted_separately():
+    limiter = FloodLimiter(window=10, max_messages=1, max_callbacks=2, block_multiplier=0)
+    assert limiter.hit(1, 'message', now=0.0) == FLOOD_OK
+    assert limiter.hit(1, 'message', now=0.0) == FLOOD_DROP
+    assert hits(limiter, 1, 'callback', 2) == [FLOOD_OK] * 2
+    assert limiter.hit(2, 'message', now=0.0) == FLOOD_OK
+    # Без множителя пользователя только ограничивают, но не блокируют
+    assert set(hits(limiter, 1, 'message', 20)) == {FLOOD_DROP}
+    # Неизвестные виды обновлений не ограничиваются
+    assert limiter.hit(1, 'poll', now=0.0) == FLOOD_OK
+
+
+def test_window_expiry_restores_quota():
+    limiter = FloodLimiter(window=10, max_messages=2, max_callbacks=2, block_multiplier=3)
+    assert hits(limiter, 1, 'message', 3, now=0.0) == [FLOOD_OK, FLOOD_OK, FLOOD_DROP]
+    assert limiter.hit(1, 'message', now=5.0) == FLOOD_DROP
+    # События ровно на границе окна уже не считаются: остаются 5.0 и 10.0
+    assert limiter.hit(1, 'message', now=10.0) == FLOOD_OK
+    # Отброшенные события тоже занимают окно
+    assert limiter.hit(1, 'message', now=10.0) == FLOOD_DROP
+
+
+def test_forget_resets_history_after_unblock():
+    limiter = FloodLimiter(window=10, max_messages=2, max_callbacks=2, block_multiplier=2)
+    hits(limiter, 1, 'message', 3)
+    hits(limiter, 1, 'callback', 3)
+    hits(limiter, 2, 'message', 3)
+    limiter.forget(1)
+    assert limiter.hit(1, 'message', now=1.0) == FLOOD_OK
+    assert limiter.hit(1, 'callback', now=1.0) == FLOOD_OK
+    # Чужая история не тронута
+    assert limiter.hit(2, 'message', now=1.0) == FLOOD_DROP
+
+
+def test_idle_users_are_pruned_at_capacity(monkeypatch):
+    monkeypatch.setattr(antispam, 'FLOOD_MAX_TRACKED_USERS', 3)
+    limiter = FloodLimiter(window=10, max_messages=5, max_callbacks=5, block_multiplier=2)
+    for user_id in (1, 2, 3):
+        limiter.hit(user_id, 'message', now=0.0)
+    limiter.hit(3, 'message', now=8.0)
+    # Новый пользователь при заполненной таблице: 1 и 2 молчат дольше окна и выбрасываются
+    limiter.hit(4, 'message', now=12.0)
+    assert set(limiter._events) == {(3, 'message'), (4, 'message')}
+    # Пока таблица не заполнена, никого не выбрасываем
+    limiter.hit(5, 'message', now=30.0)
+    assert len(limiter._events) == 3
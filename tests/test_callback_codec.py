@@ -0,0 +1,73 @@
+"""Компактное кодирование callback_data"""
+
+import pytest
+
+import callback_codec
+from callback_codec import (
+    MAX_CALLBACK_BYTES, CallbackAction, PayloadRegistry, callback_data_matches,
+    decode_callback_data, encode_callback_data,
+)
+
+LONG_NAME = 'Весенко Александр Сергеевич, старший специалист отдела'
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(callback_codec, 'registry', PayloadRegistry(size=4))
+
+
+@pytest.mark.parametrize('action, values', [
+    ('work_take', (5, 'AG')),
+    ('work_done', (123456789, 'KA')),
+    ('team_remove', ('confirm_bob',)),
+    ('team_earned', ('',)),
+    ('task_view', (0,)),
+    ('team_remove_confirm', (LONG_NAME,)),
+])
+def test_round_trip(action, values):
+    data = encode_callback_data(action, *values)
+    assert data.startswith('~')
+    assert len(data.encode('utf-8')) <= MAX_CALLBACK_BYTES
+    assert decode_callback_data(data) == CallbackAction(action, values)
+
+
+def test_legacy_data_is_returned_as_is():
+    assert decode_callback_data("work_take_5_AG") == "work_take_5_AG"
+    assert decode_callback_data("") == ""
+
+
+def test_registry_reference_expires_after_restart(monkeypatch):
+    data = encode_callback_data('team_remove_confirm', LONG_NAME)
+    # Перезапуск: реестр пуст и нумеруется заново, и номер 0 теперь у другого сотрудника
+    monkeypatch.setattr(callback_codec, 'registry', PayloadRegistry(size=4))
+    other = encode_callback_data('team_remove_confirm', LONG_NAME.replace('Весенко', 'Черенков'))
+    assert decode_callback_data(data) is None
+    assert decode_callback_data(other).values[0].startswith('Черенков')
+
+
+def test_evicted_registry_entry_expires():
+    data = encode_callback_data('team_remove_confirm', LONG_NAME)
+    for i in range(4):
+        encode_callback_data('team_remove_confirm', f'{LONG_NAME} {i}')
+    assert decode_callback_data(data) is None
+
+
+@pytest.mark.parametrize('data', ['~z', '~a', '~a!!!', '~aBQ', '~aBQJBQ'])
+def test_corrupt_data_is_rejected(data):
+    assert decode_callback_data(data) is None
+
+
+def test_negative_numbers_are_rejected():
+    with pytest.raises(ValueError):
+        encode_callback_data('task_view', -1)
+
+
+def test_wrong_field_count_is_rejected():
+    with pytest.raises(ValueError):
+        encode_callback_data('work_take', 5)
+
+
+def test_callback_data_matches_compact_and_legacy():
+    assert callback_data_matches(encode_callback_data('work_take', 5, 'AG'), 'work_take', 5, 'AG')
+    assert not callback_data_matches(encode_callback_data('work_take', 5, 'AG'), 'work_done', 5, 'AG')
+    assert callback_data_matches('work_done_5_KA', 'work_done', 5, 'KA')
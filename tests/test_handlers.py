@@ -0,0 +1,118 @@
+"""Правка сообщений с кэшем отрисовки (safe_edit_message) и отметки в чек-листе"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import handlers
+from database import Database
+from handlers import build_checklist_keyboard, checklist_member_key, checklist_overall_status, safe_edit_message
+
+
+class StubQuery:
+    def __init__(self, chat_id=-100, message_id=1, edit_date=None, error=None):
+        self.message = SimpleNamespace(chat_id=chat_id, message_id=message_id, edit_date=edit_date)
+        self.error = error
+        self.edits = []
+        self.answers = 0
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        if self.error:
+            raise self.error
+        self.edits.append(text)
+        # Telegram возвращает сообщение с новым edit_date; следующее нажатие придет уже с ним
+        self.message.edit_date = len(self.edits)
+        return SimpleNamespace(edit_date=self.message.edit_date)
+
+    async def answer(self, *args, **kwargs):
+        self.answers += 1
+
+
+def keyboard(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data='x')]])
+
+
+@pytest.fixture(autouse=True)
+def clean_render_cache():
+    handlers._rendered_messages.clear()
+    yield
+    handlers._rendered_messages.clear()
+
+
+def test_identical_render_skips_api_call():
+    query = StubQuery()
+    asyncio.run(safe_edit_message(query, "текст", keyboard('a')))
+    asyncio.run(safe_edit_message(query, "текст", keyboard('a')))
+    assert query.edits == ["текст"]
+    # На повторное нажатие все равно отвечаем, чтобы у кнопки пропали "часики"
+    assert query.answers == 1
+
+
+def test_changed_render_goes_through():
+    query = StubQuery()
+    asyncio.run(safe_edit_message(query, "текст", keyboard('a')))
+    asyncio.run(safe_edit_message(query, "текст", keyboard('b')))
+    asyncio.run(safe_edit_message(query, "другой текст", keyboard('b')))
+    asyncio.run(safe_edit_message(query, "другой текст", keyboard('b'), parse_mode=None))
+    assert query.edits == ["текст", "текст", "другой текст", "другой текст"]
+
+
+def test_new_edit_date_invalidates_cache():
+    query = StubQuery()
+    asyncio.run(safe_edit_message(query, "текст"))
+    # Сообщение поменяли в обход кэша (другой обработчик или клиент)
+    query.message.edit_date = 100
+    asyncio.run(safe_edit_message(query, "текст"))
+    assert query.edits == ["текст", "текст"]
+
+
+def test_messages_are_cached_separately():
+    first, second = StubQuery(message_id=1), StubQuery(message_id=2)
+    asyncio.run(safe_edit_message(first, "текст"))
+    asyncio.run(safe_edit_message(second, "текст"))
+    assert first.edits == ["текст"] and second.edits == ["текст"]
+
+
+def test_not_modified_error_is_remembered():
+    query = StubQuery(error=BadRequest("Message is not modified"))
+    asyncio.run(safe_edit_message(query, "текст"))
+    query.error = None
+    asyncio.run(safe_edit_message(query, "текст"))
+    assert query.edits == []
+    assert query.answers == 2
+
+
+def test_checklist_toggle_changes_overall_status(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    weekly_task_id = db.add_weekly_task(0, "Проверить почту")
+    db.save_checklist_message(-100, 5, '2026-10-12', 0, [(weekly_task_id, "Проверить почту")])
+
+    def overall():
+        checklist = db.get_checklist_message(-100, 5)
+        return checklist_overall_status(checklist['statuses'], weekly_task_id)
+
+    # Отметки хранятся под ключом участника, а не под его именем в Telegram
+    ag = checklist_member_key('alex301182', 'Vesenko, Aleksandr')
+    ka = checklist_member_key('Korudirp', 'Cherenkov, Ruslan')
+    assert (ag, ka) == ('AG', 'KA')
+    assert checklist_member_key('stranger', 'Stranger') is None
+
+    assert overall() == "⚪"
+    assert db.cycle_checklist_status('2026-10-12', weekly_task_id, ag) == "⏳"
+    assert overall() == "👤"
+    db.cycle_checklist_status('2026-10-12', weekly_task_id, ka)
+    assert overall() == "👤👤"
+    db.cycle_checklist_status('2026-10-12', weekly_task_id, ag)
+    db.cycle_checklist_status('2026-10-12', weekly_task_id, ka)
+    assert overall() == "✅"
+    keyboard_markup = build_checklist_keyboard(db.get_checklist_message(-100, 5))
+    assert keyboard_markup.inline_keyboard[0][0].text == "1. Проверить почту ✅"
+    db.close()
+
+    # После перезапуска модель и статусы берутся из БД
+    db = Database(str(tmp_path / 'bot.db'))
+    assert overall() == "✅"
+    db.close()
@@ -0,0 +1,59 @@
+"""Ограничение частоты записей лога (RateLimitFilter)"""
+
+import logging
+
+import logging_setup
+from logging_setup import RateLimitFilter, _parse_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def make_record(message, level=logging.INFO, pathname='/app/handlers.py', lineno=10):
+    return logging.LogRecord('handlers', level, pathname, lineno, message, None, None)
+
+
+def test_suppressed_count_is_appended_to_next_record(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logging_setup, 'time', clock)
+    rate_filter = RateLimitFilter(limit=2, window=10)
+    passed = [rate_filter.filter(make_record(f"нажатие {i}")) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+
+    clock.now = 10.0
+    record = make_record("нажатие 5")
+    assert rate_filter.filter(record)
+    assert record.getMessage() == "нажатие 5 (еще 3 похожих записей пропущено)"
+
+    # В новом окне счетчик начинается заново
+    record = make_record("нажатие 6")
+    assert rate_filter.filter(record)
+    assert record.getMessage() == "нажатие 6"
+
+
+def test_warnings_and_other_lines_always_pass(monkeypatch):
+    monkeypatch.setattr(logging_setup, 'time', FakeClock())
+    rate_filter = RateLimitFilter(limit=1, window=10)
+    assert rate_filter.filter(make_record("a"))
+    assert not rate_filter.filter(make_record("a"))
+    for level in (logging.WARNING, logging.ERROR, logging.CRITICAL):
+        assert all(rate_filter.filter(make_record("a", level=level)) for _ in range(5))
+    # Другая строка кода - отдельный счетчик
+    assert rate_filter.filter(make_record("b", lineno=11))
+
+
+def test_per_module_limits_override_default(monkeypatch):
+    monkeypatch.setattr(logging_setup, 'time', FakeClock())
+    rate_filter = RateLimitFilter(limit=0, window=10, limits={'handlers': 1, 'database': 0})
+    assert [rate_filter.filter(make_record("x")) for _ in range(3)] == [True, False, False]
+    # Без своего лимита модуль подчиняется общему (0 - без ограничения)
+    assert all(rate_filter.filter(make_record("x", pathname='/app/reminders.py')) for _ in range(5))
+
+
+def test_parse_limits_skips_invalid_values():
+    assert _parse_limits("bot=20, handlers = 5,database=x,broken") == {'bot': 20, 'handlers': 5}
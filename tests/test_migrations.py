@@ -0,0 +1,113 @@
+"""Миграции схемы: обновление старой базы (версия 6) до актуальной"""
+
+import functools
+import sqlite3
+from datetime import date
+
+import database
+from deadlines import deadline_timestamp
+
+TODAY = date(2026, 10, 12)  # понедельник
+
+
+def make_v6_database(path):
+    """База в состоянии до миграции 7: статусы в task_statuses, срок задач - только текстом"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE schema_version (version INTEGER PRIMARY KEY, applied_at TEXT NOT NULL)')
+    for number, _, migrate in database.MIGRATIONS:
+        if number > 6:
+            break
+        migrate(cursor)
+        cursor.execute('INSERT INTO schema_version (version, applied_at) VALUES (?, ?)', (number, 'test'))
+    cursor.executemany('INSERT INTO task_statuses (task_key, status) VALUES (?, ?)', [
+        ('0_1_AG', '✅'),
+        ('0_2_KA', '⏳'),
+        ('0_1_KA', '⚪'),   # пустой статус не переносится
+        ('1_1_AG', '✅'),   # другой день недели - дату не восстановить
+        ('0_99_AG', '✅'),  # задачи с таким номером нет
+    ])
+    cursor.executemany('''
+        INSERT INTO custom_tasks (title, deadline, creator, created_at)
+        VALUES (?, ?, 'admin', ?)
+    ''', [
+        ('по дате', '20.10.2026 18:00', '2026-10-12T10:00:00'),
+        ('сегодня', 'сегодня до 15:00', '2026-10-12T10:00:00'),
+        ('без срока', '', '2026-10-12T10:00:00'),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def open_upgraded(tmp_path, monkeypatch):
+    path = str(tmp_path / 'bot.db')
+    make_v6_database(path)
+    monkeypatch.setattr(
+        database, '_backfill_task_statuses',
+        functools.partial(database._backfill_task_statuses, today=TODAY)
+    )
+    db = database.Database(path)
+    return db, sqlite3.connect(path)
+
+
+def test_upgrade_reaches_current_version(tmp_path, monkeypatch):
+    db, conn = open_upgraded(tmp_path, monkeypatch)
+    try:
+        assert conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] == database.SCHEMA_VERSION
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {'checklist_statuses', 'checklist_history', 'reminder_ledger', 'checklist_messages'} <= tables
+        assert 'task_statuses' not in tables
+    finally:
+        conn.close()
+        db.close()
+
+
+def test_migration_7_carries_todays_marks(tmp_path, monkeypatch):
+    db, conn = open_upgraded(tmp_path, monkeypatch)
+    try:
+        monday_ids = [row[0] for row in conn.execute('SELECT id FROM weekly_tasks WHERE day = 0 ORDER BY task_order')]
+        rows = set(conn.execute('SELECT date, weekly_task_id, member, status FROM checklist_statuses'))
+        assert rows == {
+            (TODAY.isoformat(), monday_ids[0], 'AG', '✅'),
+            (TODAY.isoformat(), monday_ids[1], 'KA', '⏳'),
+        }
+    finally:
+        conn.close()
+        db.close()
+
+
+def test_migration_9_parses_existing_deadlines(tmp_path, monkeypatch):
+    db, conn = open_upgraded(tmp_path, monkeypatch)
+    try:
+        deadlines = dict(conn.execute('SELECT title, deadline_ts FROM custom_tasks'))
+        assert deadlines['по дате'] == deadline_timestamp('20.10.2026 18:00')
+        # "сегодня" считается от даты создания задачи, а не от дня миграции
+        assert deadlines['сегодня'] == deadline_timestamp('сегодня до 15:00', TODAY)
+        assert deadlines['без срока'] is None
+    finally:
+        conn.close()
+        db.close()
+
+
+def test_migration_10_checklist_messages_round_trip(tmp_path, monkeypatch):
+    db, conn = open_upgraded(tmp_path, monkeypatch)
+    try:
+        db.save_checklist_message(-100, 7, TODAY.isoformat(), 0, [(1, 'Задача 1'), (2, 'Задача 2')])
+        db._checklist_messages.clear()  # читаем из таблицы, а не из кэша
+        checklist = db.get_checklist_message(-100, 7)
+        assert checklist['date'] == TODAY.isoformat()
+        assert checklist['day'] == 0
+        assert [tuple(task) for task in checklist['tasks']] == [(1, 'Задача 1'), (2, 'Задача 2')]
+    finally:
+        conn.close()
+        db.close()
+
+
+def test_current_database_is_not_migrated_again(tmp_path, monkeypatch):
+    db, conn = open_upgraded(tmp_path, monkeypatch)
+    db.close()
+    conn.close()
+    calls = []
+    monkeypatch.setattr(database, 'MIGRATIONS', [(n, d, lambda cursor: calls.append(n)) for n, d, _ in database.MIGRATIONS])
+    database.Database(str(tmp_path / 'bot.db')).close()
+    assert calls == []
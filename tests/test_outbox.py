@@ -0,0 +1,201 @@
+"""Очередь исходящих сообщений: корзина токенов, порядок отправки и объединение правок"""
+
+import asyncio
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
+
+import outbox
+from outbox import BULK, INTERACTIVE, EditCoalescer, MessageDispatcher, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbox, 'time', clock)
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == 2.0
+    clock.now += 1.5
+    assert bucket.delay() == 0.5
+    clock.now += 0.5
+    assert bucket.delay() == 0
+
+
+def test_token_bucket_does_not_exceed_capacity(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbox, 'time', clock)
+    bucket = TokenBucket(rate=1, capacity=3)
+    clock.now += 100
+    for _ in range(3):
+        bucket.take()
+    assert bucket.delay() == 1.0
+    assert not bucket.is_full()
+
+
+def test_token_bucket_pause(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbox, 'time', clock)
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.pause(5)
+    assert bucket.delay() == 5
+    assert not bucket.is_full()
+    clock.now += 5
+    assert bucket.delay() == 0
+    assert bucket.is_full()
+
+
+class RecordingBot:
+    def __init__(self, retry_after_once=()):
+        self.sent = []
+        self.retry_after_once = set(retry_after_once)
+
+    async def send_message(self, chat_id, text):
+        if text in self.retry_after_once:
+            self.retry_after_once.discard(text)
+            raise RetryAfter(0.05)
+        self.sent.append((chat_id, text))
+        return text
+
+
+def test_group_burst_does_not_block_interactive_replies():
+    async def scenario():
+        bot = RecordingBot()
+        dispatcher = MessageDispatcher(bot, workers=2)
+        await dispatcher.start()
+        # Группа: 3 сообщения сразу, остальные - не чаще 20 в минуту
+        bulk = [
+            asyncio.create_task(dispatcher.send('send_message', BULK, chat_id=-100, text=f'bulk {i}'))
+            for i in range(8)
+        ]
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        replies = await asyncio.gather(*[
+            dispatcher.send('send_message', INTERACTIVE, chat_id=10 + i, text=f'reply {i}')
+            for i in range(4)
+        ])
+        elapsed = time.monotonic() - started
+        await dispatcher.stop(timeout=0.1)
+        return bot, bulk, replies, elapsed
+
+    bot, bulk, replies, elapsed = asyncio.run(scenario())
+    assert replies == [f'reply {i}' for i in range(4)]
+    assert elapsed < 1
+    assert [text for chat_id, text in bot.sent if chat_id == -100] == ['bulk 0', 'bulk 1', 'bulk 2']
+    # Не отправленные до остановки сообщения отменяются, а не висят вечно
+    assert all(task.cancelled() for task in bulk[3:])
+
+
+def test_retry_after_is_retried():
+    async def scenario():
+        bot = RecordingBot(retry_after_once={'hello'})
+        dispatcher = MessageDispatcher(bot, workers=1)
+        await dispatcher.start()
+        result = await dispatcher.send('send_message', INTERACTIVE, chat_id=-100, text='hello')
+        await dispatcher.stop()
+        return bot, result
+
+    bot, result = asyncio.run(scenario())
+    assert result == 'hello'
+    assert bot.sent == [(-100, 'hello')]
+
+
+class EditingBot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        self.edits.append((chat_id, message_id, reply_markup.to_dict()))
+
+
+class Owner:
+    def __init__(self):
+        self.bot = EditingBot()
+        self.bot_data = {}
+
+
+def keyboard(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data='x')]])
+
+
+def renderer(label):
+    async def render():
+        return keyboard(label)
+    return render
+
+
+def test_coalescer_sends_one_edit_with_latest_render():
+    async def scenario():
+        owner = Owner()
+        coalescer = EditCoalescer(owner, delay=0.02)
+        for i in range(5):
+            coalescer.schedule(-100, 1, renderer(f'v{i}'))
+        coalescer.schedule(-100, 2, renderer('other'))
+        await asyncio.sleep(0.06)
+        return owner.bot.edits
+
+    edits = asyncio.run(scenario())
+    assert sorted(edits) == sorted([
+        (-100, 1, keyboard('v4').to_dict()),
+        (-100, 2, keyboard('other').to_dict()),
+    ])
+
+
+def test_coalescer_skips_unchanged_markup():
+    async def scenario():
+        owner = Owner()
+        coalescer = EditCoalescer(owner, delay=0.01)
+        # Клавиатура в сообщении уже такая же
+        coalescer.schedule(-100, 1, renderer('same'), current_markup=keyboard('same'))
+        await asyncio.sleep(0.03)
+        first = list(owner.bot.edits)
+        coalescer.schedule(-100, 1, renderer('new'))
+        await asyncio.sleep(0.03)
+        # Повторная отрисовка той же клавиатуры после отправки
+        coalescer.schedule(-100, 1, renderer('new'))
+        await asyncio.sleep(0.03)
+        return first, owner.bot.edits
+
+    first, edits = asyncio.run(scenario())
+    assert first == []
+    assert edits == [(-100, 1, keyboard('new').to_dict())]
+
+
+def test_coalescer_stop_flushes_pending_edits():
+    async def scenario():
+        owner = Owner()
+        coalescer = EditCoalescer(owner, delay=10)
+        coalescer.schedule(-100, 1, renderer('v1'))
+        await coalescer.stop()
+        return owner.bot.edits
+
+    assert asyncio.run(scenario()) == [(-100, 1, keyboard('v1').to_dict())]
+
+
+def test_fallback_edit_goes_through_outbox():
+    class RecordingOutbox:
+        def __init__(self):
+            self.calls = []
+
+        async def send(self, method, priority, **kwargs):
+            self.calls.append((method, priority, kwargs['chat_id'], kwargs['message_id']))
+
+    async def scenario():
+        owner = Owner()
+        owner.bot_data['outbox'] = RecordingOutbox()
+        await outbox.edit_reply_markup(owner, -100, 1, renderer('v1'))
+        return owner
+
+    owner = asyncio.run(scenario())
+    assert owner.bot.edits == []
+    assert owner.bot_data['outbox'].calls == [('edit_message_reply_markup', INTERACTIVE, -100, 1)]
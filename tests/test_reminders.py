@@ -0,0 +1,69 @@
+"""Моменты напоминаний о задачах (compute_reminder_instants)"""
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from reminders import MOSCOW_TZ, compute_reminder_instants
+
+
+def moscow(*args):
+    return MOSCOW_TZ.localize(datetime(*args))
+
+
+def test_past_or_missing_deadline_has_no_reminders():
+    now = moscow(2026, 10, 12, 8, 0)
+    assert compute_reminder_instants(None, now) == []
+    assert compute_reminder_instants(now, now) == []
+    assert compute_reminder_instants(now - timedelta(hours=1), now) == []
+
+
+def test_daily_then_hourly_then_before_deadline():
+    now = moscow(2026, 10, 12, 8, 0)
+    deadline = moscow(2026, 10, 14, 18, 0)
+    instants = compute_reminder_instants(deadline, now)
+    assert [(kind, slot) for _, kind, slot in instants] == [
+        ('daily', '2026-10-12'),
+        ('daily', '2026-10-13'),
+        ('hourly', '2026-10-14T09'),
+        ('hourly', '2026-10-14T12'),
+        ('hourly', '2026-10-14T14'),
+        ('before', '4h'),
+        ('hourly', '2026-10-14T16'),
+        ('before', '2h'),
+        ('before', '1h'),
+        ('before', '30m'),
+    ]
+    times = [when for when, _, _ in instants]
+    assert times == sorted(times)
+    assert all(now < when < deadline for when in times)
+
+
+def test_only_future_instants_are_returned():
+    now = moscow(2026, 10, 14, 16, 30)
+    deadline = moscow(2026, 10, 14, 18, 0)
+    assert [(kind, slot) for _, kind, slot in compute_reminder_instants(deadline, now)] == [
+        ('before', '1h'),
+        ('before', '30m'),
+    ]
+
+
+def test_instants_are_in_moscow_time_for_utc_input():
+    now = moscow(2026, 10, 12, 8, 0).astimezone(pytz.utc)
+    deadline = moscow(2026, 10, 14, 18, 0).astimezone(pytz.utc)
+    first_when, kind, slot = compute_reminder_instants(deadline, now)[0]
+    assert (kind, slot) == ('daily', '2026-10-12')
+    assert first_when == moscow(2026, 10, 12, 9, 0)
+
+
+def test_reminder_ledger_claim_and_release(tmp_path):
+    from database import Database
+    db = Database(str(tmp_path / 'bot.db'))
+    try:
+        assert db.try_claim_reminder(1, 'before', '4h') is True
+        assert db.try_claim_reminder(1, 'before', '4h') is False
+        # Отправка не удалась - отметка снимается, и напоминание можно отправить снова
+        db.release_reminder(1, 'before', '4h')
+        assert db.try_claim_reminder(1, 'before', '4h') is True
+    finally:
+        db.close()
@@ -0,0 +1,56 @@
+"""Маршрутизация нажатий на кнопки (CallbackRouter)"""
+
+import asyncio
+
+from callback_codec import CallbackAction
+from router import CallbackRouter
+
+
+def make_router():
+    router = CallbackRouter('test')
+    router.add("menu_main", 'main')
+    router.add("team_remove_{username}", 'remove', action="team_remove")
+    router.add("team_remove_confirm_{username}", 'confirm', action="team_remove_confirm")
+    router.add("task_{day:int}_{task_index:int}", 'old_task')
+    router.prefix("task_", 'new_task')
+    router.prefix("weekly_", 'weekly', actions=("weekly_forward",))
+    router.ignore("menu_create_task")
+    return router
+
+
+def test_exact_and_parametrized_routes():
+    router = make_router()
+    assert router.resolve("menu_main") == ('main', {})
+    assert router.resolve("task_0_3") == ('old_task', {'day': 0, 'task_index': 3})
+    assert router.resolve("task_view_5") == ('new_task', {})
+    assert router.resolve("menu_create_task") == (None, {})
+    assert router.resolve("unknown") == (None, None)
+
+
+def test_longest_literal_prefix_wins():
+    router = make_router()
+    assert router.resolve("team_remove_confirm_bob") == ('confirm', {'username': 'bob'})
+    assert router.resolve("team_remove_bob") == ('remove', {'username': 'bob'})
+
+
+def test_actions_are_dispatched_without_parsing():
+    router = make_router()
+    # Имя, похожее на другую команду, не меняет маршрут
+    assert router.resolve_action(CallbackAction("team_remove", ("confirm_bob",))) == ('remove', {'username': 'confirm_bob'})
+    assert router.resolve_action(CallbackAction("weekly_forward", (1, 2))) == ('weekly', {})
+    assert router.resolve_action(CallbackAction("team_remove", ())) == (None, None)
+    assert router.resolve_action(CallbackAction("missing", ())) == (None, None)
+
+
+def test_dispatch_passes_arguments():
+    router = CallbackRouter('test')
+    calls = []
+
+    @router.route("work_take_{task_id:int}_{assignee}", action="work_take")
+    async def take(query, task_id: int, assignee: str):
+        calls.append((query, task_id, assignee))
+
+    assert asyncio.run(router.dispatch("work_take_5_AG", 'q1'))
+    assert asyncio.run(router.dispatch(CallbackAction("work_take", (6, "KA")), 'q2'))
+    assert not asyncio.run(router.dispatch("work_take_x_AG", 'q3'))
+    assert calls == [('q1', 5, 'AG'), ('q2', 6, 'KA')]
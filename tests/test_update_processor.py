@@ -0,0 +1,61 @@
+"""Параллельная обработка обновлений с очередью по пользователю и по сообщению"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from update_processor import OrderedUpdateProcessor
+
+GROUP = Chat(id=-100, type='group')
+
+
+def message_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name='u', is_bot=False)
+    message = Message(message_id=update_id, date=datetime.now(timezone.utc), chat=GROUP, from_user=user)
+    return Update(update_id, message=message)
+
+
+def callback_update(update_id: int, user_id: int, message_id: int) -> Update:
+    user = User(id=user_id, first_name='u', is_bot=False)
+    message = Message(message_id=message_id, date=datetime.now(timezone.utc), chat=GROUP)
+    query = CallbackQuery(id=str(update_id), from_user=user, chat_instance='c', message=message)
+    return Update(update_id, callback_query=query)
+
+
+def test_update_keys():
+    assert OrderedUpdateProcessor.update_keys(message_update(1, 5)) == ['user:5']
+    assert OrderedUpdateProcessor.update_keys(callback_update(2, 5, 9)) == ['message:-100:9', 'user:5']
+    assert OrderedUpdateProcessor.update_keys(object()) == []
+
+
+async def run_all(updates):
+    """Запускает обновления одновременно; возвращает журнал (событие, номер обновления)"""
+    processor = OrderedUpdateProcessor(8)
+    log = []
+
+    async def handle(update_id):
+        log.append(('start', update_id))
+        await asyncio.sleep(0.02)
+        log.append(('end', update_id))
+
+    await asyncio.gather(*[processor.do_process_update(update, handle(update.update_id)) for update in updates])
+    assert processor._locks == {}
+    return log
+
+
+def test_same_user_is_sequential():
+    log = asyncio.run(run_all([message_update(1, 5), message_update(2, 5)]))
+    assert log == [('start', 1), ('end', 1), ('start', 2), ('end', 2)]
+
+
+def test_different_users_run_concurrently():
+    log = asyncio.run(run_all([message_update(1, 5), message_update(2, 6)]))
+    assert log[:2] == [('start', 1), ('start', 2)]
+
+
+def test_buttons_under_one_message_are_sequential():
+    log = asyncio.run(run_all([callback_update(1, 5, 9), callback_update(2, 6, 9), callback_update(3, 7, 10)]))
+    assert log.index(('end', 1)) < log.index(('start', 2))
+    # Кнопка под другим сообщением не ждет
+    assert log.index(('start', 3)) < log.index(('end', 1))
@@ -0,0 +1,88 @@
+"""
+МОДУЛЬ ДЛЯ ПАРАЛЛЕЛЬНОЙ ОБРАБОТКИ ОБНОВЛЕНИЙ
+Обновления от разных пользователей обрабатываются одновременно, а от одного пользователя -
+строго по очереди. Нажатия кнопок под одним и тем же сообщением тоже идут по очереди
+(даже от разных пользователей), чтобы чтение-изменение-запись статуса и правка клавиатуры
+не перемешивались. ConversationHandler различает диалоги по (чат, пользователь), поэтому
+очередь по пользователю сохраняет для него привычный последовательный порядок.
+"""
+
+import asyncio
+import logging
+import os
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывать одновременно
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка с упорядочиванием по ключам:
+    - user:<id> - все обновления одного пользователя
+    - message:<chat_id>:<message_id> - нажатия кнопок под одним сообщением
+    Блокировки берутся в отсортированном порядке, поэтому взаимных блокировок не бывает
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # ключ -> [asyncio.Lock, сколько обновлений его ждут или держат]
+        self._locks = {}
+
+    @staticmethod
+    def update_keys(update: object) -> list:
+        """Ключи, по которым обновление должно ждать своей очереди"""
+        if not isinstance(update, Update):
+            return []
+        keys = []
+        if update.effective_user:
+            keys.append(f"user:{update.effective_user.id}")
+        query = update.callback_query
+        if query and query.message:
+            keys.append(f"message:{query.message.chat_id}:{query.message.message_id}")
+        elif query and query.inline_message_id:
+            keys.append(f"message:inline:{query.inline_message_id}")
+        return sorted(keys)
+
+    def _acquire_entry(self, key: str) -> asyncio.Lock:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_entry(self, key: str):
+        entry = self._locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            # Никто больше не ждет - убираем, чтобы словарь не рос бесконечно
+            del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine):
+        keys = self.update_keys(update)
+        locks = [self._acquire_entry(key) for key in keys]
+        held = []
+        try:
+            for lock in locks:
+                if lock.locked():
+                    metrics.increment('updates.waited')
+                await lock.acquire()
+                held.append(lock)
+            await coroutine
+        finally:
+            for lock in reversed(held):
+                lock.release()
+            for key in keys:
+                self._release_entry(key)
+            metrics.increment('updates.processed')
+
+    async def initialize(self):
+        logger.info(f"Параллельная обработка обновлений: до {self.max_concurrent_updates} одновременно")
+
+    async def shutdown(self):
+        self._locks.clear()